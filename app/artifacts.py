@@ -0,0 +1,205 @@
+# app/artifacts.py
+#
+# codegen の成果物 (generated_transform.py / transformed_data.*) の保存先。
+# 以前は GENERATED_FOLDER 直下の固定パスに書いていたため、同時に2つの codegen が走ると
+# お互いのファイルを上書きしていた。ここでは実行ごとに artifacts/<artifactId>/ を使う。
+#
+# artifactId は「入力ファイル + マッピング + エンジン (+ コード生成プロンプト)」のハッシュ。
+# 同じ入力なら同じディレクトリになるので、完成済みの成果物はそのまま再利用できる。
+# 書き込みは一時ファイルに行い、最後に os.replace でまとめて本来の名前に置き換える。
+# manifest.json は最後に置くので、manifest.json があるディレクトリは「完成済み」とみなせる。
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from typing import Optional
+
+from app.code_cache import mapping_signature, prompt_hash
+
+ARTIFACT_DIR = os.path.join(os.path.dirname(__file__), "generated", "artifacts")
+MANIFEST_NAME = "manifest.json"
+LATEST_NAME = "LATEST"  # 最後に完成した artifactId (旧エンドポイント /api/download/py 等の互換用)
+ARTIFACT_MAX_COUNT = int(os.environ.get("ARTIFACT_MAX_COUNT", "200"))  # これを超えたら古いものから削除
+
+_ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{24}$")
+_latest_lock = threading.Lock()
+_manifest_lock = threading.Lock()  # manifest.json の読み書き (files の追加) を直列にする
+
+def file_fingerprint(file_path: str) -> list:
+    """
+    入力ファイルを識別する値。アップロード時のファイル名は uuid 付きなので、名前 + サイズ + 更新時刻で十分。
+    """
+    st = os.stat(file_path)
+    return [os.path.basename(file_path), st.st_size, st.st_mtime_ns]
+
+def artifact_id_for(file_path: str, mapping: list, engine: str, prompt_text: Optional[str] = None,
+                    options: Optional[dict] = None) -> str:
+    """
+    入力から artifactId (16進24文字) を作る。prompt_text はLLMエンジンのときだけ渡す。
+    options には出力に影響するその他の指定 (変換するシートなど) を渡す。
+    """
+    key = [
+        file_fingerprint(file_path),
+        mapping_signature(mapping),
+        engine,
+        prompt_hash(prompt_text) if prompt_text is not None else None
+    ]
+    if options:
+        key.append(options)
+    payload = json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+def is_valid_artifact_id(artifact_id: str) -> bool:
+    return bool(artifact_id) and bool(_ARTIFACT_ID_RE.match(artifact_id))
+
+def artifact_path(artifact_id: str, name: Optional[str] = None, root: Optional[str] = None) -> str:
+    """
+    成果物ディレクトリ (name を指定した場合はその中のファイル) のパス。
+    artifactId はURLから来るので、形式をチェックしてパストラバーサルを防ぐ。
+    """
+    root = root or ARTIFACT_DIR
+    if not is_valid_artifact_id(artifact_id):
+        raise ValueError(f"Invalid artifact id: {artifact_id}")
+    directory = os.path.join(root, artifact_id)
+    return os.path.join(directory, name) if name else directory
+
+def load_manifest(artifact_id: str, root: Optional[str] = None) -> Optional[dict]:
+    """
+    完成済みの成果物なら manifest を返す。未完成・存在しない・不正なIDの場合は None。
+    """
+    try:
+        with open(artifact_path(artifact_id, MANIFEST_NAME, root), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+def latest_artifact_id(root: Optional[str] = None) -> Optional[str]:
+    root = root or ARTIFACT_DIR
+    try:
+        with open(os.path.join(root, LATEST_NAME), "r", encoding="utf-8") as f:
+            artifact_id = f.read().strip()
+    except OSError:
+        return None
+    return artifact_id if is_valid_artifact_id(artifact_id) else None
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def add_artifact_file(artifact_id: str, name: str, root: Optional[str] = None) -> Optional[dict]:
+    """
+    完成済みの成果物に、後から書き出したファイル (ダウンロード時の形式変換など) を manifest の files に追加する。
+    LATEST は変えない。成果物が無い (削除された) 場合は None。
+    """
+    with _manifest_lock:
+        manifest = load_manifest(artifact_id, root)
+        if manifest is None:
+            return None
+        if name not in manifest.get("files", []):
+            manifest["files"] = sorted(manifest.get("files", []) + [name])
+            _write_atomic(artifact_path(artifact_id, MANIFEST_NAME, root),
+                          json.dumps(manifest, ensure_ascii=False, indent=2))
+        return manifest
+
+def prune_artifacts(max_count: int = ARTIFACT_MAX_COUNT, root: Optional[str] = None) -> int:
+    """
+    完成済みの成果物が max_count を超えていたら、古いもの (manifest の更新時刻順) から削除する。
+    書き込み中 (manifest が無い) のディレクトリには触らない。削除件数を返す。
+    """
+    root = root or ARTIFACT_DIR
+    if not os.path.isdir(root):
+        return 0
+    completed = []
+    for name in os.listdir(root):
+        manifest_path = os.path.join(root, name, MANIFEST_NAME)
+        if is_valid_artifact_id(name) and os.path.exists(manifest_path):
+            completed.append((os.path.getmtime(manifest_path), name))
+    completed.sort()
+    removed = 0
+    for _, name in completed[:max(0, len(completed) - max_count)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        removed += 1
+    return removed
+
+class ArtifactWriter:
+    """
+    1回の codegen 実行で書き出すファイルをまとめて管理する。
+    path(name) が返す一時ファイルに書き込み、commit() で全ファイルを本来の名前に置き換える。
+    commit() せずに終わった場合 (エラー・キャンセル) は一時ファイルを削除する。
+
+        with ArtifactWriter(artifact_id) as artifact:
+            with open(artifact.path("generated_transform.py"), "w") as f: ...
+            artifact.commit({"engine": "llm"})
+    """
+
+    def __init__(self, artifact_id: str, root: Optional[str] = None):
+        self.artifact_id = artifact_id
+        self.root = root or ARTIFACT_DIR
+        self.directory = artifact_path(artifact_id, root=self.root)
+        self._token = uuid.uuid4().hex  # 同じIDの実行が同時に走っても一時ファイルが衝突しないように
+        self._pending = {}  # 本来の名前 -> 一時ファイルのパス
+        self.committed = False
+        os.makedirs(self.directory, exist_ok=True)
+
+    def final_path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def path(self, name: str) -> str:
+        if name not in self._pending:
+            self._pending[name] = os.path.join(self.directory, f".{name}.{self._token}.tmp")
+        return self._pending[name]
+
+    def commit(self, manifest: Optional[dict] = None) -> dict:
+        """
+        書き込んだファイルを本来の名前に置き換え、最後に manifest.json を書く。
+        同じIDの実行が同時に完了した場合はファイル単位で後勝ちになるが、入力が同じなので内容も同じ。
+        """
+        with _manifest_lock:
+            # 以前の実行で書いた別形式のファイルが残っていれば引き継ぐ
+            previous = load_manifest(self.artifact_id, self.root) or {}
+            files = [name for name in previous.get("files", []) if os.path.exists(self.final_path(name))]
+            for name, tmp_path in self._pending.items():
+                if os.path.exists(tmp_path):
+                    os.replace(tmp_path, self.final_path(name))
+                    if name not in files:
+                        files.append(name)
+            self._pending.clear()
+
+            manifest = {
+                **(manifest or {}),
+                "artifactId": self.artifact_id,
+                "files": sorted(files),
+                "createdAt": time.time()
+            }
+            _write_atomic(self.final_path(MANIFEST_NAME), json.dumps(manifest, ensure_ascii=False, indent=2))
+        with _latest_lock:
+            _write_atomic(os.path.join(self.root, LATEST_NAME), self.artifact_id)
+        self.committed = True
+        prune_artifacts(root=self.root)
+        return manifest
+
+    def abort(self) -> None:
+        for tmp_path in self._pending.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._pending.clear()
+        # 何も完成していなければ空のディレクトリも片付ける
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.committed:
+            self.abort()
+        return False
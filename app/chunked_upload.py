@@ -0,0 +1,256 @@
+# app/chunked_upload.py
+#
+# 大きなファイル用の分割アップロード。
+#   1. init      : ファイル名・全体サイズ (・SHA-256) を受け取り uploadId を払い出す
+#   2. chunk     : offset を指定してチャンクを追記する (リクエストボディをそのままディスクへ流す)
+#   3. status    : 途中で切れた場合、ここで現在の offset を確認して続きから再開する
+#   4. finalize  : サイズと SHA-256 を確認して、通常のアップロードと同じ場所に保存する
+# 書き込み途中のファイルは <UPLOAD_FOLDER>/.partial/<uploadId>.part に置き、offset はそのファイルサイズ。
+# 状態はディスクにあるので、サーバーを再起動しても再開できる。
+# 各関数は通常のエンドポイントと同じ形の dict と HTTP ステータスコードを返す。
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+ALLOWED_EXTENSIONS = [".xlsx", ".csv", ".json"]
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))            # クライアントに勧めるチャンクサイズ
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024))   # 1リクエストで受け付ける上限
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 3600))                 # 放置されたセッションを消すまでの秒数
+STREAM_READ_SIZE = 1024 * 1024
+XLSX_MAGIC = b"PK\x03\x04"  # xlsx は zip
+MAGIC_CHECK_SIZE = 4096      # 先頭からこのバイト数までを形式チェックに使う
+
+Result = Tuple[dict, int]
+
+def _error(message: str, http_status: int, **extra) -> Result:
+    return {"status": "error", "message": message, **extra}, http_status
+
+def check_magic(file_name: str, head: bytes) -> Optional[str]:
+    """
+    ファイル先頭のバイト列が拡張子と矛盾していないか。問題があればエラーメッセージを返す。
+    xlsx は zip のシグネチャ、csv/json はテキストなので NUL バイトを含まないことだけを見る。
+    """
+    if file_name.endswith(".xlsx"):
+        if len(head) >= len(XLSX_MAGIC) and not head.startswith(XLSX_MAGIC):
+            return "xlsxファイルではありません (ZIP形式ではありません)。"
+    elif b"\x00" in head and not head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "テキストファイルではありません。"
+    return None
+
+class ChunkedUploadStore:
+    """
+    分割アップロードのセッションを管理する。スレッドセーフ (同じ uploadId への同時書き込みは1つずつ)。
+    """
+
+    def __init__(self, upload_dir: str, max_file_size: int):
+        self.upload_dir = upload_dir
+        self.partial_dir = os.path.join(upload_dir, ".partial")
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self._hashers: Dict[str, Tuple[object, int]] = {}  # uploadId -> (sha256, ハッシュ済みバイト数)
+
+    # --- 内部 ---
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.json")
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id: str) -> Optional[dict]:
+        # uploadId は uuid4 の hex なので、それ以外はパスに使わない
+        if not upload_id or len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+            return None
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _offset(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self._part_path(upload_id))
+        except OSError:
+            return 0
+
+    def _hasher(self, upload_id: str):
+        """
+        途中までのSHA-256。サーバー再起動などでメモリ上の状態が無い・ずれている場合は .part から計算し直す。
+        """
+        offset = self._offset(upload_id)
+        hasher, hashed = self._hashers.get(upload_id, (None, -1))
+        if hasher is None or hashed != offset:
+            hasher = hashlib.sha256()
+            with open(self._part_path(upload_id), "rb") as f:
+                for block in iter(lambda: f.read(STREAM_READ_SIZE), b""):
+                    hasher.update(block)
+            self._hashers[upload_id] = (hasher, offset)
+        return hasher
+
+    def _discard(self, upload_id: str) -> None:
+        for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._session_locks.pop(upload_id, None)
+
+    def _status_body(self, meta: dict, offset: int) -> dict:
+        return {
+            "status": "success",
+            "uploadId": meta["uploadId"],
+            "fileName": meta["fileName"],
+            "offset": offset,
+            "totalSize": meta["totalSize"],
+            "chunkSize": UPLOAD_CHUNK_SIZE
+        }
+
+    def cleanup_expired(self, now: Optional[float] = None) -> int:
+        """
+        UPLOAD_SESSION_TTL 以上放置されたセッションを削除し、削除件数を返す。
+        """
+        now = now or time.time()
+        if not os.path.isdir(self.partial_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.partial_dir):
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-len(".json")]
+            meta = self._load(upload_id)
+            updated = os.path.getmtime(self._part_path(upload_id)) if os.path.exists(self._part_path(upload_id)) else 0
+            if meta is None or now - max(meta.get("createdAt", 0), updated) > UPLOAD_SESSION_TTL:
+                self._discard(upload_id)
+                removed += 1
+        return removed
+
+    # --- API ---
+
+    def init(self, file_name: str, total_size, sha256: Optional[str] = None) -> Result:
+        if not file_name:
+            return _error("ファイル名が指定されていません", 400)
+        file_name = os.path.basename(file_name).lower()
+        if not any(file_name.endswith(ext) for ext in ALLOWED_EXTENSIONS):
+            return _error("サポートされていない拡張子です。xlsx, csv, jsonのみ対応しています。", 400)
+        if not isinstance(total_size, int) or total_size <= 0:
+            return _error("totalSize が不正です", 400)
+        if total_size > self.max_file_size:
+            return _error("ファイルサイズが500MBを超えています。", 400)
+
+        self.cleanup_expired()
+        os.makedirs(self.partial_dir, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "uploadId": upload_id,
+            "fileName": file_name,
+            "totalSize": total_size,
+            "sha256": sha256.lower() if sha256 else None,
+            "createdAt": time.time()
+        }
+        open(self._part_path(upload_id), "wb").close()
+        with open(self._meta_path(upload_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return self._status_body(meta, 0), 201
+
+    def status(self, upload_id: str) -> Result:
+        meta = self._load(upload_id)
+        if meta is None:
+            return _error("アップロードが見つかりません", 404)
+        return self._status_body(meta, self._offset(upload_id)), 200
+
+    def append(self, upload_id: str, offset: int, stream, content_length: Optional[int] = None) -> Result:
+        """
+        stream (request.stream など read() できるもの) の内容を offset の位置に追記する。
+        offset が現在のサイズと違う場合は 409 と現在の offset を返すので、クライアントはそこから送り直す。
+        """
+        meta = self._load(upload_id)
+        if meta is None:
+            return _error("アップロードが見つかりません", 404)
+        if content_length is not None and content_length > UPLOAD_MAX_CHUNK_SIZE:
+            return _error(f"チャンクが大きすぎます (上限 {UPLOAD_MAX_CHUNK_SIZE} バイト)", 413)
+
+        lock = self._session_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            return _error("同じアップロードに対する別のチャンクを書き込み中です", 409, offset=self._offset(upload_id))
+        try:
+            current = self._offset(upload_id)
+            if offset != current:
+                return _error("offset が一致しません", 409, offset=current)
+
+            hasher = self._hasher(upload_id)
+            written = 0
+            with open(self._part_path(upload_id), "ab") as f:
+                while True:
+                    block = stream.read(STREAM_READ_SIZE)
+                    if not block:
+                        break
+                    if current + written + len(block) > meta["totalSize"]:
+                        f.truncate(current + written)
+                        self._hashers.pop(upload_id, None)
+                        return _error("totalSize を超えるデータが送られました", 400, offset=current + written)
+                    if current + written < MAGIC_CHECK_SIZE:
+                        # 先頭部分が届いた時点で形式をチェックし、違うファイルならすぐに打ち切る
+                        f.flush()
+                        with open(self._part_path(upload_id), "rb") as head_file:
+                            head = head_file.read(MAGIC_CHECK_SIZE) + block
+                        magic_error = check_magic(meta["fileName"], head[:MAGIC_CHECK_SIZE])
+                        if magic_error:
+                            self._discard(upload_id)
+                            return _error(magic_error, 400)
+                    f.write(block)
+                    hasher.update(block)
+                    written += len(block)
+            self._hashers[upload_id] = (hasher, current + written)
+        finally:
+            lock.release()
+
+        return self._status_body(meta, current + written), 200
+
+    def finalize(self, upload_id: str, sha256: Optional[str] = None) -> Result:
+        """
+        全体サイズとSHA-256 (init か finalize で指定された場合) を確認し、UPLOAD_FOLDER に保存する。
+        戻り値の savedFileName は /api/upload と同じく /api/analyze などに渡せる。
+        """
+        meta = self._load(upload_id)
+        if meta is None:
+            return _error("アップロードが見つかりません", 404)
+
+        with self._session_lock(upload_id):
+            offset = self._offset(upload_id)
+            if offset != meta["totalSize"]:
+                return _error("まだすべてのチャンクが届いていません", 409, offset=offset)
+
+            digest = self._hasher(upload_id).hexdigest()
+            expected = (sha256 or meta.get("sha256") or "").lower()
+            if expected and expected != digest:
+                self._discard(upload_id)
+                return _error("SHA-256 が一致しません。アップロードをやり直してください。", 400, sha256=digest)
+
+            new_filename = f"{uuid.uuid4()}_{meta['fileName']}"
+            os.replace(self._part_path(upload_id), os.path.join(self.upload_dir, new_filename))
+            self._discard(upload_id)
+
+        return {
+            "status": "success",
+            "message": "ファイルをアップロードしました",
+            "savedFileName": new_filename,
+            "sha256": digest
+        }, 200
+
+    def abort(self, upload_id: str) -> Result:
+        if self._load(upload_id) is None:
+            return _error("アップロードが見つかりません", 404)
+        with self._session_lock(upload_id):
+            self._discard(upload_id)
+        return {"status": "success", "message": "アップロードを中止しました"}, 200
@@ -0,0 +1,139 @@
+# app/code_cache.py
+#
+# LLM (o1-mini) が生成した transform_data コードのキャッシュ。
+# キーは「正規化したマッピングのシグネチャ」+「コード生成プロンプトのハッシュ」。
+# ディスク (generated/code_cache/<プロンプトハッシュ>/<シグネチャ>.py) に保存し、
+# プロセス内ではコンパイル済みのコードオブジェクトをLRUで保持する。
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+CODE_CACHE_DIR = os.path.join(os.path.dirname(__file__), "generated", "code_cache")
+DEFAULT_LRU_SIZE = 64
+
+def _column_index(value) -> int:
+    # 未割り当ての要素は columnIndex が null や数字でない文字列のことがあるので、その場合は -1 とする
+    if isinstance(value, bool):
+        return -1
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+def mapping_signature(mapping: list) -> str:
+    """
+    マッピングを正規化してハッシュ化する。
+    列構成 (columnIndex と columnName) と確定した matchedField だけを使い、
+    confidence や並び順の違いは無視する。columnIndex が整数にならない要素は -1 として扱う。
+    """
+    normalized = sorted(
+        [
+            _column_index(m.get("columnIndex", -1)),
+            str(m.get("columnName") or "").strip(),
+            m.get("matchedField") or ""
+        ]
+        for m in mapping
+    )
+    payload = json.dumps(normalized, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def prompt_hash(prompt_text: str) -> str:
+    return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()[:16]
+
+class CodeCache:
+    """
+    生成コードのディスクキャッシュ + コンパイル済みコードのLRU。
+    スレッドセーフ。
+    """
+
+    def __init__(self, cache_dir: str = CODE_CACHE_DIR, max_entries: int = DEFAULT_LRU_SIZE):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, p_hash: str, signature: str) -> str:
+        return os.path.join(self.cache_dir, p_hash, f"{signature}.py")
+
+    def _remember(self, key: Tuple[str, str], value: Tuple[str, object]) -> None:
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _purge_except(self, p_hash: str) -> int:
+        removed = 0
+        for key in [k for k in self._lru if k[0] != p_hash]:
+            del self._lru[key]
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name != p_hash and os.path.isdir(path):
+                    removed += len(os.listdir(path))
+                    shutil.rmtree(path, ignore_errors=True)
+        return removed
+
+    def get(self, mapping: list, prompt_text: str) -> Optional[Tuple[str, object]]:
+        """
+        キャッシュ済みなら (ソースコード, コンパイル済みコードオブジェクト) を返す。無ければ None。
+        """
+        p_hash = prompt_hash(prompt_text)
+        key = (p_hash, mapping_signature(mapping))
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+
+            path = self._path(*key)
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    source = f.read()
+                code_obj = compile(source, path, "exec")
+            except (OSError, SyntaxError):
+                return None
+            self._remember(key, (source, code_obj))
+            return source, code_obj
+
+    def put(self, mapping: list, prompt_text: str, source: str, code_obj: object = None) -> object:
+        """
+        生成コードを保存する。code_obj を省略した場合はここでコンパイルする。
+        書き込みは一時ファイル + os.replace で行い、途中の状態を読まれないようにする。
+        """
+        p_hash = prompt_hash(prompt_text)
+        key = (p_hash, mapping_signature(mapping))
+        path = self._path(*key)
+        if code_obj is None:
+            code_obj = compile(source, path, "exec")
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(source)
+            os.replace(tmp_path, path)
+            self._remember(key, (source, code_obj))
+        return code_obj
+
+    def invalidate_stale(self, prompt_text: str) -> int:
+        """
+        prompt_text 以外のプロンプトで生成されたエントリを削除し、削除件数を返す。
+        キーにプロンプトのハッシュが含まれるので、別のプロンプトのエントリが残っていても誤って使われることはない。
+        プロンプトごとに使い分けている呼び出し元のキャッシュを消さないよう、get/put では削除しない。
+        """
+        p_hash = prompt_hash(prompt_text)
+        with self._lock:
+            return self._purge_except(p_hash)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+code_cache = CodeCache()
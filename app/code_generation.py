@@ -1,10 +1,14 @@
 # app/code_generation.py
 import os
 import json
+import logging
 import traceback
-from openai import OpenAI
+from app import llm_gateway
+
+logger = logging.getLogger(__name__)
 
 REQUIRED_FIELDS = ["distributorCode", "CustomerName", "AccountNumber"]
+OPTIONAL_FIELDS = ["Rank", "SalesPic", "PartsSalesPic", "ServicePic", "BillingAddress1"]
 
 def generate_and_run_code(mapping_info, row_data, system_prompt_path="system_prompt_code_generation.md", model_name="o1-mini"):
     """
@@ -54,35 +58,41 @@ def generate_and_run_code(mapping_info, row_data, system_prompt_path="system_pro
 
     # --------------------------
     # (4) LLMを呼び出してコード生成
-    openai_api_key = os.getenv("OPENAI_API_KEY", "YOUR_API_KEY")
-    client = OpenAI(api_key=openai_api_key)
-
-    user_prompt = {
-        "mapping": mapping_info,
-        "rowData": row_data
-    }
-
-    try:
-        completion = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "user", "content": system_prompt},
-                {"role": "user", "content": json.dumps(user_prompt, ensure_ascii=False)},
-            ]
-        )
-        generated_code = completion.choices[0].message.content
-        # --- 追加: コードブロックの除去 ---
-        # 先頭・末尾を含め、```python や ``` があったら除去
-        generated_code = generated_code.replace("```python", "")
-        generated_code = generated_code.replace("```", "")
-
-    except Exception as e:
-        # 生成リクエスト時点で何か起きた
-        return {
-            "status": "error",
-            "message": f"コード生成に失敗しました: {str(e)}"
+    #     同じマッピング・同じプロンプトで生成済みのコードがあればLLMを呼ばない
+    from app.code_cache import code_cache
+    cached = code_cache.get(mapping_info, system_prompt)
+    if cached:
+        generated_code, code_obj = cached
+        logger.info("キャッシュ済みの生成コードを使用します。")
+    else:
+        code_obj = None
+        user_prompt = {
+            "mapping": mapping_info,
+            "rowData": row_data
         }
 
+        try:
+            completion = llm_gateway.complete(
+                model=model_name,
+                messages=[
+                    {"role": "user", "content": system_prompt},
+                    {"role": "user", "content": json.dumps(user_prompt, ensure_ascii=False)},
+                ],
+                kind="codegen"
+            )
+            generated_code = completion.choices[0].message.content
+            # --- 追加: コードブロックの除去 ---
+            # 先頭・末尾を含め、```python や ``` があったら除去
+            generated_code = generated_code.replace("```python", "")
+            generated_code = generated_code.replace("```", "")
+
+        except Exception as e:
+            # 生成リクエスト時点で何か起きた
+            return {
+                "status": "error",
+                "message": f"コード生成に失敗しました: {str(e)}"
+            }
+
     # --------------------------
     # (5) 生成されたPythonコードをファイルに保存
     output_file = "generated_transform.py"
@@ -95,32 +105,24 @@ def generate_and_run_code(mapping_info, row_data, system_prompt_path="system_pro
             "message": f"生成コードの書き込みに失敗しました: {str(e)}"
         }
 
-    # ★ デバッグ出力: 生成されたコードの内容をライン番号付きで表示
-    print("\n=== DEBUG: Generated Python code (with line numbers) ===")
-    code_lines = generated_code.split("\n")
-    for i, line in enumerate(code_lines, start=1):
-        print(f"{i:03d}: {line}")
-    print("=== End of Generated Code ===\n")
+    # ★ デバッグ出力: 生成されたコードの内容をライン番号付きで表示 (LOG_LEVEL=DEBUG のときだけ)
+    if logger.isEnabledFor(logging.DEBUG):
+        numbered = "\n".join(f"{i:03d}: {line}" for i, line in enumerate(generated_code.split("\n"), start=1))
+        logger.debug("Generated Python code (with line numbers):\n%s", numbered)
 
     # --------------------------
     # (6) 生成コードを読み込んで transform_data() 関数を呼び出し
     try:
-        global_namespace = {}
-
-        # exec前のデバッグ用 (内容はすでに上でプリント済み)
-        # ここでさらに何か加工やログが必要なら適宜入れる
-
-        exec(generated_code, global_namespace)
-
-        if "transform_data" not in global_namespace:
-            return {
-                "status": "error",
-                "message": "生成されたコードに transform_data 関数が存在しません。"
-            }
+        if code_obj is None:
+            code_obj = compile(generated_code, output_file, "exec")
 
-        transform_func = global_namespace["transform_data"]
+        # 生成コードは常駐ワーカープロセス (app/sandbox_pool.py) で実行する
+        from app.sandbox_pool import make_transform_func
+        transform_func = make_transform_func(generated_code, code_obj)
 
         transformed = transform_func(mapping_info, row_data)
+        if not cached:
+            code_cache.put(mapping_info, system_prompt, generated_code, code_obj)
         return {
             "status": "success",
             "transformedData": transformed
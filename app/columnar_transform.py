@@ -0,0 +1,99 @@
+# app/columnar_transform.py
+#
+# LLMが生成する transform_data (1行ずつdictを作り、セルごとに str() する) の代わりに使える、
+# 列指向の変換エンジン。行データを列配列に読み替え、mapping の columnIndex → matchedField を
+# 列単位の取り出しとして実行する。NumPy があれば列バッファを NumPy 配列で持つ。
+
+from itertools import zip_longest
+from typing import Any, Dict, List, Optional
+
+from app.code_generation import REQUIRED_FIELDS, OPTIONAL_FIELDS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy が無い環境ではリストで同じ処理を行う
+    np = None
+
+OUTPUT_FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+
+def load_columns(row_data: List[list]) -> List[tuple]:
+    """
+    行データを列のタプルのリストに変換する。
+    行ごとに列数が違う場合は足りないセルを None で埋める (zip_longest による一括転置)。
+    """
+    if not row_data:
+        return []
+    return list(zip_longest(*row_data, fillvalue=None))
+
+def _stringify_column(column: tuple, null_value: Optional[str]) -> Any:
+    """
+    1列分をまとめて文字列化する。None は null_value に置き換える。
+    必須項目は None のまま、任意項目は "" にする (app/generated/generated_transform.py と同じ扱い)。
+    """
+    if np is not None:
+        values = np.fromiter(column, dtype=object, count=len(column))
+        is_null = np.equal(values, None)
+        strings = values.astype(str)
+        if not is_null.any():
+            return strings
+        if null_value is None:
+            result = strings.astype(object)
+            result[is_null] = None
+            return result
+        return np.where(is_null, null_value, strings)
+
+    strings = list(map(str, column))
+    return [null_value if value is None else s for value, s in zip(column, strings)]
+
+def _constant_column(value: Optional[str], length: int) -> Any:
+    if np is not None:
+        return np.full(length, value, dtype=object if value is None else str)
+    return [value] * length
+
+def transform_columnar(mapping: list, row_data: List[list], skip_header: bool = True) -> Dict[str, Any]:
+    """
+    mapping に従って row_data を列単位で変換し、列バッファを返す。
+
+    戻り値:
+      {"status": "success", "fields": [...], "rowCount": n, "columns": {field: 列バッファ}}
+    skip_header=True の場合は生成コードと同様に先頭行 (ヘッダー) を除外する。
+    """
+    field_to_index = {m["matchedField"]: m["columnIndex"] for m in mapping if m.get("matchedField")}
+
+    rows = row_data[1:] if skip_header else row_data
+    columns = load_columns(rows)
+    row_count = len(rows)
+
+    result_columns = {}
+    for field in OUTPUT_FIELDS:
+        null_value = None if field in REQUIRED_FIELDS else ""
+        idx = field_to_index.get(field)
+        if idx is None or idx >= len(columns):
+            result_columns[field] = _constant_column(null_value, row_count)
+        else:
+            result_columns[field] = _stringify_column(columns[idx], null_value)
+
+    return {
+        "status": "success",
+        "fields": list(OUTPUT_FIELDS),
+        "rowCount": row_count,
+        "columns": result_columns
+    }
+
+def columns_to_records(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    transform_columnar() の列バッファを既存の list[dict] 形式に変換する。
+    """
+    fields = result["fields"]
+    columns = [
+        col.tolist() if hasattr(col, "tolist") else col
+        for col in (result["columns"][f] for f in fields)
+    ]
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+def transform_data(mapping: list, row_data: List[list]) -> List[Dict[str, Any]]:
+    """
+    生成コードの transform_data(mapping, row_data) と同じ呼び出し形で使える列指向版。
+    run_transform_in_chunks() にそのまま渡せる。
+    """
+    return columns_to_records(transform_columnar(mapping, row_data))
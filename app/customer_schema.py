@@ -0,0 +1,242 @@
+# app/customer_schema.py
+#
+# 顧客マスタの出力レコードを項目ごとに検証・正規化する。
+# 生成コード (LLM) や列指向エンジンが作ったレコードを書き出す直前に通すことで、
+# 空の必須項目が None になるか "None" になるか "" になるかを生成コード任せにしない。
+#
+#   - 正規化: NFKC (全角英数・全角スペースを半角に)、連続する空白を1つに、前後の空白を除去
+#             "" と None (生成コードが str() した "None" を含む) だけを空とみなし、必須項目は None、任意項目は "" にする
+#             "null"・"nan" などはデータの値として残す。"None" という文字列を空にした件数はレポートに載せる
+#   - 検証  : 必須項目の空、最大文字数、形式 (正規表現)、キー (distributorCode + AccountNumber) の重複
+#
+# 1セルごとに Python の関数を呼ばないよう、列ごとに map() と C実装の関数 (unicodedata.normalize、
+# re.Pattern.sub / fullmatch、str.strip、dict.setdefault など) を組み合わせて処理する。
+# チャンク単位で呼び出せるよう、重複チェック用のキー索引と行番号は CustomerSchemaValidator が持ち越す。
+
+import os
+import re
+import unicodedata
+from functools import partial
+from itertools import compress, repeat
+from operator import lt, ne, not_, or_
+from typing import Any, Dict, List, Optional
+
+from app.code_generation import REQUIRED_FIELDS
+
+SCHEMA_VALIDATION_ENABLED = os.environ.get("SCHEMA_VALIDATION_ENABLED", "1") != "0"
+SCHEMA_DROP_INVALID_ROWS = os.environ.get("SCHEMA_DROP_INVALID_ROWS", "0") == "1"  # エラーのある行を出力しない
+SCHEMA_MAX_REPORTED_ERRORS = int(os.environ.get("SCHEMA_MAX_REPORTED_ERRORS", 100))  # レポートに載せるエラーの件数
+SCHEMA_VERSION = 2  # 正規化・検証の内容を変えたら上げる (成果物IDに含める)
+
+_CODE_PATTERN = r"[0-9A-Za-z][0-9A-Za-z_\-./]*"
+
+# 項目ごとの定義。required は REQUIRED_FIELDS に含まれるかどうかで決まる
+CUSTOMER_SCHEMA: Dict[str, Dict[str, Any]] = {
+    "distributorCode": {"maxLength": 20, "pattern": _CODE_PATTERN},
+    "CustomerName": {"maxLength": 200},
+    "AccountNumber": {"maxLength": 30, "pattern": _CODE_PATTERN},
+    "Rank": {"maxLength": 10},
+    "SalesPic": {"maxLength": 100},
+    "PartsSalesPic": {"maxLength": 100},
+    "ServicePic": {"maxLength": 100},
+    "BillingAddress1": {"maxLength": 300},
+}
+DUPLICATE_KEY_FIELDS = ("distributorCode", "AccountNumber")
+# 空とみなす値 (正規化後)。"None" は None を str() したもの。元の値が文字列の "None" だった場合と区別できないので、
+# その件数は nullStringCounts としてレポートする
+NULL_MARKERS = frozenset(["", "None"])
+
+_KEY_SEPARATOR = "\x1f"
+_CELL_SEPARATOR = "\x00"  # NFKC で変化せず、空白にも該当しない文字
+_SPACES = re.compile(r"\s+")
+# NFKC の後に残りうる「1つの半角スペース以外の空白」。これらが無ければ正規表現の置換を省略できる
+_SPACE_RUNS = ("  ", "\t", "\n", "\r", "\x0b", "\x0c", "\x85", "\u2028", "\u2029")
+_normalize_nfkc = partial(unicodedata.normalize, "NFKC")
+_collapse_spaces = partial(_SPACES.sub, " ")
+
+def normalize_column(values) -> List[str]:
+    """
+    1列分の値を文字列にして正規化する (None は "None" になり、後で空として扱われる)。
+    列全体を1つの文字列につなげてから NFKC・空白の置換を1回ずつ行い、分割し直す。
+    すでに正規化済み・空白なしの列 (大半の列) はチェックだけで済む。
+    """
+    strings = list(map(str, values))
+    text = _CELL_SEPARATOR.join(strings)
+    if text.count(_CELL_SEPARATOR) != max(0, len(strings) - 1):
+        # 値の中に区切り文字が含まれている場合はセルごとに処理する
+        return list(map(str.strip, map(_collapse_spaces, map(_normalize_nfkc, strings))))
+    if not unicodedata.is_normalized("NFKC", text):
+        text = unicodedata.normalize("NFKC", text)
+    elif not any(run in text for run in _SPACE_RUNS):
+        return list(map(str.strip, strings))
+    if any(run in text for run in _SPACE_RUNS):
+        text = _SPACES.sub(" ", text)
+    return list(map(str.strip, text.split(_CELL_SEPARATOR)))
+
+class CustomerSchemaValidator:
+    """
+    レコード (dict) のチャンクを順に受け取り、正規化したレコードを返しつつエラーを集計する。
+
+        validator = CustomerSchemaValidator()
+        for records in chunks:
+            writer.write_records(validator.validate(records))
+        validator.report()
+    """
+
+    def __init__(self, schema: Optional[Dict[str, Dict[str, Any]]] = None,
+                 required_fields: Optional[List[str]] = None,
+                 key_fields: Optional[tuple] = DUPLICATE_KEY_FIELDS,
+                 drop_invalid_rows: bool = SCHEMA_DROP_INVALID_ROWS,
+                 max_reported_errors: int = SCHEMA_MAX_REPORTED_ERRORS):
+        self.schema = schema or CUSTOMER_SCHEMA
+        self.required_fields = set(REQUIRED_FIELDS if required_fields is None else required_fields)
+        self.key_fields = tuple(key_fields or ())
+        self.drop_invalid_rows = drop_invalid_rows
+        self.max_reported_errors = max_reported_errors
+        self._patterns = {
+            field: re.compile(spec["pattern"]) for field, spec in self.schema.items() if spec.get("pattern")
+        }
+        # 列全体 (セルを区切り文字でつないだ文字列) を1回の照合でチェックするためのパターン
+        self._column_patterns = {
+            field: re.compile(f"(?:{p.pattern})(?:{_CELL_SEPARATOR}(?:{p.pattern}))*")
+            for field, p in self._patterns.items()
+        }
+        self._key_index: Dict[str, int] = {}  # キー -> 最初に出現した行番号
+        self.row_count = 0
+        self.dropped_rows = 0
+        self.error_count = 0
+        self.error_counts: Dict[str, Dict[str, int]] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.null_string_counts: Dict[str, int] = {}  # 項目 -> 空として扱った文字列 "None" の件数
+        self._invalid_rows = set()
+
+    def _add_errors(self, field: str, code: str, positions, value_of, offset: int,
+                    first_rows: Optional[List[int]] = None) -> None:
+        """
+        positions (チャンク内の位置) のエラーを数える。value_of(位置) はレポートに載せる値。
+        """
+        positions = list(positions)
+        if not positions:
+            return
+        counts = self.error_counts.setdefault(field, {})
+        counts[code] = counts.get(code, 0) + len(positions)
+        self.error_count += len(positions)
+        self._invalid_rows.update(p + offset for p in positions)
+        for p in positions[:max(0, self.max_reported_errors - len(self.errors))]:
+            error = {"row": offset + p, "field": field, "code": code, "value": value_of(p)}
+            if first_rows is not None:
+                error["firstRow"] = first_rows[p]
+            self.errors.append(error)
+
+    def _check_column(self, field: str, column: List[str], is_null: Optional[List[bool]], offset: int) -> None:
+        """
+        is_null が None の列は空のセルが無い。
+        各チェックはまず列全体で1回だけ判定し (最大文字数、列をつなげた文字列への正規表現)、
+        違反があるときだけ位置を求める。
+        """
+        spec = self.schema[field]
+        n = len(column)
+        if field in self.required_fields and is_null is not None:
+            self._add_errors(field, "required", compress(range(n), is_null), column.__getitem__, offset)
+        max_length = spec.get("maxLength")
+        if max_length and max(map(len, column)) > max_length:
+            self._add_errors(field, "maxLength", compress(range(n), map(lt, repeat(max_length), map(len, column))),
+                             column.__getitem__, offset)
+        pattern = self._patterns.get(field)
+        if pattern is not None:
+            if is_null is None and self._column_patterns[field].fullmatch(_CELL_SEPARATOR.join(column)):
+                return
+            # 空のセルは形式チェックの対象外 (必須かどうかは上でチェック済み)
+            matched = map(bool, map(pattern.fullmatch, column))
+            ok = matched if is_null is None else map(or_, is_null, matched)
+            self._add_errors(field, "pattern", compress(range(n), map(not_, ok)), column.__getitem__, offset)
+
+    def _check_duplicates(self, columns: Dict[str, List[str]], nulls: Dict[str, Optional[List[bool]]],
+                          offset: int) -> None:
+        if not self.key_fields or any(f not in columns for f in self.key_fields):
+            return
+        n = len(columns[self.key_fields[0]])
+        keys = list(map(_KEY_SEPARATOR.join, zip(*(columns[f] for f in self.key_fields))))
+        rows = range(offset, offset + n)
+        first_rows = list(map(self._key_index.setdefault, keys, rows))
+        duplicates = list(compress(range(n), map(ne, first_rows, rows)))
+        null_lists = [nulls[f] for f in self.key_fields if nulls[f] is not None]
+        if duplicates and null_lists:
+            # キーの一部が空の行は必須項目のエラーとして報告済みなので、重複としては数えない
+            key_null = list(map(any, zip(*null_lists)))
+            duplicates = [p for p in duplicates if not key_null[p]]
+        if duplicates:
+            field = "+".join(self.key_fields)
+            self._add_errors(field, "duplicate", duplicates, lambda p: keys[p].split(_KEY_SEPARATOR), offset, first_rows)
+
+    def validate(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        1チャンク分のレコードを検証・正規化して返す。
+        レコードの dict は書き換える (値が変わったセルだけを書き戻すので、ほとんどの列では書き込みが発生しない)。
+        """
+        if not records:
+            return records
+        offset = self.row_count
+        n = len(records)
+        self.row_count += n
+
+        columns: Dict[str, List[str]] = {}
+        nulls: Dict[str, Optional[List[bool]]] = {}
+        updates = []
+        for field in self.schema:
+            original = list(map(dict.get, records, repeat(field)))
+            column = normalize_column(original)
+            is_null = None if NULL_MARKERS.isdisjoint(column) else list(map(NULL_MARKERS.__contains__, column))
+            if is_null is not None:
+                null_strings = column.count("None") - original.count(None)
+                if null_strings:
+                    self.null_string_counts[field] = self.null_string_counts.get(field, 0) + null_strings
+            self._check_column(field, column, is_null, offset)
+            columns[field] = column
+            nulls[field] = is_null
+            updates.append((field, original, column, is_null))
+        self._check_duplicates(columns, nulls, offset)
+
+        # 空のセルは必須項目は None、任意項目は "" にそろえ、値が変わったセルだけをレコードに書き戻す
+        for field, original, column, is_null in updates:
+            null_value = None if field in self.required_fields else ""
+            if is_null is not None:
+                for p in compress(range(n), is_null):
+                    column[p] = null_value
+            for p in compress(range(n), map(ne, original, column)):
+                records[p][field] = column[p]
+            if original[0] is None and field not in records[0]:
+                # 項目自体が無いレコード (上のループでは None == None で書き戻されない)
+                for record in records:
+                    record.setdefault(field, null_value)
+
+        if self.drop_invalid_rows and self._invalid_rows:
+            kept = [r for i, r in enumerate(records, start=offset) if i not in self._invalid_rows]
+            self.dropped_rows += n - len(kept)
+            return kept
+        return records
+
+    def report(self) -> Dict[str, Any]:
+        """
+        検証結果のまとめ。errors は先頭 max_reported_errors 件まで (行番号はヘッダーを除いた0始まり)。
+        """
+        return {
+            "schemaVersion": SCHEMA_VERSION,
+            "rowCount": self.row_count,
+            "validRowCount": self.row_count - len(self._invalid_rows),
+            "invalidRowCount": len(self._invalid_rows),
+            "droppedRowCount": self.dropped_rows,
+            "errorCount": self.error_count,
+            "errorCounts": self.error_counts,
+            "errors": self.errors,
+            "errorsTruncated": self.error_count > len(self.errors),
+            "nullStringCounts": self.null_string_counts
+        }
+
+def validate_records(records: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    """
+    全レコードを1回で検証する。{"status": "success", "records": [...], "validation": report} を返す。
+    """
+    validator = CustomerSchemaValidator(**kwargs)
+    normalized = validator.validate(records)
+    return {"status": "success", "records": normalized, "validation": validator.report()}
@@ -1,20 +1,35 @@
 # app/file_to_json.py
 
 import os
+import csv
+import json
 from openpyxl import load_workbook
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional
 
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
 DEFAULT_MAX_ROWS = 100  # デフォルトは100行
+DEFAULT_CHUNK_SIZE = 5000  # 全行変換時に一度にメモリへ載せる行数
+ENCODING_SAMPLE_SIZE = 64 * 1024  # 文字コード判定に読む先頭バイト数
+JSON_READ_SIZE = 64 * 1024  # JSONを逐次パースする際の読み込み単位
+JSON_ROW_KEYS = ("rowData", "rows", "data", "records")  # トップレベルがオブジェクトの場合に行配列とみなすキー
+XLSX_READER_BACKEND = os.environ.get("XLSX_READER_BACKEND", "openpyxl")  # "openpyxl" / "fast" (app/xlsx_fast_reader.py)
 
-def convert_xlsx_to_json(file_path: str, limit_rows: bool = True) -> Dict[str, Any]:
+def open_xlsx_workbook(file_path: str):
     """
-    大きなXLSXファイルが来ても、先頭MAX_ROWS行のみを読み込み、
-    それをrowDataとしてJSON形式のdictにまとめて返す。
-    
-    ヘッダー判定は実施せず、生データを返すことに特化。
+    XLSX_READER_BACKEND に応じて読み込み専用のワークブックを開く。
+    どちらも sheetnames / wb[name].iter_rows(values_only=True) / close() を持つ。
     """
+    if XLSX_READER_BACKEND == "fast":
+        from app.xlsx_fast_reader import open_workbook
+        return open_workbook(file_path)
+    return load_workbook(filename=file_path, read_only=True)
 
+def _open_single_sheet(file_path: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    拡張子・サイズ・シート数をチェックし、read_onlyでワークブックを開く。
+    成功時は {"status": "success", "workbook": wb, "worksheet": ws} を返す。
+    sheet_name を指定した場合はそのシートを開く (複数シートのブックでも可)。
+    """
     if not file_path.lower().endswith('.xlsx'):
         return {
             "status": "error",
@@ -28,7 +43,7 @@ def convert_xlsx_to_json(file_path: str, limit_rows: bool = True) -> Dict[str, A
         }
 
     try:
-        wb = load_workbook(filename=file_path, read_only=True)
+        wb = open_xlsx_workbook(file_path)
     except Exception as e:
         return {
             "status": "error",
@@ -36,24 +51,385 @@ def convert_xlsx_to_json(file_path: str, limit_rows: bool = True) -> Dict[str, A
         }
 
     sheetnames = wb.sheetnames
+    if sheet_name is not None:
+        if sheet_name not in sheetnames:
+            wb.close()
+            return {
+                "status": "error",
+                "message": f"シートが見つかりません: {sheet_name}"
+            }
+        return {
+            "status": "success",
+            "workbook": wb,
+            "worksheet": wb[sheet_name]
+        }
+
     if len(sheetnames) != 1:
+        wb.close()
         return {
             "status": "error",
             "message": f"シート数が1つではありません。シート数: {len(sheetnames)}"
         }
 
-    ws = wb[sheetnames[0]]
+    return {
+        "status": "success",
+        "workbook": wb,
+        "worksheet": wb[sheetnames[0]]
+    }
+
+def convert_xlsx_to_json(file_path: str, limit_rows: bool = True, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    大きなXLSXファイルが来ても、先頭MAX_ROWS行のみを読み込み、
+    それをrowDataとしてJSON形式のdictにまとめて返す。
+    
+    ヘッダー判定は実施せず、生データを返すことに特化。
+    limit_rows=False は全行をリストに載せるため、大きなファイルでは
+    open_xlsx_row_stream() を使うこと。
+    複数シートのブックは sheet_name でシートを指定する (app/multi_sheet.py も参照)。
+    """
+    opened = _open_single_sheet(file_path, sheet_name)
+    if opened["status"] != "success":
+        return opened
+
+    wb = opened["workbook"]
+    ws = opened["worksheet"]
 
     rowData = []
     count = 0
-    for row in ws.iter_rows(values_only=True):
-        rowData.append(list(row))
-        count += 1
-        if limit_rows and count >= DEFAULT_MAX_ROWS:
-            break
+    try:
+        for row in ws.iter_rows(values_only=True):
+            rowData.append(list(row))
+            count += 1
+            if limit_rows and count >= DEFAULT_MAX_ROWS:
+                break
+    finally:
+        wb.close()
 
     return {
         "status": "success",
         "fileType": "xlsx",
         "rowData": rowData
-    }
\ No newline at end of file
+    }
+
+def _iter_chunks(wb, ws, chunk_size: int) -> Iterator[List[list]]:
+    """
+    ws.iter_rows を chunk_size 行ずつのリストにまとめて返すジェネレータ。
+    最後まで読み終えるか、途中で閉じられた時点でワークブックを閉じる。
+    """
+    try:
+        chunk = []
+        for row in ws.iter_rows(values_only=True):
+            chunk.append(list(row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        wb.close()
+
+def open_xlsx_row_stream(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    全行変換用のストリーミングAPI。
+    チェック(拡張子・サイズ・シート数・破損)は呼び出し時点で行い、
+    成功時は {"status": "success", "fileType": "xlsx", "rowChunks": <generator>} を返す。
+
+    rowChunks は chunk_size 行ずつの list[list] を順に返すので、
+    ピークメモリはファイルサイズではなく chunk_size に比例する。
+    """
+    if chunk_size <= 0:
+        return {
+            "status": "error",
+            "message": f"chunk_size は1以上を指定してください: {chunk_size}"
+        }
+
+    opened = _open_single_sheet(file_path, sheet_name)
+    if opened["status"] != "success":
+        return opened
+
+    return {
+        "status": "success",
+        "fileType": "xlsx",
+        "rowChunks": _iter_chunks(opened["workbook"], opened["worksheet"], chunk_size)
+    }
+
+def iter_xlsx_rows(file_path: str) -> Iterator[list]:
+    """
+    1行ずつ返すジェネレータ版。ファイルに問題がある場合は ValueError を送出する。
+    """
+    stream = open_xlsx_row_stream(file_path)
+    if stream["status"] != "success":
+        raise ValueError(stream["message"])
+    for chunk in stream["rowChunks"]:
+        yield from chunk
+
+
+# ---------------------------------------------------------------------------
+# CSV / JSON
+# ---------------------------------------------------------------------------
+
+def detect_encoding(file_path: str, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+    """
+    先頭 sample_size バイトだけを見て文字コードを判定する。
+    BOM → UTF-8 → cp932 (Shift_JIS の上位互換) の順に試す。
+    """
+    with open(file_path, "rb") as f:
+        sample = f.read(sample_size)
+
+    if sample.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    if sample.startswith(b"\xff\xfe") or sample.startswith(b"\xfe\xff"):
+        return "utf-16"
+
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # サンプル末尾でマルチバイト文字が切れているだけなら UTF-8 とみなす
+        if e.reason == "unexpected end of data" and e.start >= len(sample) - 3:
+            return "utf-8"
+
+    try:
+        sample.decode("cp932")
+        return "cp932"
+    except UnicodeDecodeError as e:
+        if e.start >= len(sample) - 1:
+            return "cp932"
+
+    # どちらでもない場合は読み込み自体は失敗させない
+    return "latin-1"
+
+def _iter_csv_rows(file_path: str, encoding: str) -> Iterator[list]:
+    """
+    CSVを1行ずつ返す。空セルはXLSXの空セルに合わせて None にする。
+    """
+    with open(file_path, "r", encoding=encoding, newline="") as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",\t;|")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.reader(f, dialect):
+            yield [value if value != "" else None for value in row]
+
+class _JsonStreamReader:
+    """
+    大きなJSON配列を要素単位で読み進めるための簡易パーサ。
+    バッファに収まる範囲で json.JSONDecoder.raw_decode を繰り返す。
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: int = JSON_READ_SIZE) -> bool:
+        if self._eof:
+            return False
+        data = self._f.read(size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        actual = self.peek()
+        if actual != ch:
+            raise ValueError(f"JSONの形式が不正です: '{ch}' を期待しましたが '{actual or 'EOF'}' でした")
+        self._pos += 1
+
+    def decode_value(self) -> Any:
+        self.peek()
+        read_size = JSON_READ_SIZE
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # 数値などがバッファ末尾で切れている可能性があるので、後続が読めるまで確定しない
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            if not self._fill(read_size):
+                continue
+            read_size *= 2
+
+    def iter_array(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+    def iter_object_rows(self) -> Iterator[Any]:
+        """
+        トップレベルがオブジェクトの場合、JSON_ROW_KEYS のいずれかのキーの配列を行として返す。
+        """
+        self.expect("{")
+        while self.peek() not in ("}", ""):
+            key = self.decode_value()
+            self.expect(":")
+            if key in JSON_ROW_KEYS and self.peek() == "[":
+                yield from self.iter_array()
+                return
+            self.decode_value()
+            if self.peek() == ",":
+                self._pos += 1
+        raise ValueError(f"行データの配列が見つかりません (対応キー: {', '.join(JSON_ROW_KEYS)})")
+
+def iter_json_items(f) -> Iterator[Any]:
+    """
+    テキストストリーム f のトップレベルJSON配列を要素ごとに返す。
+    """
+    return _JsonStreamReader(f).iter_array()
+
+def _iter_json_rows(file_path: str, encoding: str) -> Iterator[list]:
+    """
+    JSONを1行ずつ返す。
+    要素が配列ならそのまま1行、オブジェクトなら最初のオブジェクトのキーをヘッダー行として出し、
+    以降は同じキー順で値を並べる。
+    """
+    with open(file_path, "r", encoding=encoding) as f:
+        reader = _JsonStreamReader(f)
+        first = reader.peek()
+        if first == "[":
+            items = reader.iter_array()
+        elif first == "{":
+            items = reader.iter_object_rows()
+        else:
+            raise ValueError("JSONのトップレベルは配列またはオブジェクトである必要があります")
+
+        keys: Optional[list] = None
+        for item in items:
+            if isinstance(item, dict):
+                if keys is None:
+                    keys = list(item.keys())
+                    yield list(keys)
+                yield [item.get(k) for k in keys]
+            elif isinstance(item, list):
+                yield item
+            else:
+                yield [item]
+
+def _iter_text_rows(file_path: str, file_type: str, encoding: str) -> Iterator[list]:
+    if file_type == "csv":
+        return _iter_csv_rows(file_path, encoding)
+    return _iter_json_rows(file_path, encoding)
+
+def _file_type_of(file_path: str) -> str:
+    return os.path.splitext(file_path)[1].lower().lstrip(".")
+
+def _check_text_file(file_path: str) -> Dict[str, Any]:
+    if os.path.getsize(file_path) > MAX_FILE_SIZE:
+        return {
+            "status": "error",
+            "message": "ファイルサイズが500MBを超えています。"
+        }
+    try:
+        encoding = detect_encoding(file_path)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"ファイルが破損しているか、読み込めません: {str(e)}"
+        }
+    return {"status": "success", "encoding": encoding}
+
+def _chunk_rows(rows: Iterator[list], chunk_size: int) -> Iterator[List[list]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def convert_file_to_json(file_path: str, limit_rows: bool = True) -> Dict[str, Any]:
+    """
+    拡張子 (.xlsx / .csv / .json) に応じて読み込み方法を切り替え、
+    convert_xlsx_to_json と同じ形式 ({"status", "fileType", "rowData"}) で返す。
+    CSV/JSONはストリームで読み、limit_rows=True の場合は先頭100行で打ち切る。
+    """
+    file_type = _file_type_of(file_path)
+    if file_type == "xlsx":
+        return convert_xlsx_to_json(file_path, limit_rows=limit_rows)
+    if file_type not in ("csv", "json"):
+        return {
+            "status": "error",
+            "message": f"サポートされていない拡張子です (xlsx, csv, jsonのみ対応): {file_path}"
+        }
+
+    checked = _check_text_file(file_path)
+    if checked["status"] != "success":
+        return checked
+
+    rowData = []
+    try:
+        for row in _iter_text_rows(file_path, file_type, checked["encoding"]):
+            rowData.append(row)
+            if limit_rows and len(rowData) >= DEFAULT_MAX_ROWS:
+                break
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"ファイルが破損しているか、読み込めません: {str(e)}"
+        }
+
+    return {
+        "status": "success",
+        "fileType": file_type,
+        "encoding": checked["encoding"],
+        "rowData": rowData
+    }
+
+def open_row_stream(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    open_xlsx_row_stream の拡張子共通版。
+    CSV/JSONも同じ {"status", "fileType", "rowChunks"} の形で全行ストリームを返す。
+    """
+    file_type = _file_type_of(file_path)
+    if file_type == "xlsx":
+        return open_xlsx_row_stream(file_path, chunk_size=chunk_size)
+    if file_type not in ("csv", "json"):
+        return {
+            "status": "error",
+            "message": f"サポートされていない拡張子です (xlsx, csv, jsonのみ対応): {file_path}"
+        }
+    if chunk_size <= 0:
+        return {
+            "status": "error",
+            "message": f"chunk_size は1以上を指定してください: {chunk_size}"
+        }
+
+    checked = _check_text_file(file_path)
+    if checked["status"] != "success":
+        return checked
+
+    rows = _iter_text_rows(file_path, file_type, checked["encoding"])
+    return {
+        "status": "success",
+        "fileType": file_type,
+        "encoding": checked["encoding"],
+        "rowChunks": _chunk_rows(rows, chunk_size)
+    }
@@ -0,0 +1,139 @@
+# app/header_detector.py
+#
+# 100行プレビューからヘッダー行をローカルで推定する統計的な判定器。
+# 行ごとにセルの種類 (文字列・数値・日付・コード) や文字列長、値の重複を調べ、
+# LLM (call_header_detection) と同じ形式で isHeaderPresent / headerRowIndex と確信度を返す。
+
+import re
+import datetime
+from typing import Any, Dict, List
+
+MAX_HEADER_CANDIDATES = 10  # ヘッダー候補として調べる先頭行数
+HEADER_SCORE_THRESHOLD = 0.5  # これ未満のスコアしか無ければ「ヘッダー無し」と判定
+
+_NUMBER_RE = re.compile(r"^[+\-]?[\d,]+(\.\d+)?%?$")
+_DATE_RE = re.compile(r"^\d{2,4}[-/.年]\d{1,2}[-/.月]\d{1,2}日?")
+_CODE_RE = re.compile(r"^[A-Za-z0-9\-_/.#]+$")
+
+def cell_kind(value: Any) -> str:
+    """
+    セルの種類を "empty" / "bool" / "number" / "date" / "code" / "text" のいずれかに分類する。
+    "code" は "D001" や "AC-123" のような数字を含む英数字の値。
+    """
+    if value is None:
+        return "empty"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return "date"
+    text = str(value).strip()
+    if not text:
+        return "empty"
+    if _NUMBER_RE.match(text):
+        return "number"
+    if _DATE_RE.match(text):
+        return "date"
+    if _CODE_RE.match(text) and any(ch.isdigit() for ch in text):
+        return "code"
+    return "text"
+
+def _column_profiles(rowData: List[list], width: int) -> List[Dict[str, Any]]:
+    """
+    列ごとに、各行のセル種類と値を持っておく (候補行より下の行の集計に使う)。
+    """
+    profiles = []
+    for j in range(width):
+        values = [row[j] if j < len(row) else None for row in rowData]
+        profiles.append({
+            "kinds": [cell_kind(v) for v in values],
+            "values": [None if v is None else str(v).strip() for v in values]
+        })
+    return profiles
+
+def _score_row(i: int, rowData: List[list], profiles: List[Dict[str, Any]], width: int) -> float:
+    row = rowData[i]
+    cells = [(j, profiles[j]["values"][i]) for j in range(len(row)) if profiles[j]["kinds"][i] != "empty"]
+    if not cells or (len(cells) < 2 and width >= 2):
+        return 0.0
+
+    kinds = [profiles[j]["kinds"][i] for j, _ in cells]
+    text_ratio = kinds.count("text") / len(cells)
+    unique_ratio = len(set(v for _, v in cells)) / len(cells)
+    fill_ratio = len(cells) / width
+
+    contrasts = []
+    repeats = 0
+    for j, value in cells:
+        below_kinds = [k for k in profiles[j]["kinds"][i + 1:] if k != "empty"]
+        below_values = profiles[j]["values"][i + 1:]
+        if value in below_values:
+            repeats += 1
+        if not below_kinds:
+            continue
+        if profiles[j]["kinds"][i] != "text":
+            contrasts.append(0.0)
+            continue
+        non_text_share = 1 - below_kinds.count("text") / len(below_kinds)
+        if non_text_share >= 0.5:
+            # 見出しが文字列で、その下が数値・日付・コード中心の列
+            contrasts.append(1.0)
+        elif len(set(v for v in below_values if v)) > 1:
+            # 文字列どうしでも、下の行に同じ値が無ければ多少は見出しらしい
+            contrasts.append(0.5)
+        else:
+            contrasts.append(0.0)
+
+    contrast = sum(contrasts) / len(contrasts) if contrasts else 0.0
+    repeat_ratio = repeats / len(cells)
+    return text_ratio * (0.6 * contrast + 0.2 * unique_ratio + 0.2 * fill_ratio) * (1 - repeat_ratio)
+
+def detect_header(rowData: List[list]) -> Dict[str, Any]:
+    """
+    call_header_detection() と同じ形式でヘッダー判定結果を返す。
+    headerDetection には confidence (0〜1) を追加し、source は "local" とする。
+    ヘッダー無しと判定した場合も、最もヘッダーらしかった行を bestCandidateIndex として返す。
+    """
+    width = max((len(row) for row in rowData), default=0)
+    if not rowData or width == 0:
+        return {
+            "status": "success",
+            "source": "local",
+            "headerDetection": {
+                "isHeaderPresent": False,
+                "headerRowIndex": -1,
+                "confidence": 0.0,
+                "reason": "データが空のため判定できません"
+            }
+        }
+
+    profiles = _column_profiles(rowData, width)
+    candidates = range(min(MAX_HEADER_CANDIDATES, len(rowData)))
+    scores = {i: _score_row(i, rowData, profiles, width) for i in candidates}
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+    best_index, best_score = ranked[0]
+    second_score = ranked[1][1] if len(ranked) > 1 else 0.0
+
+    if best_score >= HEADER_SCORE_THRESHOLD:
+        margin = min(1.0, max(0.0, (best_score - second_score) / 0.4))
+        detection = {
+            "isHeaderPresent": True,
+            "headerRowIndex": best_index,
+            "confidence": round(best_score * margin, 3),
+            "reason": f"{best_index}行目が文字列中心で、下の行と値の種類が異なるため (score={best_score:.2f}, 次点={second_score:.2f})"
+        }
+    else:
+        detection = {
+            "isHeaderPresent": False,
+            "headerRowIndex": -1,
+            "confidence": round(1.0 - best_score, 3),
+            "reason": f"見出しらしい行が見つからないため (最大score={best_score:.2f})"
+        }
+
+    return {
+        "status": "success",
+        "source": "local",
+        "bestCandidateIndex": best_index if best_score >= HEADER_SCORE_THRESHOLD else -1,
+        "headerDetection": detection
+    }
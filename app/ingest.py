@@ -0,0 +1,274 @@
+# app/ingest.py
+#
+# アップロード直後に1回だけ実行する取り込み処理。
+# ファイルを先頭から最後まで1回ストリームで読み、
+#   - シート一覧 (xlsx。複数シートならシートごとに別プロセスで読み、以下をシートごとに作る)
+#   - 先頭100行のプレビュー (convert_file_to_json と同じ rowData)
+#   - 行数・列数
+#   - 列ごとの簡単な統計 (空でないセル数、値の種類、最大文字数、ユニーク数)
+# を <アップロードファイル>.meta.json に保存する。
+# /api/analyze (process_file_and_map) はこのサイドカーを読むので、ワークブックを開き直さない。
+
+import os
+import json
+import time
+import uuid
+import datetime
+from typing import Any, Dict, List, Optional
+
+from app.file_to_json import (
+    DEFAULT_MAX_ROWS, convert_file_to_json, convert_xlsx_to_json, open_row_stream, open_xlsx_row_stream, open_xlsx_workbook
+)
+from app.header_detector import cell_kind
+from app.multi_sheet import convert_sheets_to_json, map_sheets
+from app import metrics
+
+SIDECAR_SUFFIX = ".meta.json"
+SIDECAR_VERSION = 2
+STATS_DISTINCT_LIMIT = 1000  # ユニーク数はここまで数える
+STATS_SAMPLE_VALUES = 5
+
+def sidecar_path(file_path: str) -> str:
+    return file_path + SIDECAR_SUFFIX
+
+# --- 日付などを型を保ったままJSONに保存する ---
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$time": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"$timedelta": value.total_seconds()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+def _decode_value(obj: dict) -> Any:
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key == "$datetime":
+            return datetime.datetime.fromisoformat(value)
+        if key == "$date":
+            return datetime.date.fromisoformat(value)
+        if key == "$time":
+            return datetime.time.fromisoformat(value)
+        if key == "$timedelta":
+            return datetime.timedelta(seconds=value)
+    return obj
+
+# --- 列の統計 ---
+
+class _ColumnStats:
+    def __init__(self):
+        self.non_empty = 0
+        self.kinds: Dict[str, int] = {}
+        self.max_length = 0
+        self.distinct = set()
+        self.distinct_capped = False
+        self.samples: List[str] = []
+
+    def add(self, value: Any) -> None:
+        kind = cell_kind(value)
+        if kind == "empty":
+            return
+        self.non_empty += 1
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+        text = str(value)
+        self.max_length = max(self.max_length, len(text))
+        if not self.distinct_capped and text not in self.distinct:
+            self.distinct.add(text)
+            if len(self.samples) < STATS_SAMPLE_VALUES:
+                self.samples.append(text)
+            if len(self.distinct) >= STATS_DISTINCT_LIMIT:
+                self.distinct_capped = True
+
+    def to_dict(self, index: int) -> Dict[str, Any]:
+        return {
+            "columnIndex": index,
+            "nonEmpty": self.non_empty,
+            "kinds": self.kinds,
+            "maxLength": self.max_length,
+            "distinct": len(self.distinct),
+            "distinctCapped": self.distinct_capped,  # True なら distinct は下限値
+            "sampleValues": self.samples
+        }
+
+def _file_stamp(file_path: str) -> Dict[str, int]:
+    st = os.stat(file_path)
+    return {"fileSize": st.st_size, "mtimeNs": st.st_mtime_ns}
+
+def _list_sheets(file_path: str) -> Optional[List[str]]:
+    if not file_path.lower().endswith(".xlsx"):
+        return None
+    try:
+        wb = open_xlsx_workbook(file_path)
+    except Exception:
+        return None  # 壊れたファイルのエラーは open_row_stream 側で返す
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+def _write_sidecar(file_path: str, meta: dict) -> None:
+    path = sidecar_path(file_path)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, default=_encode_value)
+    os.replace(tmp_path, path)
+
+def _scan_rows(stream: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    行ストリームを最後まで読み、プレビュー・行数・列の統計を返す。
+    """
+    preview: List[list] = []
+    stats: List[_ColumnStats] = []
+    row_count = 0
+    try:
+        for chunk in stream["rowChunks"]:
+            for row in chunk:
+                if len(preview) < DEFAULT_MAX_ROWS:
+                    preview.append(row)
+                while len(stats) < len(row):
+                    stats.append(_ColumnStats())
+                for i, value in enumerate(row):
+                    stats[i].add(value)
+                row_count += 1
+    except Exception as e:
+        return {"status": "error", "message": f"ファイルが破損しているか、読み込めません: {str(e)}"}
+    return {
+        "status": "success",
+        "rowCount": row_count,
+        "columnCount": len(stats),
+        "columnStats": [s.to_dict(i) for i, s in enumerate(stats)],
+        "rowData": preview
+    }
+
+def _scan_sheet(file_path: str, sheet_name: str) -> Dict[str, Any]:
+    # 複数シートのブックで、シートごとに別プロセスから呼ばれる
+    stream = open_xlsx_row_stream(file_path, sheet_name=sheet_name)
+    if stream["status"] != "success":
+        return stream
+    return {"sheetName": sheet_name, **_scan_rows(stream)}
+
+def _ingest_sheets(file_path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    複数シートのxlsx: シートごとに別プロセスで読み、sheetData にシートごとのプレビュー・統計を入れる。
+    """
+    results = map_sheets(_scan_sheet, file_path, meta["sheets"])
+    for name, result in zip(meta["sheets"], results):
+        if result["status"] != "success":
+            meta.update({"status": "error", "message": f"{name}: {result['message']}"})
+            return meta
+    meta.update({
+        "status": "success",
+        "fileType": "xlsx",
+        "rowCount": sum(r["rowCount"] for r in results),
+        "sheetData": [{k: v for k, v in r.items() if k != "status"} for r in results]
+    })
+    return meta
+
+def ingest_file(file_path: str) -> Dict[str, Any]:
+    """
+    ファイルを1回読み通してサイドカーを作成し、その内容を返す。
+    読み込みエラーもサイドカーに保存し、解析時に同じエラーを返せるようにする。
+    複数シートのxlsxはシートごとの結果を sheetData に入れる (上位の rowData / columnStats は無い)。
+    """
+    started = time.time()
+    meta: Dict[str, Any] = {"version": SIDECAR_VERSION, **_file_stamp(file_path)}
+    with metrics.span("ingest", fileName=os.path.basename(file_path)) as fields:
+        meta["sheets"] = _list_sheets(file_path)
+
+        if meta["sheets"] and len(meta["sheets"]) > 1:
+            _ingest_sheets(file_path, meta)
+        else:
+            stream = open_row_stream(file_path)
+            if stream["status"] != "success":
+                meta.update({"status": "error", "message": stream["message"]})
+            else:
+                meta.update(_scan_rows(stream))
+                if meta["status"] == "success":
+                    meta.update({"fileType": stream["fileType"], "encoding": stream.get("encoding")})
+        fields["rows"] = meta.get("rowCount", 0)
+        fields["status"] = meta["status"]
+    metrics.count_rows("ingest", meta.get("rowCount", 0))
+
+    if meta["status"] == "success":
+        meta.update({"ingestedAt": time.time(), "elapsedSeconds": round(time.time() - started, 3)})
+    _write_sidecar(file_path, meta)
+    return meta
+
+def load_sidecar(file_path: str) -> Optional[Dict[str, Any]]:
+    """
+    サイドカーを読む。無い・壊れている・元ファイルが変わっている場合は None。
+    """
+    try:
+        with open(sidecar_path(file_path), "r", encoding="utf-8") as f:
+            meta = json.load(f, object_hook=_decode_value)
+        if meta.get("version") != SIDECAR_VERSION or _file_stamp(file_path) != {
+            "fileSize": meta.get("fileSize"), "mtimeNs": meta.get("mtimeNs")
+        }:
+            return None
+        return meta
+    except (OSError, ValueError):
+        return None
+
+def load_preview(file_path: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    convert_file_to_json(file_path, limit_rows=True) と同じ形で先頭100行を返す。
+    サイドカーがあればそれを使い、無ければ (取り込みが終わる前に解析された場合など) ファイルを読む。
+    複数シートのxlsxは sheet_name でシートを指定する。
+    """
+    meta = load_sidecar(file_path)
+    if meta is None:
+        if sheet_name is not None:
+            return convert_xlsx_to_json(file_path, limit_rows=True, sheet_name=sheet_name)
+        return convert_file_to_json(file_path, limit_rows=True)
+    if meta["status"] != "success":
+        return {"status": "error", "message": meta["message"]}
+
+    if "sheetData" in meta or sheet_name is not None:
+        sheet = next((s for s in meta.get("sheetData", []) if s["sheetName"] == sheet_name), None)
+        if sheet is None and sheet_name is not None and meta.get("sheets") == [sheet_name]:
+            sheet = meta  # 1シートのファイルでシート名を指定された場合
+        if sheet is None:
+            if sheet_name is None:
+                return {"status": "error", "message": f"シート数が1つではありません。シート数: {len(meta['sheets'])}"}
+            return {"status": "error", "message": f"シートが見つかりません: {sheet_name}"}
+        return {"status": "success", "fileType": "xlsx", "rowData": sheet["rowData"], "fromSidecar": True}
+
+    result = {
+        "status": "success",
+        "fileType": meta["fileType"],
+        "rowData": meta["rowData"],
+        "fromSidecar": True
+    }
+    if meta.get("encoding"):
+        result["encoding"] = meta["encoding"]
+    return result
+
+def load_sheet_previews(file_path: str) -> Optional[Dict[str, Any]]:
+    """
+    複数シートのxlsxなら、シートごとの先頭100行を
+    {"status": "success", "fileType": "xlsx", "sheets": [{"sheetName": ..., "rowData": [...]}, ...]} で返す。
+    1シートのファイルやCSV・JSONは None (load_preview を使う)。
+    """
+    meta = load_sidecar(file_path)
+    if meta is not None:
+        if meta["status"] != "success" and meta.get("sheets") and len(meta["sheets"]) > 1:
+            return {"status": "error", "message": meta["message"]}
+        if "sheetData" not in meta:
+            return None
+        return {
+            "status": "success",
+            "fileType": "xlsx",
+            "sheets": [{"sheetName": s["sheetName"], "rowData": s["rowData"]} for s in meta["sheetData"]],
+            "fromSidecar": True
+        }
+
+    sheets = _list_sheets(file_path)
+    if not sheets or len(sheets) == 1:
+        return None
+    return convert_sheets_to_json(file_path, limit_rows=True)
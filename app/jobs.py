@@ -0,0 +1,174 @@
+# app/jobs.py
+#
+# /api/analyze や /api/codegen の処理をバックグラウンドで実行するためのジョブキュー。
+# 投入するとすぐにジョブIDを返し、上限付きのワーカースレッドで順に処理する。
+# LLM待ちの間もFlaskのリクエストスレッドを占有しない。
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app import metrics
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", 100))  # 実行待ち+実行中の上限
+MAX_FINISHED_JOBS = int(os.environ.get("MAX_FINISHED_JOBS", 1000))  # 保持しておく完了済みジョブ数
+# アップロードごとに自動で走る取り込み (ingest) は専用のワーカーで実行し、analyze / codegen のワーカーを使わない
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 1))
+# ダウンロード時の形式変換 (convert) も同じ理由で専用のワーカーで実行する
+CONVERT_WORKERS = int(os.environ.get("CONVERT_WORKERS", 1))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+_current = threading.local()
+
+class JobCancelled(BaseException):
+    """
+    実行中のジョブがキャンセルされたときに処理を打ち切るための例外。
+    処理側の except Exception で握りつぶされないよう BaseException を継承する。
+    """
+
+def raise_if_cancelled() -> None:
+    """
+    ジョブとして実行中の処理から呼ぶと、キャンセル要求があれば JobCancelled を送出する。
+    ジョブ外 (通常のリクエスト処理) から呼んだ場合は何もしない。
+    """
+    job = getattr(_current, "job", None)
+    if job is not None and job.cancel_event.is_set():
+        raise JobCancelled()
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.status = STATUS_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.http_status: Optional[int] = None
+        self.error: Optional[str] = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "jobStatus": self.status,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "error": self.error
+        }
+
+class JobManager:
+    """
+    ThreadPoolExecutor の前に投入数の上限を置いたジョブ管理。
+    関数の戻り値が (dict, HTTPステータス) のタプルならそのまま、dict なら 200 として結果に保存する。
+    kind_workers ({種類: ワーカー数}) に指定した種類のジョブは専用のスレッドプールで実行するので、
+    その種類のジョブが大量に投入されても他の種類のジョブのワーカーは埋まらない (ジョブIDの管理は共通)。
+    投入数の上限 (queue_limit) もスレッドプールごとに数える。
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, queue_limit: int = JOB_QUEUE_LIMIT,
+                 max_finished: int = MAX_FINISHED_JOBS, kind_workers: Optional[Dict[str, int]] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._kind_executors = {
+            kind: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"job-{kind}")
+            for kind, workers in (kind_workers or {}).items()
+        }
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._active = {}  # スレッドプール (専用プールの種類、共通プールは None) -> 実行待ち+実行中の数
+        self.queue_limit = queue_limit
+        self.max_finished = max_finished
+
+    def submit(self, kind: str, func: Callable, *args, **kwargs) -> Optional[Job]:
+        """
+        ジョブを投入する。実行待ちが上限に達している場合は None を返す。
+        """
+        job = Job(kind)
+        with self._lock:
+            pool = kind if kind in self._kind_executors else None
+            if self._active.get(pool, 0) >= self.queue_limit:
+                return None
+            self._active[pool] = self._active.get(pool, 0) + 1
+            self._jobs[job.id] = job
+            self._trim_finished()
+        job.future = self._kind_executors.get(kind, self._executor).submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job: Job, func: Callable, args, kwargs) -> None:
+        with self._lock:
+            if job.cancel_event.is_set():
+                self._finish(job, STATUS_CANCELLED)
+                return
+            job.status = STATUS_RUNNING
+            job.started_at = time.time()
+        metrics.JOB_QUEUE_WAIT.observe(job.started_at - job.created_at, kind=job.kind)
+
+        _current.job = job
+        try:
+            result = func(*args, **kwargs)
+            if isinstance(result, tuple):
+                result, http_status = result
+            else:
+                http_status = 200
+            with self._lock:
+                job.result = result
+                job.http_status = http_status
+                ok = http_status < 400 and isinstance(result, dict) and result.get("status") != "error"
+                self._finish(job, STATUS_SUCCEEDED if ok else STATUS_FAILED)
+        except JobCancelled:
+            with self._lock:
+                self._finish(job, STATUS_CANCELLED)
+        except Exception as e:
+            with self._lock:
+                job.error = str(e)
+                job.result = {"status": "error", "message": str(e)}
+                job.http_status = 500
+                self._finish(job, STATUS_FAILED)
+        finally:
+            _current.job = None
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        self._active[job.kind if job.kind in self._kind_executors else None] -= 1
+        if job.started_at is not None:
+            metrics.JOB_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind, status=status)
+
+    def _trim_finished(self) -> None:
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATUSES]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        キャンセル要求を出す。実行待ちならそのまま取り消し、
+        実行中なら処理側が raise_if_cancelled() を呼んだ時点で止まる。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            job.cancel_event.set()
+            if job.status == STATUS_QUEUED and job.future is not None and job.future.cancel():
+                self._finish(job, STATUS_CANCELLED)
+            return job
+
+job_manager = JobManager(kind_workers={"ingest": INGEST_WORKERS, "convert": CONVERT_WORKERS})
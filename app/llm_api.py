@@ -3,8 +3,9 @@
 
 import os
 import json
+import time
+import logging
 from openai import (
-    OpenAI,
     APIConnectionError,
     APIStatusError,
     RateLimitError,
@@ -16,14 +17,24 @@ from openai import (
 
 # ここでは直接環境変数を読み取る例にしています
 openai_api_key = os.environ.get("OPENAI_API_KEY")
-print("[DEBUG] OPENAI_API_KEY (first 8 chars):", (openai_api_key or "")[:8], "...")
 
-if not openai_api_key:
+logger = logging.getLogger(__name__)
+
+if not openai_api_key and not os.environ.get("LLM_BASE_URL"):
     # ここでキーが取得できない場合のエラー処理
     # 必要に応じて例外を投げるか、ログ出力してください
-    print("[WARN ] No OPENAI_API_KEY found in environment variables.")
+    logger.warning("No OPENAI_API_KEY found in environment variables.")
+
+# OpenAIクライアントは app/llm_gateway.py で共有し、再試行・流量制御もそちらで行う
+from app import llm_gateway
+
+from app.llm_cache import llm_cache, make_cache_key, LLM_CACHE_ENABLED
+from app import metrics
 
-client = OpenAI(api_key=openai_api_key)
+def _usage_tokens(chat_completion) -> int:
+    """レスポンスの usage から合計トークン数を取り出す (無ければ0)"""
+    usage = getattr(chat_completion, "usage", None)
+    return getattr(usage, "total_tokens", 0) or 0
 
 def call_header_detection(request_data: dict) -> dict:
     """
@@ -35,55 +46,68 @@ def call_header_detection(request_data: dict) -> dict:
         with open("system_prompt_header_detection.md", "r", encoding="utf-8") as f:
             system_prompt = f.read()
     except Exception as e:
-        print("[DEBUG] Failed to load system_prompt_header_detection.md:", e)
+        logger.error("Failed to load system_prompt_header_detection.md: %s", e)
         return {
             "status": "error",
             "message": f"Failed to load system_prompt_header_detection.md: {str(e)}"
         }
 
 
-    print("[DEBUG] system prompt length =", len(system_prompt))
     # ユーザープロンプト (rowData を埋め込む)
     user_prompt = f"Here is the JSON data:\n{json.dumps(request_data, ensure_ascii=False)}"
-    print("[DEBUG] call_header_detection -> user_prompt length =", len(user_prompt))
-    print("[DEBUG] OPENAI_API_KEY (first 8 chars):", (openai_api_key or "")[:8], "...")
+    logger.debug(
+        "call_header_detection",
+        extra={"systemPromptLength": len(system_prompt), "userPromptLength": len(user_prompt)}
+    )
 
+    # 同じモデル・同じプロンプト・同じデータなら過去の結果を返す (ネットワークに出ない)
+    model = "gpt-4o"  # 必要に応じて "gpt-4" などに変更
+    cache_key = make_cache_key(model, system_prompt, request_data)
+    if LLM_CACHE_ENABLED:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("call_header_detection -> cache hit")
+            metrics.record_llm_call("header", model, 0.0, outcome="cache_hit")
+            return cached
+
+    started = time.time()
     try:
         # ChatCompletion呼び出し (新しいOpenAIクライアント)
-        chat_completion = client.chat.completions.create(
-            model="gpt-4o",  # 必要に応じて "gpt-4" などに変更
+        chat_completion = llm_gateway.complete(
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=0.0
+            temperature=0.0,
+            kind="header"
         )
     except APIConnectionError as e:
-        print("[ERROR] Could not connect to the API:", e)
+        logger.error("Could not connect to the API: %s", e)
         return {
             "status": "error",
             "message": f"Could not connect to the API: {str(e)}"
         }
     except RateLimitError as e:
-        print("[ERROR] Rate limit error:", e)
+        logger.error("Rate limit error: %s", e)
         return {
             "status": "error",
             "message": f"Rate limit error: {str(e)}"
         }
     except APIStatusError as e:
-        print("[ERROR] API returned error status =", e.status_code, "; response =", e.response)
+        logger.error("API returned error status = %s; response = %s", e.status_code, e.response)
         return {
             "status": "error",
             "message": f"API returned error (status={e.status_code}): {e.response}"
         }
     except APIError as e:
-        print("[ERROR] OpenAI API Error:", e)
+        logger.error("OpenAI API Error: %s", e)
         return {
             "status": "error",
             "message": f"OpenAI API Error: {str(e)}"
         }
     except Exception as e:
-        print("[ERROR] Unexpected error:", e)
+        logger.exception("Unexpected error: %s", e)
         return {
             "status": "error",
             "message": f"Unexpected error: {str(e)}"
@@ -92,11 +116,13 @@ def call_header_detection(request_data: dict) -> dict:
     # chat_completion から結果テキストを取り出し、JSONパース
     try:
         assistant_content = chat_completion.choices[0].message.content
-        print("[DEBUG] assistant_content =", assistant_content)  # ★ ここで出力
+        logger.debug("assistant_content = %.2000s", assistant_content)
         parsed_json = json.loads(assistant_content)
+        if LLM_CACHE_ENABLED and parsed_json.get("status") != "error":
+            llm_cache.put(cache_key, parsed_json, time.time() - started, _usage_tokens(chat_completion))
         return parsed_json
     except Exception as e:
-        print("[ERROR] JSON parse failed:", e)
+        logger.error("JSON parse failed: %s", e)
         return {
             "status": "error",
             "message": f"Failed to parse JSON from LLM: {str(e)}",
@@ -108,25 +134,50 @@ def call_mapping(request_data: dict) -> dict:
     system_prompt_mapping.md を読み込み、
     ChatGPT API (openai>=1.0.0) に問い合わせてマッピング提案を行う。
     """
+    return _call_json_prompt("system_prompt_mapping.md", request_data, kind="mapping")
+
+def call_header_and_mapping(request_data: dict) -> dict:
+    """
+    system_prompt_header_and_mapping.md を読み込み、ヘッダー判定とマッピング提案を1回の呼び出しで行う。
+    戻り値は {"status", "headerDetection", "mapping", "missingRequiredFields", "additionalNotes"} の形を期待。
+    """
+    return _call_json_prompt("system_prompt_header_and_mapping.md", request_data, kind="combined")
+
+def _call_json_prompt(prompt_file: str, request_data: dict, kind: str = "other") -> dict:
+    """
+    prompt_file をシステムプロンプト、request_data をユーザープロンプトとして gpt-4o を呼び出し、
+    返ってきたJSONをdictにして返す。エラー時は {"status": "error", ...} を返す。
+    kind はメトリクス用の呼び出しの種類。
+    """
     try:
-        with open("system_prompt_mapping.md", "r", encoding="utf-8") as f:
+        with open(prompt_file, "r", encoding="utf-8") as f:
             system_prompt = f.read()
     except Exception as e:
         return {
             "status": "error",
-            "message": f"Failed to load system_prompt_mapping.md: {str(e)}"
+            "message": f"Failed to load {prompt_file}: {str(e)}"
         }
 
     user_prompt = f"Here is the JSON data:\n{json.dumps(request_data, ensure_ascii=False)}"
 
+    model = "gpt-4o"
+    cache_key = make_cache_key(model, system_prompt, request_data)
+    if LLM_CACHE_ENABLED:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            metrics.record_llm_call(kind, model, 0.0, outcome="cache_hit")
+            return cached
+
+    started = time.time()
     try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-4o",
+        chat_completion = llm_gateway.complete(
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=0.0
+            temperature=0.0,
+            kind=kind
         )
     except APIConnectionError as e:
         return {
@@ -157,6 +208,8 @@ def call_mapping(request_data: dict) -> dict:
     try:
         assistant_content = chat_completion.choices[0].message.content
         parsed_json = json.loads(assistant_content)
+        if LLM_CACHE_ENABLED and parsed_json.get("status") != "error":
+            llm_cache.put(cache_key, parsed_json, time.time() - started, _usage_tokens(chat_completion))
         return parsed_json
     except Exception as e:
         return {
@@ -186,13 +239,14 @@ def call_mapping_refine(original_mapping: dict, user_instruction: str) -> dict:
     user_prompt = json.dumps(user_prompt_content, ensure_ascii=False)
 
     try:
-        chat_completion = client.chat.completions.create(
+        chat_completion = llm_gateway.complete(
             model="gpt-4o",  # 任意のモデル名
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            temperature=0.0
+            temperature=0.0,
+            kind="refine"
         )
     except Exception as e:
         raise RuntimeError(f"LLM API call failed: {str(e)}")
@@ -0,0 +1,126 @@
+# app/llm_cache.py
+#
+# ヘッダー判定・マッピング提案のLLMレスポンスキャッシュ (SQLite)。
+# キーは「モデル名 + システムプロンプト本文 + リクエストデータ(JSON)」のハッシュ。
+# 同じテンプレートを何度アップロードしてもネットワークに出ずに結果を返せる。
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "generated", "llm_cache.sqlite3")
+)
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+DEFAULT_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))  # 1週間
+DEFAULT_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000))
+
+def make_cache_key(model: str, system_prompt: str, request_data: Any) -> str:
+    """
+    リクエスト内容を正規化 (キー順ソート) してハッシュ化する。
+    """
+    payload = json.dumps(
+        {"model": model, "systemPrompt": system_prompt, "request": request_data},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    TTL付き・件数上限付きのSQLiteキャッシュ。
+    上限を超えたら最終アクセスが古い順に削除する。ヒット/ミス数と節約できた時間・トークン数を数える。
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " latency REAL NOT NULL DEFAULT 0,"
+                " tokens INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at, latency, tokens FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now - self.ttl_seconds:
+                if row is not None:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            self.saved_seconds += row[2]
+            self.saved_tokens += row[3]
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict[str, Any], latency: float = 0.0, tokens: int = 0) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access, latency, tokens)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False), now, now, latency, tokens)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "enabled": LLM_CACHE_ENABLED,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": (self.hits / total) if total else 0.0,
+                "entries": entries,
+                "savedSeconds": round(self.saved_seconds, 3),
+                "savedTokens": self.saved_tokens
+            }
+
+llm_cache = LLMResponseCache()
@@ -0,0 +1,223 @@
+# app/llm_gateway.py
+#
+# すべてのLLM呼び出しが通る共有ゲートウェイ。
+#   - OpenAI クライアントはプロセスで1つだけ作り、HTTP接続 (keep-alive) を使い回す
+#   - リクエスト数/分・トークン数/分のトークンバケットで送信ペースを抑える
+#   - 同時に投げるリクエスト数に上限を設ける
+#   - 429 / 5xx / 接続エラーはジッター付き指数バックオフで再試行する
+#   - 呼び出しの種類 (kind) ごとに応答時間・待ち時間・トークン数を app/metrics.py に記録する
+#   - /api/*/stream のリクエスト中は complete() がストリーミングモードで呼び出し、途中経過を app/streaming.py に送る
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, List, Optional
+from openai import OpenAI, APIConnectionError, APIStatusError, RateLimitError
+
+from app import metrics
+from app import streaming
+
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL") or None  # 互換サーバーを使う場合に指定
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 300))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", 150000))
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", 8))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 1.0))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 30.0))
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算。英数字は約4文字で1トークン、日本語などの非ASCII文字は1文字1トークンとみなす。
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+class TokenBucket:
+    """
+    1分あたり per_minute 単位まで補充されるトークンバケット。
+    acquire() は必要量が貯まるまでブロックする。容量を超える要求は容量分だけ待って通す。
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """
+    次の再試行までの待ち時間。どちらの場合も 0〜LLM_BACKOFF_MAX_SECONDS に収める。
+    Retry-After があればそれ (負の値・大きすぎる値は丸める) に 0〜base 秒のジッターを足し、
+    429 を受けた呼び出しが一斉に再送しないようにする。無ければジッター付き指数バックオフ。
+    """
+    retry_after = _retry_after_seconds(error)
+    if retry_after is None:
+        # Full jitter: 0〜(base * 2^attempt) の一様乱数
+        return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    retry_after = min(LLM_BACKOFF_MAX_SECONDS, max(0.0, retry_after))
+    return min(LLM_BACKOFF_MAX_SECONDS, retry_after + random.uniform(0, LLM_BACKOFF_BASE_SECONDS))
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+class LLMGateway:
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+                 max_in_flight: int = LLM_MAX_IN_FLIGHT, max_retries: int = LLM_MAX_RETRIES):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def client(self) -> OpenAI:
+        """
+        共有の OpenAI クライアント。SDK内部の接続プールをプロセス全体で使い回す。
+        SDK側の自動リトライは無効にし、このゲートウェイで再試行を制御する。
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # 互換サーバー (tools/fake_openai_server.py など) はキーを見ないので、未設定でも起動できるようにする
+                    api_key = os.environ.get("OPENAI_API_KEY") or ("not-needed" if LLM_BASE_URL else None)
+                    self._client = OpenAI(
+                        api_key=api_key,
+                        base_url=LLM_BASE_URL,
+                        timeout=LLM_TIMEOUT_SECONDS,
+                        max_retries=0
+                    )
+        return self._client
+
+    def chat_completion(self, model: str, messages: List[dict], kind: str = "other", **kwargs) -> Any:
+        """
+        client.chat.completions.create() と同じ引数で呼び出す。
+        kind はメトリクス用の呼び出しの種類 (header / mapping / combined / refine / codegen など)。
+        再試行しても失敗した場合は最後の例外をそのまま送出する (呼び出し側の except 節はそのまま使える)。
+        """
+        return self._call_with_retries(
+            kind, model, messages,
+            lambda: self.client().chat.completions.create(model=model, messages=messages, **kwargs)
+        )
+
+    def chat_completion_stream(self, model: str, messages: List[dict], kind: str = "other",
+                               on_delta: Optional[Callable[[str], None]] = None, **kwargs) -> Any:
+        """
+        ストリーミングモード (stream=True) で呼び出し、出力の断片を受け取るたびに on_delta(断片) を呼ぶ。
+        戻り値は chat_completion() と同じように .choices[0].message.content と .usage で読める。
+        再試行するのは最初の断片を受け取る前に失敗した場合だけ (途中まで送った進捗と食い違わないように)。
+        """
+        state = {"received": False}
+
+        def send():
+            stream = self.client().chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            parts, usage, finish_reason = [], None, None
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta = getattr(choice.delta, "content", None)
+                if delta:
+                    state["received"] = True
+                    parts.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+            message = SimpleNamespace(role="assistant", content="".join(parts))
+            return SimpleNamespace(
+                model=model, usage=usage,
+                choices=[SimpleNamespace(index=0, message=message, finish_reason=finish_reason)]
+            )
+
+        return self._call_with_retries(kind, model, messages, send, lambda: not state["received"])
+
+    def _call_with_retries(self, kind: str, model: str, messages: List[dict], send: Callable[[], Any],
+                           can_retry: Callable[[], bool] = lambda: True) -> Any:
+        """
+        レート制限・同時実行数の上限を守って send() を実行し、失敗したらバックオフして再試行する。
+        """
+        estimated = estimate_tokens(json.dumps(messages, ensure_ascii=False))
+        attempt = 0
+        while True:
+            waited = self.request_bucket.acquire(1)
+            waited += self.token_bucket.acquire(estimated)
+            queued = time.perf_counter()
+            with self._in_flight:
+                started = time.perf_counter()
+                metrics.LLM_QUEUE_WAIT.observe(waited + started - queued, kind=kind)
+                try:
+                    response = send()
+                except Exception as e:
+                    error = e
+                else:
+                    metrics.record_llm_call(kind, model, time.perf_counter() - started, getattr(response, "usage", None))
+                    return response
+            metrics.record_llm_call(kind, model, time.perf_counter() - started, outcome="error")
+            if not _is_retryable(error) or attempt >= self.max_retries or not can_retry():
+                raise error
+            delay = _retry_delay(error, attempt)
+            metrics.LLM_RETRIES.inc(kind=kind, reason=type(error).__name__)
+            logger.warning(
+                "LLM call failed, retrying",
+                extra={"kind": kind, "error": type(error).__name__, "retry": attempt + 1,
+                       "maxRetries": self.max_retries, "delaySeconds": round(delay, 1)}
+            )
+            time.sleep(delay)
+            attempt += 1
+
+llm_gateway = LLMGateway()
+
+def chat_completion(model: str, messages: List[dict], kind: str = "other", **kwargs) -> Any:
+    return llm_gateway.chat_completion(model, messages, kind=kind, **kwargs)
+
+def chat_completion_stream(model: str, messages: List[dict], kind: str = "other",
+                           on_delta: Optional[Callable[[str], None]] = None, **kwargs) -> Any:
+    return llm_gateway.chat_completion_stream(model, messages, kind=kind, on_delta=on_delta, **kwargs)
+
+def complete(model: str, messages: List[dict], kind: str = "other", **kwargs) -> Any:
+    """
+    アプリのLLM呼び出しはこれを使う。通常は chat_completion() と同じで、
+    /api/*/stream のリクエスト中だけストリーミングモードで呼び出して途中経過を送る。
+    """
+    on_delta = streaming.llm_delta_handler(kind)
+    if on_delta is None:
+        return chat_completion(model, messages, kind=kind, **kwargs)
+    with streaming.stage("llm", kind=kind):
+        return chat_completion_stream(model, messages, kind=kind, on_delta=on_delta, **kwargs)
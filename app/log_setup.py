@@ -0,0 +1,61 @@
+# app/log_setup.py
+#
+# ログ出力の設定。各モジュールは logging.getLogger(__name__) ("app.xxx") でログを出し、
+# ここで "app" ロガーにハンドラを1つだけ付ける。
+#   LOG_LEVEL  : DEBUG / INFO / WARNING / ERROR (既定 INFO)
+#   LOG_FORMAT : text (既定) / json (1行1JSON、集計基盤に流す場合)
+# logger.info("message", extra={"key": value}) の extra もそのまま出力に含める。
+
+import os
+import sys
+import json
+import logging
+import datetime
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+
+# LogRecord が最初から持っている属性 (これ以外が extra で渡された値)
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_")}
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-5s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(level: str = None, fmt: str = None) -> None:
+    """
+    "app" ロガーにハンドラを設定する。何度呼んでもハンドラは1つだけ。
+    """
+    logger = logging.getLogger("app")
+    logger.setLevel((level or LOG_LEVEL).upper())
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+    for old in list(logger.handlers):
+        if getattr(old, "_app_handler", False):
+            logger.removeHandler(old)
+    handler._app_handler = True
+    logger.addHandler(handler)
+    logger.propagate = False
@@ -1,26 +1,186 @@
 # app/main_processor.py
 
-from app.file_to_json import convert_xlsx_to_json
-from app.llm_api import call_header_detection, call_mapping
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.ingest import load_preview, load_sheet_previews
+from app.multi_sheet import header_key
+from app.llm_api import call_header_detection, call_mapping, call_header_and_mapping
+from app.jobs import raise_if_cancelled
+from app.header_detector import detect_header
+from app.prompt_sampling import sample_row_data
+from app import metrics
+from app import streaming
 
-def process_file_and_map(file_path: str) -> dict:
+# 解析パイプラインのモード
+#   sequential : ヘッダー判定 → マッピング提案 を順番に呼ぶ (LLM 2往復)
+#   combined   : ヘッダー判定とマッピング提案を1つのプロンプトでまとめて呼ぶ (LLM 1往復)
+#   speculative: ローカルで予測したヘッダー行でマッピング提案を並行して呼び、
+#                LLMのヘッダー判定と食い違った場合だけマッピング提案をやり直す
+#                (予測が外れると gpt-4o のマッピング呼び出しが1回無駄になり、実行中の呼び出しは止められない)
+# 既定は従来どおり sequential。待ち時間を優先する環境では ANALYZE_PIPELINE_MODE で combined / speculative を選ぶ
+PIPELINE_MODES = ("sequential", "combined", "speculative")
+ANALYZE_PIPELINE_MODE = os.environ.get("ANALYZE_PIPELINE_MODE", "sequential")
+
+# ローカルのヘッダー判定 (app/header_detector.py) の確信度がこれ以上ならLLMのヘッダー判定を省略する。
+# 1より大きい値を設定すると常にLLMで判定する。
+LOCAL_HEADER_CONFIDENCE_THRESHOLD = float(os.environ.get("LOCAL_HEADER_CONFIDENCE_THRESHOLD", 0.8))
+
+_llm_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+
+logger = logging.getLogger(__name__)
+
+def _header_request(fileType: str, rowData: list, keep_until: int):
+    """
+    ヘッダー判定用のリクエスト。rowData はトークン予算内に間引き、元の行番号の対応表も返す。
+    """
+    sample = sample_row_data(rowData, keep_until=keep_until)
+    return {"fileType": fileType, "rowData": sample["rowData"]}, sample["rowIndices"]
+
+def _mapping_request(fileType: str, rowData: list, header_index: int) -> dict:
+    sample = sample_row_data(rowData, keep_until=header_index)
+    return {"fileType": fileType, "headerRowIndex": header_index, "rowData": sample["rowData"]}
+
+def _restore_header_index(header_response: dict, row_indices: list) -> dict:
+    """
+    間引いた rowData 上の headerRowIndex を元の rowData 上の行番号に戻す。
+    ヘッダー候補までの先頭行は間引かないので、通常は値が変わらない。
+    """
+    detection = header_response.get("headerDetection") or {}
+    index = detection.get("headerRowIndex", -1)
+    if isinstance(index, int) and 0 <= index < len(row_indices):
+        detection["headerRowIndex"] = row_indices[index]
+    return header_response
+
+def _run_sequential(fileType: str, rowData: list, predicted_index: int):
+    header_request, row_indices = _header_request(fileType, rowData, predicted_index)
+    header_response = call_header_detection(header_request)
+    if header_response.get("status") == "error":
+        return header_response, None, {}
+    _restore_header_index(header_response, row_indices)
+
+    # ジョブとして実行中にキャンセルされていれば、2回目のLLM呼び出しの前に止める
+    raise_if_cancelled()
+
+    header_index = header_response.get("headerDetection", {}).get("headerRowIndex", -1)
+    mapping_response = call_mapping(_mapping_request(fileType, rowData, header_index))
+    return header_response, mapping_response, {}
+
+def _run_combined(fileType: str, rowData: list, predicted_index: int):
+    request_data, row_indices = _header_request(fileType, rowData, predicted_index)
+    combined = call_header_and_mapping(request_data)
+    if combined.get("status") == "error":
+        return combined, None, {}
+
+    header_response = _restore_header_index({
+        "status": combined.get("status", "success"),
+        "headerDetection": combined.get("headerDetection", {})
+    }, row_indices)
+    mapping_response = {
+        "status": combined.get("status", "success"),
+        "mapping": combined.get("mapping", []),
+        "missingRequiredFields": combined.get("missingRequiredFields", []),
+        "additionalNotes": combined.get("additionalNotes", "")
+    }
+    return header_response, mapping_response, {}
+
+def _run_local_header(fileType: str, rowData: list, local_header: dict):
+    """
+    ローカル判定の確信度が十分高い場合: ヘッダー判定はLLMに聞かず、マッピング提案だけを呼ぶ。
+    """
+    header_response = {
+        "status": "success",
+        "headerDetection": local_header["headerDetection"]
+    }
+    header_index = local_header["headerDetection"]["headerRowIndex"]
+    mapping_response = call_mapping(_mapping_request(fileType, rowData, header_index))
+    return header_response, mapping_response, {}
+
+def _run_speculative(fileType: str, rowData: list, predicted_index: int):
+    header_request, row_indices = _header_request(fileType, rowData, predicted_index)
+    # submit_in_context: /api/analyze/stream の進捗チャネルを LLM 呼び出しのスレッドにも引き継ぐ
+    header_future = streaming.submit_in_context(_llm_executor, call_header_detection, header_request)
+    mapping_future = streaming.submit_in_context(
+        _llm_executor, call_mapping, _mapping_request(fileType, rowData, predicted_index)
+    )
+
+    header_response = header_future.result()
+    if header_response.get("status") == "error":
+        mapping_future.cancel()
+        return header_response, None, {}
+    _restore_header_index(header_response, row_indices)
+
+    header_index = header_response.get("headerDetection", {}).get("headerRowIndex", -1)
+    speculation = {"predictedHeaderRowIndex": predicted_index, "speculationHit": header_index == predicted_index}
+    if header_index == predicted_index:
+        return header_response, mapping_future.result(), speculation
+
+    # 予測が外れたので、LLMが判定したヘッダー行でマッピング提案をやり直す
+    mapping_future.cancel()
+    raise_if_cancelled()
+    mapping_response = call_mapping(_mapping_request(fileType, rowData, header_index))
+    return header_response, mapping_response, speculation
+
+def process_file_and_map(file_path: str, mode: str = None, header_confidence_threshold: float = None,
+                         sheet_name: str = None) -> dict:
     """
     1. XLSX/CSV/JSONファイルを100行まで読み込み
-    2. ChatGPTでヘッダー判定
+    2. ローカルでヘッダー判定し、確信度が低ければChatGPTでヘッダー判定
     3. ChatGPTでマッピング提案
     4. 結果を返す
+
+    2と3の呼び出し方は mode (省略時は環境変数 ANALYZE_PIPELINE_MODE) で切り替える。
+    複数シートのxlsxで sheet_name を省略した場合は、シートごとに解析する (_process_sheets)。
     """
- 
-    result = convert_xlsx_to_json(file_path, limit_rows=True)
+    mode = mode or ANALYZE_PIPELINE_MODE
+    if header_confidence_threshold is None:
+        header_confidence_threshold = LOCAL_HEADER_CONFIDENCE_THRESHOLD
+    if mode not in PIPELINE_MODES:
+        return {
+            "status": "error",
+            "message": f"不明なパイプラインモードです: {mode} (対応: {', '.join(PIPELINE_MODES)})"
+        }
+
+    if sheet_name is None:
+        with metrics.span("parse", sheets="all"), streaming.stage("parse", sheets="all"):
+            sheets = load_sheet_previews(file_path)
+        if sheets is not None:
+            if sheets["status"] != "success":
+                return sheets
+            with metrics.span("analyze", sheets=len(sheets["sheets"])), streaming.stage("analyze"):
+                return _process_sheets(sheets, mode, header_confidence_threshold)
+
+    # アップロード時の取り込み処理 (app/ingest.py) が作ったサイドカーがあれば、ファイルを開かずに済む
+    with metrics.span("parse"), streaming.stage("parse"):
+        result = load_preview(file_path, sheet_name)
     if result["status"] != "success":
         return result
-    
+
     rowData = result.get("rowData", [])
     fileType = result.get("fileType", "unknown")
+    with metrics.span("analyze", mode=mode), streaming.stage("analyze"):
+        analyzed = _analyze_rows(fileType, rowData, mode, header_confidence_threshold)
+    if sheet_name is not None and analyzed["status"] == "success":
+        analyzed["sheetName"] = sheet_name
+    return analyzed
+
+def _analyze_rows(fileType: str, rowData: list, mode: str, header_confidence_threshold: float) -> dict:
+    """
+    1シート分のプレビューに対してヘッダー判定・マッピング提案を行う。
+    """
+    local_header = detect_header(rowData)
+    local_confidence = local_header["headerDetection"]["confidence"]
+    if local_confidence >= header_confidence_threshold:
+        header_source = "local"
+        header_response, mapping_response, pipeline_info = _run_local_header(fileType, rowData, local_header)
+    else:
+        header_source = "llm"
+        runner = {"combined": _run_combined, "speculative": _run_speculative}.get(mode, _run_sequential)
+        header_response, mapping_response, pipeline_info = runner(
+            fileType, rowData, local_header["bestCandidateIndex"]
+        )
 
-    # ヘッダー判定
-    header_response = call_header_detection({"fileType": fileType, "rowData": rowData})
-    print("[DEBUG] header_response =", header_response)
+    logger.debug("header_response = %s", header_response)
     if header_response.get("status") == "error":
         return {
             "status": "error",
@@ -28,14 +188,6 @@ def process_file_and_map(file_path: str) -> dict:
             "details": header_response
         }
 
-    header_info = header_response.get("headerDetection", {})
-    header_index = header_info.get("headerRowIndex", -1)
-
-    mapping_response = call_mapping({
-        "fileType": fileType,
-        "headerRowIndex": header_index,
-        "rowData": rowData
-    })
     if mapping_response.get("status") == "error":
         return {
             "status": "error",
@@ -43,13 +195,85 @@ def process_file_and_map(file_path: str) -> dict:
             "details": mapping_response
         }
 
-    # 先頭3行をサンプルデータとして返す (ヘッダー行も含む)
-    sample_rows = rowData[:3]
-
     return {
         "status": "success",
         "headerResponse": header_response,
         "mappingResponse": mapping_response,
+        "pipeline": {
+            "mode": mode,
+            "headerSource": header_source,
+            "localHeaderConfidence": local_confidence,
+            **pipeline_info
+        },
         "rowData": rowData  # ★ ここでrowDataを含める
     }
 
+def _header_row_index(result: dict) -> int:
+    return result["headerResponse"].get("headerDetection", {}).get("headerRowIndex", -1)
+
+def _process_sheets(sheets: dict, mode: str, header_confidence_threshold: float) -> dict:
+    """
+    複数シートのxlsxをシートごとに解析する。
+    地域ごとのシートのように、ローカル判定したヘッダー行が解析済みのシートと同じ値なら、
+    そのシートのマッピングをそのまま使ってLLMを呼ばない。
+    同じヘッダー行を持つシートは mappingGroups にまとめて返す
+    (codegen に sheetNames / headerRowIndexes として渡すと1回の変換で連結して処理できる)。
+    """
+    fileType = sheets.get("fileType", "xlsx")
+    analyzed = {}  # 正規化したヘッダー行 -> (シート名, 解析結果)
+    groups = {}    # 正規化したヘッダー行 -> mappingGroup
+    results = []
+
+    for sheet in sheets["sheets"]:
+        name, rowData = sheet["sheetName"], sheet["rowData"]
+        if not any(any(v is not None for v in row) for row in rowData):
+            results.append({"sheetName": name, "status": "skipped", "message": "空のシートです"})
+            continue
+
+        raise_if_cancelled()
+        local_header = detect_header(rowData)
+        local_index = local_header["headerDetection"]["headerRowIndex"]
+        key = header_key(rowData[local_index]) if local_index >= 0 else None
+        if key in analyzed:
+            shared_name, shared = analyzed[key]
+            result = {
+                "status": "success",
+                "headerResponse": {"status": "success", "headerDetection": local_header["headerDetection"]},
+                "mappingResponse": shared["mappingResponse"],
+                "pipeline": {"mode": mode, "headerSource": "local", "mappingSharedWith": shared_name},
+                "rowData": rowData
+            }
+        else:
+            result = _analyze_rows(fileType, rowData, mode, header_confidence_threshold)
+            if result["status"] != "success":
+                result["sheetName"] = name
+                return result
+            header_index = _header_row_index(result)
+            key = header_key(rowData[header_index]) if 0 <= header_index < len(rowData) else None
+            if key is not None:
+                analyzed.setdefault(key, (name, result))
+
+        result["sheetName"] = name
+        results.append(result)
+        group_key = key if key is not None else ("#sheet", name)
+        group = groups.setdefault(group_key, {"sheetNames": [], "headerRowIndexes": {}})
+        group["sheetNames"].append(name)
+        group["headerRowIndexes"][name] = _header_row_index(result)
+
+    analyzed_sheets = [r for r in results if r["status"] == "success"]
+    if not analyzed_sheets:
+        return {"status": "error", "message": "データのあるシートがありません"}
+
+    # 1シートの場合と同じキーで先頭のシートの結果も返す (1シート前提の画面でもそのまま表示できる)
+    first = analyzed_sheets[0]
+    return {
+        "status": "success",
+        "sheetName": first["sheetName"],
+        "headerResponse": first["headerResponse"],
+        "mappingResponse": first["mappingResponse"],
+        "pipeline": first["pipeline"],
+        "rowData": first["rowData"],
+        "sheetNames": [s["sheetName"] for s in sheets["sheets"]],
+        "sheets": results,
+        "mappingGroups": list(groups.values())
+    }
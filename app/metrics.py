@@ -0,0 +1,238 @@
+# app/metrics.py
+#
+# 処理段階ごとの所要時間・LLMのトークン数・処理件数を集計し、Prometheus のテキスト形式で返す (/metrics)。
+# prometheus_client は使わず、必要な Counter と Histogram だけをここで実装している。
+#
+#   with span("parse", fileType="xlsx") as fields:   # app_stage_duration_seconds{stage="parse"}
+#       ...
+#       fields["rows"] = n                            # ログにだけ出す追加情報
+#   record_llm_call("mapping", "gpt-4o", seconds, usage)
+#
+# span の所要時間は logger "app.metrics" にも DEBUG で出す。
+# METRICS_ENABLED=0 にすると集計しない (span はログだけ出す)。
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒単位のバケット。表計算の読み込みやLLM呼び出しは数十秒〜数分かかることがあるので上を広めに取る
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+logger = logging.getLogger(__name__)
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: ラベルが一致しません {sorted(labels)} != {sorted(self.label_names)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple, value: Any) -> List[str]:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_value(self, key: tuple, value: float) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"]
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state["count"] if state else 0
+
+    def _render_value(self, key: tuple, state: dict) -> List[str]:
+        lines = []
+        for bound, count in zip(self.buckets, state["buckets"]):
+            labels = _format_labels(self.label_names, key, ("le", _format_number(bound)))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.label_names, key, ("le", "+Inf"))
+        lines.append(f"{self.name}_bucket{labels} {state['count']}")
+        plain = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{plain} {_format_number(state['sum'])}")
+        lines.append(f"{self.name}_count{plain} {state['count']}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "app_stage_duration_seconds", "処理段階ごとの所要時間 (秒)", ["stage"])
+STAGE_ERRORS = registry.counter(
+    "app_stage_errors_total", "例外で終わった処理段階の数", ["stage"])
+ROWS_PROCESSED = registry.counter(
+    "app_rows_processed_total", "処理段階ごとに処理した行数", ["stage"])
+
+LLM_REQUESTS = registry.counter(
+    "app_llm_requests_total", "LLM呼び出しの回数 (outcome: ok / error / cache_hit)", ["kind", "model", "outcome"])
+LLM_SECONDS = registry.histogram(
+    "app_llm_request_duration_seconds", "LLM呼び出し1回の応答時間 (再試行ごと、待ち時間は含まない)", ["kind", "model"])
+LLM_TOKENS = registry.counter(
+    "app_llm_tokens_total", "LLMレスポンスの usage によるトークン数 (type: prompt / completion)", ["kind", "model", "type"])
+LLM_QUEUE_WAIT = registry.histogram(
+    "app_llm_queue_wait_seconds", "レート制限・同時実行数の上限でLLM呼び出しが待たされた時間", ["kind"])
+LLM_RETRIES = registry.counter(
+    "app_llm_retries_total", "LLM呼び出しの再試行回数", ["kind", "reason"])
+
+REMAP_REQUESTS = registry.counter(
+    "app_remap_requests_total", "/api/remap の処理方法ごとの件数 (source: local / llm)", ["source"])
+
+HTTP_SECONDS = registry.histogram(
+    "app_http_request_duration_seconds", "APIリクエストの処理時間", ["method", "endpoint", "status"])
+JOB_QUEUE_WAIT = registry.histogram(
+    "app_job_queue_wait_seconds", "ジョブが実行開始されるまでの待ち時間", ["kind"])
+JOB_SECONDS = registry.histogram(
+    "app_job_duration_seconds", "ジョブの実行時間", ["kind", "status"])
+
+@contextmanager
+def span(stage: str, **fields) -> Iterator[Dict[str, Any]]:
+    """
+    with ブロックの所要時間を app_stage_duration_seconds{stage=...} に記録し、DEBUG ログにも出す。
+    例外で抜けた場合は app_stage_errors_total も数える。
+    yield する dict に値を入れると、その値もログに出る (件数など)。
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield fields
+    except Exception:
+        outcome = "error"
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        logger.debug("span", extra={"stage": stage, "seconds": round(elapsed, 4), "outcome": outcome, **fields})
+
+def count_rows(stage: str, rows: int) -> None:
+    if rows:
+        ROWS_PROCESSED.inc(rows, stage=stage)
+
+def record_llm_call(kind: str, model: str, seconds: float, usage: Any = None, outcome: str = "ok") -> None:
+    """
+    LLM呼び出し1回分を記録する。usage はレスポンスの usage (prompt_tokens / completion_tokens を持つもの)。
+    """
+    LLM_REQUESTS.inc(kind=kind, model=model, outcome=outcome)
+    if outcome != "cache_hit":
+        LLM_SECONDS.observe(seconds, kind=kind, model=model)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind=kind, model=model, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind=kind, model=model, type="completion")
+    logger.debug("llm_call", extra={
+        "kind": kind, "model": model, "seconds": round(seconds, 4), "outcome": outcome,
+        "promptTokens": prompt_tokens, "completionTokens": completion_tokens
+    })
+
+def render() -> str:
+    return registry.render()
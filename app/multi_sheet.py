@@ -0,0 +1,281 @@
+# app/multi_sheet.py
+#
+# 複数シートのxlsx (地域ごとに1シートなど) を扱う。
+#   - シートごとに別プロセスで読み込むので、全体の時間はシートの合計ではなく一番大きいシートの時間に近くなる
+#   - convert_sheets_to_json : シートごとのプレビュー (先頭100行)
+#   - open_sheets_row_stream : 同じマッピングで変換できるシートを1本の行ストリームにつなげる
+#                              (2枚目以降のシートはヘッダー行までを捨て、1枚目のヘッダーだけを残す)
+#                              2枚目以降は一時ファイルに読み出すので、その分のディスク容量が要る
+# 1シートのファイルは従来どおり file_to_json の関数で読む。
+
+import os
+import pickle
+import shutil
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.file_to_json import (
+    DEFAULT_CHUNK_SIZE, MAX_FILE_SIZE, convert_xlsx_to_json, open_xlsx_row_stream, open_xlsx_workbook
+)
+
+SHEET_PARSE_WORKERS = int(os.environ.get("SHEET_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _mp_context():
+    # スレッドを抱えた Flask プロセスを直接 fork しないよう、使えるなら forkserver を使う
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=SHEET_PARSE_WORKERS, mp_context=_mp_context())
+        return _executor
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    # 壊れたプールは使い続けられないので、次の呼び出しで作り直す
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def list_xlsx_sheets(file_path: str) -> Dict[str, Any]:
+    """
+    シート名の一覧を {"status": "success", "sheetNames": [...]} で返す。
+    """
+    if not file_path.lower().endswith('.xlsx'):
+        return {"status": "error", "message": f"拡張子が .xlsx ではありません: {file_path}"}
+    if os.path.getsize(file_path) > MAX_FILE_SIZE:
+        return {"status": "error", "message": "ファイルサイズが500MBを超えています。"}
+    try:
+        wb = open_xlsx_workbook(file_path)
+    except Exception as e:
+        return {"status": "error", "message": f"ファイルが破損しているか、読み込めません: {str(e)}"}
+    try:
+        return {"status": "success", "sheetNames": list(wb.sheetnames)}
+    finally:
+        wb.close()
+
+def map_sheets(func: Callable, file_path: str, sheet_names: List[str], *args) -> List[Any]:
+    """
+    func(file_path, sheet_name, *args) をシートごとに別プロセスで実行し、結果をシート順のリストで返す。
+    func はワーカープロセスから import できるモジュールの関数であること。
+    1シートだけならプロセスを使わずにその場で実行する。
+    ワーカープロセスが異常終了した (メモリ不足で kill された等) 場合はプールを作り直すことにして、
+    全シート分の {"status": "error", "message": ..., "sheetName": ...} を返す。
+    """
+    if len(sheet_names) <= 1 or SHEET_PARSE_WORKERS <= 1:
+        return [func(file_path, name, *args) for name in sheet_names]
+    executor = _get_executor()
+    futures = []
+    try:
+        futures = [executor.submit(func, file_path, name, *args) for name in sheet_names]
+        return [f.result() for f in futures]
+    except BrokenProcessPool as e:
+        _discard_executor(executor)
+        message = f"シートを読み込むプロセスが異常終了しました (メモリ不足の可能性があります): {str(e)}"
+        return [{"status": "error", "message": message, "sheetName": name} for name in sheet_names]
+    finally:
+        for f in futures:
+            f.cancel()
+
+# --- ワーカープロセスで実行する関数 ---
+
+def _preview_sheet(file_path: str, sheet_name: str, limit_rows: bool) -> Dict[str, Any]:
+    result = convert_xlsx_to_json(file_path, limit_rows=limit_rows, sheet_name=sheet_name)
+    result["sheetName"] = sheet_name
+    return result
+
+def _spool_sheet(file_path: str, sheet_name: str, chunk_size: int, targets: Dict[str, tuple]) -> Dict[str, Any]:
+    """
+    シートを全行読み、チャンクごとに pickle して一時ファイルに書き出す。
+    targets は {シート名: (一時ファイルのパス, ヘッダー行の番号)}。
+    連結前のチェック用に、ヘッダー行の値も返す。
+    """
+    spool_path, header_index = targets[sheet_name]
+    stream = open_xlsx_row_stream(file_path, chunk_size, sheet_name=sheet_name)
+    if stream["status"] != "success":
+        return stream
+    header_row = None
+    row_count = 0
+    try:
+        with open(spool_path, "wb") as f:
+            for chunk in stream["rowChunks"]:
+                if header_row is None and row_count <= header_index < row_count + len(chunk):
+                    header_row = chunk[header_index - row_count]
+                row_count += len(chunk)
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        return {"status": "error", "message": f"ファイルが破損しているか、読み込めません: {str(e)}"}
+    return {"status": "success", "rowCount": row_count, "headerRow": header_row}
+
+# --- 呼び出し側の関数 ---
+
+def _resolve_sheet_names(file_path: str, sheet_names: Optional[List[str]]) -> Dict[str, Any]:
+    listed = list_xlsx_sheets(file_path)
+    if listed["status"] != "success":
+        return listed
+    if sheet_names is None:
+        return listed
+    missing = [name for name in sheet_names if name not in listed["sheetNames"]]
+    if missing:
+        return {"status": "error", "message": f"シートが見つかりません: {', '.join(missing)}"}
+    if not sheet_names:
+        return {"status": "error", "message": "シートが指定されていません"}
+    if len(set(sheet_names)) != len(sheet_names):
+        return {"status": "error", "message": "同じシートが複数回指定されています"}
+    return {"status": "success", "sheetNames": list(sheet_names)}
+
+def convert_sheets_to_json(file_path: str, limit_rows: bool = True, sheet_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    シートごとに convert_xlsx_to_json() を別プロセスで実行し、
+    {"status": "success", "fileType": "xlsx", "sheets": [{"sheetName": ..., "rowData": [...]}, ...]} を返す。
+    sheet_names を省略すると全シートを読む。
+    """
+    resolved = _resolve_sheet_names(file_path, sheet_names)
+    if resolved["status"] != "success":
+        return resolved
+
+    sheets = []
+    for result in map_sheets(_preview_sheet, file_path, resolved["sheetNames"], limit_rows):
+        if result["status"] != "success":
+            return {"status": "error", "message": f"{result['sheetName']}: {result['message']}"}
+        sheets.append({"sheetName": result["sheetName"], "rowData": result["rowData"]})
+    return {"status": "success", "fileType": "xlsx", "sheets": sheets}
+
+def header_key(row: Optional[list]) -> tuple:
+    """
+    ヘッダー行を比較用に正規化する (前後の空白と末尾の空セルは無視)。
+    """
+    values = ["" if v is None else str(v).strip() for v in (row or [])]
+    while values and values[-1] == "":
+        values.pop()
+    return tuple(values)
+
+def _read_spool(spool_path: str, skip_rows: int) -> Iterator[List[list]]:
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                break
+            if skip_rows:
+                dropped = min(skip_rows, len(chunk))
+                chunk = chunk[dropped:]
+                skip_rows -= dropped
+            if chunk:
+                yield chunk
+
+def _spool_bytes_estimate(file_path: str) -> int:
+    """
+    シートを一時ファイルに書き出すのに必要なディスク容量の目安 (バイト)。
+    xlsx 内のワークシートXMLの展開後のサイズの合計を使う。一時ファイルはセルの値だけを pickle するので、
+    通常はこれより小さい (セル参照・書式の分だけXMLのほうが大きい)。
+    """
+    try:
+        with zipfile.ZipFile(file_path) as zf:
+            return sum(
+                info.file_size for info in zf.infolist()
+                if info.filename.startswith("xl/worksheets/") and info.filename.endswith(".xml")
+            )
+    except (OSError, zipfile.BadZipFile):
+        return 0
+
+def open_sheets_row_stream(
+    file_path: str,
+    sheet_names: List[str],
+    header_rows: Optional[Dict[str, int]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    複数のシートを1本の行ストリームとして返す (open_row_stream と同じ形)。
+    1枚目のシートは全行をそのまま流し、2枚目以降は header_rows[シート名] (ヘッダー行の番号、省略時は0) までの行を捨てる。
+    こうすると変換処理からは「1枚目のヘッダーの下に全シートのデータが続く1枚のシート」に見える。
+
+    1枚目のシートはこのプロセスでそのまま読みながら流す。2枚目以降は別プロセスで一時ファイルに読み出しておき、
+    1枚目を流し終えてから順番に流す (読み終えた一時ファイルはすぐに消す)。
+    一時ファイルには最大で2枚目以降のシートの全行が載るので、書き出す前に一時ディレクトリの空き容量を
+    _spool_bytes_estimate() と比べ、足りなければエラーにする。
+    ヘッダー行の値がシート間で異なる (列の並びが違う) 場合は、同じマッピングで変換できないのでエラーにする。
+    """
+    header_rows = header_rows or {}
+    resolved = _resolve_sheet_names(file_path, sheet_names)
+    if resolved["status"] != "success":
+        return resolved
+    sheet_names = resolved["sheetNames"]
+    header_indexes = [max(0, int(header_rows.get(name, 0))) for name in sheet_names]
+
+    # 1枚目: ヘッダー行までを先に読んでおき (比較用)、残りは変換しながら読む
+    first = open_xlsx_row_stream(file_path, chunk_size, sheet_name=sheet_names[0])
+    if first["status"] != "success":
+        return first
+    first_chunks = first["rowChunks"]
+    buffered = []
+    first_header = None
+    row_count = 0
+    try:
+        for chunk in first_chunks:
+            buffered.append(chunk)
+            if row_count <= header_indexes[0] < row_count + len(chunk):
+                first_header = header_key(chunk[header_indexes[0] - row_count])
+                break
+            row_count += len(chunk)
+    except Exception as e:
+        first_chunks.close()
+        return {"status": "error", "message": f"{sheet_names[0]}: ファイルが破損しているか、読み込めません: {str(e)}"}
+
+    spool_dir = tempfile.TemporaryDirectory(prefix="sheets_")
+
+    def fail(message):
+        first_chunks.close()
+        spool_dir.cleanup()
+        return {"status": "error", "message": message}
+
+    needed = _spool_bytes_estimate(file_path)
+    free = shutil.disk_usage(spool_dir.name).free
+    if len(sheet_names) > 1 and needed > free:
+        return fail(
+            f"一時ファイル用の空き容量が足りません (必要: 約{needed // (1024 * 1024)}MB、"
+            f"空き: {free // (1024 * 1024)}MB、場所: {tempfile.gettempdir()})"
+        )
+
+    later_names = sheet_names[1:]
+    spool_paths = [os.path.join(spool_dir.name, f"{i}.pickle") for i in range(1, len(sheet_names))]
+    targets = dict(zip(later_names, zip(spool_paths, header_indexes[1:])))
+    results = map_sheets(_spool_sheet, file_path, later_names, chunk_size, targets)
+
+    for name, result in zip(later_names, results):
+        if result["status"] != "success":
+            return fail(f"{name}: {result['message']}")
+        if header_key(result["headerRow"]) != first_header:
+            return fail(f"シート '{name}' のヘッダー行が '{sheet_names[0]}' と異なるため連結できません")
+
+    def row_chunks():
+        try:
+            yield from buffered
+            yield from first_chunks
+            for path, header_index in zip(spool_paths, header_indexes[1:]):
+                # 2枚目以降はヘッダー行 (とその上のタイトル行など) を捨てる
+                yield from _read_spool(path, header_index + 1)
+                os.remove(path)
+        finally:
+            first_chunks.close()
+            spool_dir.cleanup()
+
+    return {
+        "status": "success",
+        "fileType": "xlsx",
+        "sheetNames": sheet_names,
+        # 1枚目は流しながら読むので、事前に行数が分かるのは2枚目以降だけ
+        "rowCounts": {name: result["rowCount"] for name, result in zip(later_names, results)},
+        "rowChunks": row_chunks()
+    }
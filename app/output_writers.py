@@ -0,0 +1,215 @@
+# app/output_writers.py
+#
+# 変換結果を少しずつファイルへ書き出すライター群。
+# どのライターも write_records(records) / close() を持ち、with 文で使える。
+#   json    : JSON配列 (json.dump(..., indent=2) と同じ内容)
+#   ndjson  : 1行1レコードのJSON
+#   csv     : 先頭レコードのキーを見出しにしたCSV (Excelで開けるようBOM付きUTF-8)
+#   parquet : 列指向のParquet (pyarrow が必要。一定件数ごとに row group として書く)
+# gzip=True で json/ndjson/csv を gzip 圧縮する (parquet はファイル内部の圧縮方式を gzip にする)。
+
+import csv
+import gzip
+import json
+from typing import Any, Dict, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet出力を使わない環境では不要
+    pa = None
+    pq = None
+
+# 形式名 -> (拡張子, MIMEタイプ)
+OUTPUT_FORMATS = {
+    "json": (".json", "application/json"),
+    "ndjson": (".ndjson", "application/x-ndjson"),
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+PARQUET_ROW_GROUP_SIZE = 50000
+
+def output_path(base_path: str, fmt: str, use_gzip: bool = False) -> str:
+    """
+    拡張子無しのパスに形式ごとの拡張子を付ける (gzip の場合は .gz も付ける)。
+    """
+    ext = OUTPUT_FORMATS[fmt][0]
+    return base_path + ext + (".gz" if use_gzip and fmt != "parquet" else "")
+
+def output_mimetype(fmt: str, use_gzip: bool = False) -> str:
+    if use_gzip and fmt != "parquet":
+        return "application/gzip"
+    return OUTPUT_FORMATS[fmt][1]
+
+def _open_text(path: str, use_gzip: bool, encoding: str = "utf-8"):
+    if use_gzip:
+        return gzip.open(path, "wt", encoding=encoding, newline="")
+    return open(path, "w", encoding=encoding, newline="")
+
+class _BaseWriter:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class JsonArrayWriter(_BaseWriter):
+    """
+    変換結果を JSON 配列としてファイルへ少しずつ書き出す。
+    出力内容は json.dump(records, f, ensure_ascii=False, indent=2) と同じになる。
+    """
+
+    def __init__(self, path: str, use_gzip: bool = False):
+        self.path = path
+        self._f = _open_text(path, use_gzip)
+        self._count = 0
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            body = json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            self._f.write(("[\n  " if self._count == 0 else ",\n  ") + body)
+            self._count += 1
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        self._f.write("\n]" if self._count else "[]")
+        self._f.close()
+
+class NdjsonWriter(_BaseWriter):
+    def __init__(self, path: str, use_gzip: bool = False):
+        self.path = path
+        self._f = _open_text(path, use_gzip)
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        self._f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+
+class CsvWriter(_BaseWriter):
+    """
+    先頭レコードのキー順を列順とする。None は空欄として書く。
+    """
+
+    def __init__(self, path: str, use_gzip: bool = False):
+        self.path = path
+        self._f = _open_text(path, use_gzip, encoding="utf-8-sig")
+        self._writer = None
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._f, fieldnames=list(records[0].keys()), extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerows(records)
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+
+class ParquetWriter(_BaseWriter):
+    """
+    レコードを PARQUET_ROW_GROUP_SIZE 件ずつ列に詰め替えて row group として書く。
+    列はすべて文字列型 (null 可) とする。
+    """
+
+    def __init__(self, path: str, use_gzip: bool = False):
+        if pa is None:
+            raise RuntimeError("Parquet出力には pyarrow が必要です (pip install pyarrow)")
+        self.path = path
+        self._compression = "gzip" if use_gzip else "snappy"
+        self._writer = None
+        self._fields = None
+        self._pending: List[Dict[str, Any]] = []
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        self._pending.extend(records)
+        if len(self._pending) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        if self._fields is None:
+            self._fields = list(self._pending[0].keys())
+            schema = pa.schema([(f, pa.string()) for f in self._fields])
+            self._writer = pq.ParquetWriter(self.path, schema, compression=self._compression)
+        columns = {
+            f: pa.array([None if r.get(f) is None else str(r.get(f)) for r in self._pending], type=pa.string())
+            for f in self._fields
+        }
+        self._writer.write_table(pa.table(columns))
+        self._pending = []
+
+    def close(self) -> None:
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        elif self._fields is None:
+            # 0件の場合も読み込めるファイルを残す
+            pq.write_table(pa.table({}), self.path)
+            self._fields = []
+
+_WRITERS = {
+    "json": JsonArrayWriter,
+    "ndjson": NdjsonWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+}
+
+def open_writer(path: str, fmt: str, use_gzip: bool = False):
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported output format: {fmt} (supported: {', '.join(_WRITERS)})")
+    return _WRITERS[fmt](path, use_gzip=use_gzip)
+
+class MultiWriter(_BaseWriter):
+    """複数のライターへ同じレコードを書き出す"""
+
+    def __init__(self, writers: list):
+        self.writers = writers
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        for writer in self.writers:
+            writer.write_records(records)
+
+    def close(self) -> None:
+        for writer in self.writers:
+            writer.close()
+
+def iter_records(path: str, fmt: str, chunk_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    json / ndjson 形式で書き出した結果をチャンク単位で読み戻す (形式変換用)。
+    """
+    from app.file_to_json import iter_json_items
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        if fmt == "json":
+            items = iter_json_items(f)
+        elif fmt == "ndjson":
+            items = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Cannot read records back from format: {fmt}")
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def convert_output(src_path: str, src_fmt: str, dst_path: str, dst_fmt: str, use_gzip: bool = False) -> int:
+    """
+    書き出し済みの結果を別の形式へ変換する。全件をメモリに載せずチャンク単位で処理する。
+    """
+    count = 0
+    with open_writer(dst_path, dst_fmt, use_gzip=use_gzip) as writer:
+        for records in iter_records(src_path, src_fmt):
+            writer.write_records(records)
+            count += len(records)
+    return count
@@ -0,0 +1,123 @@
+# app/prompt_sampling.py
+#
+# LLMプロンプトに埋め込む rowData を、トークン予算に収まるよう間引く。
+#   1. トークン数を概算し、予算内ならそのまま使う
+#   2. 長いセルを切り詰める
+#   3. 先頭〜ヘッダー行までは必ずそのまま残す (headerRowIndex がずれないように)
+#   4. 残りの行から完全重複・数字違いだけの準重複を除く
+#   5. 全列に少なくとも1つ値が入るよう行を選び、その後セル種類のパターンごとに満遍なく追加する
+
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+from app.llm_gateway import estimate_tokens
+from app.header_detector import cell_kind
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 6000))
+PROMPT_MAX_CELL_CHARS = int(os.environ.get("PROMPT_MAX_CELL_CHARS", 80))
+MIN_LEADING_ROWS = 5  # ヘッダー位置が分からない場合でも必ず残す先頭行数
+
+_DIGITS_RE = re.compile(r"\d+")
+
+def _truncate_row(row: list, max_chars: int) -> list:
+    return [
+        value[:max_chars] + "…" if isinstance(value, str) and len(value) > max_chars else value
+        for value in row
+    ]
+
+def _row_tokens(row: list) -> int:
+    return estimate_tokens(json.dumps(row, ensure_ascii=False, default=str)) + 1
+
+def _near_duplicate_key(row: list) -> tuple:
+    # 数字だけが違う行 (連番・金額違いなど) は同じ行とみなす
+    return tuple(_DIGITS_RE.sub("0", str(v).strip().lower()) if v is not None else None for v in row)
+
+def _shape_key(row: list) -> tuple:
+    return tuple(cell_kind(v) for v in row)
+
+def _is_filled(value: Any) -> bool:
+    return value is not None and str(value).strip() != ""
+
+def sample_row_data(rowData: List[list], keep_until: int = -1,
+                    token_budget: Optional[int] = None,
+                    max_cell_chars: Optional[int] = None) -> Dict[str, Any]:
+    """
+    rowData をトークン予算内に間引いて返す。
+
+    keep_until までの行 (ヘッダー行を含む) と先頭 MIN_LEADING_ROWS 行は必ず残し、順番も変えない。
+    戻り値:
+      {"rowData": 間引き後の行, "rowIndices": 各行の元のインデックス,
+       "tokens": 間引き後の概算トークン数, "originalTokens": 元の概算トークン数, "sampled": bool}
+    """
+    token_budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    max_cell_chars = PROMPT_MAX_CELL_CHARS if max_cell_chars is None else max_cell_chars
+
+    original_tokens = estimate_tokens(json.dumps(rowData, ensure_ascii=False, default=str))
+    if original_tokens <= token_budget:
+        return {
+            "rowData": rowData,
+            "rowIndices": list(range(len(rowData))),
+            "tokens": original_tokens,
+            "originalTokens": original_tokens,
+            "sampled": False
+        }
+
+    rows = [_truncate_row(row, max_cell_chars) for row in rowData]
+    leading = min(len(rows), max(keep_until + 1, MIN_LEADING_ROWS))
+    selected = list(range(leading))
+    used = sum(_row_tokens(rows[i]) for i in selected)
+
+    # 重複・準重複を除いた残りの候補
+    seen = {_near_duplicate_key(rows[i]) for i in selected}
+    candidates = []
+    for i in range(leading, len(rows)):
+        key = _near_duplicate_key(rows[i])
+        if key not in seen:
+            seen.add(key)
+            candidates.append(i)
+
+    def try_add(i: int) -> bool:
+        nonlocal used
+        cost = _row_tokens(rows[i])
+        if used + cost > token_budget:
+            return False
+        selected.append(i)
+        used += cost
+        return True
+
+    # 列カバレッジ: 値が入っている列を、まだ値を持たない列が多く埋まる行から順に選ぶ
+    covered = {j for i in selected for j, v in enumerate(rows[i]) if _is_filled(v)}
+    fillable = {j for i in candidates for j, v in enumerate(rows[i]) if _is_filled(v)} - covered
+    remaining = list(candidates)
+    while fillable:
+        best = max(remaining, key=lambda i: len(fillable & {j for j, v in enumerate(rows[i]) if _is_filled(v)}), default=None)
+        gain = {j for j, v in enumerate(rows[best]) if _is_filled(v)} & fillable if best is not None else set()
+        if not gain or not try_add(best):
+            break
+        remaining.remove(best)
+        fillable -= gain
+
+    # 層化抽出: セル種類のパターンごとにグループ分けし、各グループから順番に1行ずつ取る
+    groups: Dict[tuple, List[int]] = {}
+    for i in remaining:
+        groups.setdefault(_shape_key(rows[i]), []).append(i)
+    queues = list(groups.values())
+    while queues:
+        next_queues = []
+        for queue in queues:
+            if try_add(queue[0]) and len(queue) > 1:
+                next_queues.append(queue[1:])
+        if used >= token_budget:
+            break
+        queues = next_queues
+
+    selected.sort()
+    return {
+        "rowData": [rows[i] for i in selected],
+        "rowIndices": selected,
+        "tokens": used,
+        "originalTokens": original_tokens,
+        "sampled": True
+    }
@@ -0,0 +1,226 @@
+# app/remap_interpreter.py
+#
+# /api/remap の指示のうち、よくある単純な編集 (割り当て・解除・入れ替え) をLLMを使わずに適用する。
+# 解釈できない指示だけ call_mapping_refine (gpt-4o) に回す。
+#
+#   割り当て: "map column 3 to Rank" / "set Rank to column C" / "列3をRankに" / "3列目はランク" / "「営業」をSalesPicに"
+#   解除    : "unmap SalesPic" / "remove column 3" / "SalesPicを外して" / "列3のマッピングを解除"
+#   入れ替え: "swap Rank and SalesPic" / "列2と列5を入れ替えて"
+# 「、」「;」や改行で区切って複数の指示を書ける (1つでも解釈できなければ全体をLLMに回す)。
+#
+# 列の指定:
+#   "column 3" / "col 3" / "列3" / "列Index 3" … 画面に表示される columnIndex (0始まり)
+#   "3列目" / "3rd column"                      … 左から数えた順番 (1始まり)
+#   "C列" / "column C"                           … Excel の列記号
+#   「顧客名」 / "顧客名" / 顧客名列              … columnName
+
+import os
+import re
+import copy
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.code_generation import REQUIRED_FIELDS, OPTIONAL_FIELDS
+
+REMAP_LOCAL_ENABLED = os.environ.get("REMAP_LOCAL_ENABLED", "1") != "0"
+
+ALL_FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+
+# 項目名の別名 (小文字・NFKC 正規化後の値で引く)
+FIELD_ALIASES = {
+    "distributorCode": ["distributor code", "販売店コード", "ディストリビューターコード", "顧客コード", "得意先コード"],
+    "CustomerName": ["customer name", "顧客名", "得意先名", "会社名"],
+    "AccountNumber": ["account number", "アカウント番号", "口座番号"],
+    "Rank": ["ランク"],
+    "SalesPic": ["sales pic", "営業担当", "担当営業"],
+    "PartsSalesPic": ["parts sales pic", "部品担当", "部品営業担当"],
+    "ServicePic": ["service pic", "サービス担当"],
+    "BillingAddress1": ["billing address", "billing address1", "請求先住所"],
+}
+_FIELD_LOOKUP = {f.lower(): f for f in ALL_FIELDS}
+_FIELD_LOOKUP.update({alias.lower(): f for f, aliases in FIELD_ALIASES.items() for alias in aliases})
+
+_CLAUSE_SPLIT = re.compile(r"[、,;\n。]+")
+_POLITE_SUFFIX = re.compile(
+    r"(?:して(?:ください|下さい|ほしい|欲しい)?|してくれ|ください|下さい|お願いします|お願い|please|pls)+$"
+)
+_POLITE_PREFIX = re.compile(r"^(?:please|pls|could you|can you)\s+")
+_TRAILING_PUNCT = re.compile(r"[.!?]+$")
+
+# (操作, 正規表現)。上から順に試し、オペランドが解決できたものを採用する
+_PATTERNS: List[Tuple[str, re.Pattern]] = [(op, re.compile(p)) for op, p in [
+    ("swap", r"^swap\s+(?P<a>.+?)\s+(?:and|with|<->|↔)\s+(?P<b>.+)$"),
+    ("swap", r"^(?P<a>.+?)\s*と\s*(?P<b>.+?)\s*(?:を|の(?:マッピング|割り当て|割当)を)?\s*(?:入れ替え|入れかえ|いれかえ|交換|スワップ)(?:る|て)?$"),
+    ("unassign", r"^(?:unmap|unassign|remove|clear|drop|delete)\s+(?:the\s+)?(?:mapping\s+(?:for|of)\s+)?(?P<a>.+?)(?:\s+mapping)?$"),
+    ("unassign", r"^(?P<a>.+?)\s*(?:の(?:マッピング|割り当て|割当))?\s*(?:を|は)\s*(?:外す?|外し|はずす?|はずし|解除|削除|消す?|消し|クリア|未割り当てに|未割当に|マッピングしない|不要|なし|無し|空に)(?:する|して)?$"),
+    ("assign", r"^(?:map|assign|set|use|change)\s+(?P<a>.+?)\s+(?:to|as|for|=)\s+(?P<b>.+)$"),
+    ("assign", r"^(?P<a>.+?)(?:\s*(?:=>|->|→|=)\s*|\s+(?:is|should be)\s+)(?P<b>.+)$"),
+    ("assign", r"^(?P<a>.+?)\s*(?:を|は)\s*(?P<b>.+?)\s*(?:に|へ|として)?\s*(?:マッピング|割り当て|割当|割りあて|設定|変更|対応付け|紐付け|紐づけ)?(?:する|して|し)?$"),
+]]
+
+_COLUMN_INDEX = re.compile(r"^(?:column|col|列)\s*(?:index|インデックス)?\s*[#番]?\s*(\d+)$")
+_COLUMN_ORDINAL = re.compile(r"^(?:(\d+)\s*(?:列目|番目の列|番目)|(?:the\s+)?(\d+)(?:st|nd|rd|th)\s+column)$")
+_COLUMN_LETTER = re.compile(r"^(?:([a-z]{1,3})\s*列|column\s+([a-z]{1,3}))$")
+_QUOTED = re.compile(r"^[「『\"'](.+)[」』\"']$")
+_NAME_SUFFIX = re.compile(r"^(.+?)\s*(?:の列|列|\s+column)$")
+_FIELD_PREFIX = re.compile(r"^(?:field|項目)\s*(.+)$")
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").strip().lower()
+
+def _letters_to_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + (ord(ch) - ord("a") + 1)
+    return index - 1
+
+class _Mapping:
+    """
+    mappingResponse["mapping"] の操作用。columnIndex → エントリ の索引を持つ。
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.by_index = {e.get("columnIndex"): e for e in entries}
+        self.by_name = {}
+        for e in entries:
+            if e.get("columnName"):
+                self.by_name.setdefault(_normalize(str(e["columnName"])), e["columnIndex"])
+
+    def resolve_column(self, text: str) -> Optional[int]:
+        quoted = _QUOTED.match(text)
+        if quoted:
+            return self.by_name.get(quoted.group(1).strip())
+        m = _COLUMN_INDEX.match(text)
+        if m:
+            index = int(m.group(1))
+        else:
+            m = _COLUMN_ORDINAL.match(text)
+            if m:
+                index = int(m.group(1) or m.group(2)) - 1
+            else:
+                m = _COLUMN_LETTER.match(text)
+                if m:
+                    index = _letters_to_index(m.group(1) or m.group(2))
+                else:
+                    index = self.by_name.get(text)
+                    if index is None:
+                        named = _NAME_SUFFIX.match(text)
+                        index = self.by_name.get(named.group(1)) if named else None
+        return index if index in self.by_index else None
+
+    def columns_of(self, field: str) -> List[int]:
+        return [e["columnIndex"] for e in self.entries if e.get("matchedField") == field]
+
+    def assign(self, index: int, field: str) -> None:
+        for e in self.entries:
+            if e.get("matchedField") == field and e["columnIndex"] != index:
+                e["matchedField"] = None
+                e["confidence"] = 0.0
+        self.by_index[index]["matchedField"] = field
+        self.by_index[index]["confidence"] = 1.0
+
+    def unassign(self, index: int) -> None:
+        self.by_index[index]["matchedField"] = None
+        self.by_index[index]["confidence"] = 0.0
+
+def resolve_field(text: str) -> Optional[str]:
+    """
+    項目名 (顧客マスタのフィールド名または別名) を正式なフィールド名にする。
+    """
+    prefixed = _FIELD_PREFIX.match(text)
+    if prefixed:
+        text = prefixed.group(1).strip()
+    quoted = _QUOTED.match(text)
+    if quoted:
+        text = quoted.group(1).strip()
+    return _FIELD_LOOKUP.get(text)
+
+def _apply_clause(mapping: _Mapping, clause: str) -> Optional[str]:
+    """
+    1つの指示を適用し、適用した内容の説明を返す。解釈できなければ何も変更せずに None を返す。
+    """
+    for op, pattern in _PATTERNS:
+        m = pattern.match(clause)
+        if not m:
+            continue
+        a = m.group("a").strip()
+        b = m.group("b").strip() if "b" in pattern.groupindex else None
+
+        if op == "assign":
+            # 「列 → 項目」「項目 → 列」のどちらの順でも書けるので両方試す
+            for column_text, field_text in ((a, b), (b, a)):
+                index, field = mapping.resolve_column(column_text), resolve_field(field_text)
+                if index is not None and field is not None:
+                    mapping.assign(index, field)
+                    return f"{field} ← 列{index}"
+
+        elif op == "unassign":
+            field = resolve_field(a)
+            if field is not None:
+                for index in mapping.columns_of(field):
+                    mapping.unassign(index)
+                return f"{field} の割り当てを解除"
+            index = mapping.resolve_column(a)
+            if index is not None:
+                mapping.unassign(index)
+                return f"列{index} の割り当てを解除"
+
+        elif op == "swap":
+            field_a, field_b = resolve_field(a), resolve_field(b)
+            if field_a is not None and field_b is not None:
+                columns_a, columns_b = mapping.columns_of(field_a), mapping.columns_of(field_b)
+                for index in columns_a + columns_b:
+                    mapping.unassign(index)
+                for index in columns_b:
+                    mapping.assign(index, field_a)
+                for index in columns_a:
+                    mapping.assign(index, field_b)
+                return f"{field_a} と {field_b} を入れ替え"
+            index_a, index_b = mapping.resolve_column(a), mapping.resolve_column(b)
+            if index_a is not None and index_b is not None:
+                entry_a, entry_b = mapping.by_index[index_a], mapping.by_index[index_b]
+                for key in ("matchedField", "confidence"):
+                    entry_a[key], entry_b[key] = entry_b.get(key), entry_a.get(key)
+                return f"列{index_a} と 列{index_b} の割り当てを入れ替え"
+    return None
+
+def missing_required_fields(entries: List[Dict[str, Any]]) -> List[str]:
+    mapped = {e.get("matchedField") for e in entries}
+    return [f for f in REQUIRED_FIELDS if f not in mapped]
+
+def interpret_instruction(original_mapping: Dict[str, Any], user_instruction: str) -> Optional[Dict[str, Any]]:
+    """
+    指示をローカルで解釈して適用できれば、call_mapping_refine() と同じ形の mappingResponse を返す。
+    解釈できない指示が1つでもあれば None を返す (呼び出し側でLLMに回す)。
+    original_mapping は変更しない。
+    """
+    if not isinstance(original_mapping, dict) or not isinstance(original_mapping.get("mapping"), list):
+        return None
+    clauses = []
+    for clause in _CLAUSE_SPLIT.split(_normalize(user_instruction)):
+        clause = _TRAILING_PUNCT.sub("", clause.strip()).strip()
+        clause = _POLITE_SUFFIX.sub("", _POLITE_PREFIX.sub("", clause)).strip()
+        if clause:
+            clauses.append(clause)
+    if not clauses:
+        return None
+
+    entries = copy.deepcopy(original_mapping["mapping"])
+    if not all(isinstance(e, dict) and isinstance(e.get("columnIndex"), int) for e in entries):
+        return None
+    mapping = _Mapping(entries)
+    applied = []
+    for clause in clauses:
+        description = _apply_clause(mapping, clause)
+        if description is None:
+            return None
+        applied.append(description)
+
+    return {
+        **original_mapping,
+        "status": "success",
+        "mapping": entries,
+        "missingRequiredFields": missing_required_fields(entries),
+        "additionalNotes": "指示をローカルで適用しました: " + " / ".join(applied)
+    }
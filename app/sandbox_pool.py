@@ -0,0 +1,328 @@
+# app/sandbox_pool.py
+#
+# LLMが生成した transform_data を、Flaskプロセスではなく常駐ワーカープロセスで実行するためのプール。
+# - ワーカーは起動しっぱなしにして (warm)、プロセス起動や import のコストは最初の1回だけ払う
+# - ワーカーはソースのハッシュごとにコンパイル済みの transform_data を保持するので、
+#   同じコードをチャンクごとに何度呼んでもコンパイルは1回
+# - 1回の呼び出しごとに CPU時間 (RLIMIT_CPU + SIGXCPU)、経過時間 (超えたらワーカーを kill して作り直す)、
+#   メモリ (RLIMIT_AS、実行後の最大RSSが上限を超えたワーカーは作り直す) の制限をかける
+# 暴走したコードやメモリを食い尽くすコードがあっても、Webプロセスは巻き込まれない。
+
+import os
+import atexit
+import hashlib
+import queue
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Optional
+
+try:
+    import resource
+    import signal
+except ImportError:  # Windows では resource が無いので制限なしで動かす
+    resource = None
+    signal = None
+
+SANDBOX_ENABLED = os.environ.get("TRANSFORM_SANDBOX", "1").lower() not in ("0", "false", "no")
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", os.cpu_count() or 1))  # 既定はコア数 (並列変換がコア数に比例する)
+SANDBOX_CPU_SECONDS = float(os.environ.get("SANDBOX_CPU_SECONDS", 60))     # 1回の呼び出しあたりのCPU時間
+SANDBOX_WALL_SECONDS = float(os.environ.get("SANDBOX_WALL_SECONDS", 120))  # 1回の呼び出しあたりの経過時間
+SANDBOX_MAX_MEMORY_MB = int(os.environ.get("SANDBOX_MAX_MEMORY_MB", 2048))  # 0 なら制限しない
+TRANSFORM_PARALLEL = os.environ.get("TRANSFORM_PARALLEL", "1").lower() not in ("0", "false", "no")  # チャンクを複数ワーカーで並列実行
+SANDBOX_CODE_CACHE_SIZE = 32  # ワーカーが保持するコンパイル済みコードの数
+
+class SandboxError(Exception):
+    """
+    サンドボックス内で生成コードの実行に失敗した。traceback はワーカー側のトレースバック文字列。
+    """
+    def __init__(self, message: str, traceback: str = ""):
+        super().__init__(message)
+        self.traceback = traceback
+
+class SandboxTimeout(SandboxError):
+    pass
+
+class SandboxCrashed(SandboxError):
+    pass
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:32]
+
+# ---------------------------------------------------------------------------
+# ワーカープロセス側
+# ---------------------------------------------------------------------------
+
+class _CpuTimeExceeded(BaseException):
+    """
+    生成コードの except Exception で握りつぶされないよう BaseException を継承する。
+    """
+
+_cpu_exceeded = False  # 実行中に SIGXCPU が届いたか (例外を握りつぶされても結果をエラーにする)
+
+def _on_sigxcpu(signum, frame):
+    global _cpu_exceeded
+    _cpu_exceeded = True
+    raise _CpuTimeExceeded()
+
+def _cpu_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def _set_cpu_soft_limit(seconds: Optional[float]) -> None:
+    # ハードリミットは変えない (一度下げると戻せないため)。ソフトリミットを超えると SIGXCPU が届く
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = resource.RLIM_INFINITY if seconds is None else int(_cpu_used() + seconds) + 1
+    if hard != resource.RLIM_INFINITY and soft != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _max_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux では KB 単位
+
+def _load_transform(cache: OrderedDict, code_hash: str, source: Optional[str]) -> Callable:
+    """
+    キャッシュ済みの transform_data を返すか、source を実行して作る。
+    キャッシュに無く source も無い場合は呼び出し側で判定する (_worker_main の "missing")。
+    source の実行中の例外 (モジュールの読み込み時の KeyError なども) はそのまま送出する。
+    """
+    if code_hash in cache:
+        cache.move_to_end(code_hash)
+        return cache[code_hash]
+    namespace = {}
+    exec(compile(source, "generated_transform.py", "exec"), namespace)
+    transform_func = namespace.get("transform_data")
+    if not callable(transform_func):
+        raise SandboxError("No transform_data in generated code")
+    cache[code_hash] = transform_func
+    while len(cache) > SANDBOX_CODE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return transform_func
+
+def _worker_main(conn, max_memory_mb: int) -> None:
+    """
+    ワーカープロセスのメインループ。
+    ("run", code_hash, source, mapping, rows, cpu_seconds) を受け取り、
+    ("ok", records, max_rss_mb) / ("error", message, traceback, max_rss_mb) / ("missing", code_hash) を返す。
+    """
+    global _cpu_exceeded
+    if resource is not None:
+        if max_memory_mb:
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+    cache = OrderedDict()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] == "stop":
+            return
+
+        _, code_hash, source, mapping, rows, cpu_seconds = message
+        if source is None and code_hash not in cache:
+            conn.send(("missing", code_hash))
+            continue
+        try:
+            transform_func = _load_transform(cache, code_hash, source)
+            _cpu_exceeded = False
+            if resource is not None and cpu_seconds:
+                _set_cpu_soft_limit(cpu_seconds)
+            try:
+                records = transform_func(mapping, rows)
+            finally:
+                if resource is not None and cpu_seconds:
+                    _set_cpu_soft_limit(None)
+            if _cpu_exceeded:
+                # 生成コードが _CpuTimeExceeded を捕まえて正常に返した場合も、途中までの結果は使わない
+                raise _CpuTimeExceeded()
+            conn.send(("ok", records, _max_rss_mb()))
+        except _CpuTimeExceeded:
+            conn.send(("error", f"CPU time limit exceeded ({cpu_seconds}s)", "", _max_rss_mb()))
+        except SandboxError as e:
+            conn.send(("error", str(e), "", _max_rss_mb()))
+        except MemoryError:
+            conn.send(("error", f"Memory limit exceeded ({max_memory_mb}MB)", "", float("inf")))
+        except Exception as e:
+            # 結果が pickle できない場合もここに来る (send は pickle してから書き込むので途中まで送られることはない)
+            conn.send(("error", f"{type(e).__name__}: {e}", traceback.format_exc(), _max_rss_mb()))
+
+# ---------------------------------------------------------------------------
+# Webプロセス側
+# ---------------------------------------------------------------------------
+
+def _mp_context():
+    # スレッドを抱えた Flask プロセスを直接 fork しないよう、使えるなら forkserver を使う
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+class _Worker:
+    def __init__(self, ctx, max_memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, max_memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.known_hashes = set()  # このワーカーにソースを送ったことがあるコード
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(("stop",))
+            self.process.join(timeout=2)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+class SandboxPool:
+    """
+    常駐ワーカープロセスのプール。スレッドセーフ。
+    run() は空いているワーカーを1つ借りて transform_data(mapping, rows) を実行し、結果を返す。
+    """
+
+    def __init__(
+        self,
+        size: int = SANDBOX_WORKERS,
+        cpu_seconds: float = SANDBOX_CPU_SECONDS,
+        wall_seconds: float = SANDBOX_WALL_SECONDS,
+        max_memory_mb: int = SANDBOX_MAX_MEMORY_MB
+    ):
+        self.size = max(1, size)
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.max_memory_mb = max_memory_mb
+        self._ctx = _mp_context()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._executor = None
+
+    def start(self) -> None:
+        """
+        ワーカーを起動しておく (サーバー起動時に呼べば最初のリクエストで待たない)。
+        呼ばなくても最初の run() で起動する。
+        """
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(_Worker(self._ctx, self.max_memory_mb))
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="sandbox")
+            self._started = True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            self._executor.shutdown(wait=True)
+            while not self._idle.empty():
+                self._idle.get_nowait().stop()
+
+    def _respawn(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        return _Worker(self._ctx, self.max_memory_mb)
+
+    def run(self, source: str, mapping: list, rows: list, wall_seconds: Optional[float] = None) -> list:
+        """
+        ワーカープロセスで transform_data(mapping, rows) を実行する。
+        失敗・CPU時間超過は SandboxError、経過時間超過は SandboxTimeout、
+        ワーカーが落ちた場合 (メモリ上限など) は SandboxCrashed を送出する。
+        """
+        self.start()
+        code_hash = source_hash(source)
+        timeout = wall_seconds or self.wall_seconds
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker = self._respawn(worker)
+
+            payload = source if code_hash not in worker.known_hashes else None
+            reply = self._call(worker, code_hash, payload, mapping, rows, timeout)
+            if reply[0] == "missing":
+                # ワーカー側のキャッシュから追い出されていたらソースを付けて送り直す
+                reply = self._call(worker, code_hash, source, mapping, rows, timeout)
+                if reply[0] == "missing":
+                    raise SandboxError("Sandbox worker did not accept the generated code")
+            worker.known_hashes.add(code_hash)
+
+            status = reply[0]
+            rss_mb = reply[-1]
+            if self.max_memory_mb and rss_mb > self.max_memory_mb:
+                worker = self._respawn(worker)  # 使い終わったメモリは返ってこないので作り直す
+            if status == "ok":
+                return reply[1]
+            worker.known_hashes.discard(code_hash)
+            raise SandboxError(reply[1], reply[2])
+        except (SandboxTimeout, SandboxCrashed):
+            worker = self._respawn(worker)
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def _call(self, worker: _Worker, code_hash: str, source: Optional[str], mapping: list, rows: list, timeout: float):
+        try:
+            worker.conn.send(("run", code_hash, source, mapping, rows, self.cpu_seconds))
+            if not worker.conn.poll(timeout):
+                raise SandboxTimeout(f"Transform timed out after {timeout}s")
+            return worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            raise SandboxCrashed(f"Sandbox worker died (exit code {worker.process.exitcode})")
+
+    def submit(self, source: str, mapping: list, rows: list) -> Future:
+        """
+        run() を非同期に実行して Future を返す。同時に実行されるのはワーカー数まで。
+        """
+        self.start()
+        return self._executor.submit(self.run, source, mapping, rows)
+
+    def submitter(self, source: str) -> Callable[[list, list], Future]:
+        """
+        submit(mapping, rows) の形で呼べる関数を返す。run_transform_parallel() に渡す。
+        """
+        def submit(mapping, rows):
+            return self.submit(source, mapping, rows)
+        return submit
+
+    def bind(self, source: str) -> Callable[[list, list], list]:
+        """
+        transform_data(mapping, row_data) と同じ形で呼べる関数を返す。
+        run_transform_in_chunks() などにそのまま渡せる。
+        """
+        def transform_data(mapping, row_data):
+            return self.run(source, mapping, row_data)
+        return transform_data
+
+sandbox_pool = SandboxPool()
+atexit.register(sandbox_pool.shutdown)
+
+def make_transform_func(source: str, code_obj=None) -> Callable[[list, list], list]:
+    """
+    生成コードの transform_data を呼び出す関数を返す。
+    TRANSFORM_SANDBOX が有効ならワーカープロセスで、無効なら従来どおりこのプロセスで exec して実行する。
+    """
+    if SANDBOX_ENABLED:
+        return sandbox_pool.bind(source)
+    namespace = {}
+    exec(code_obj if code_obj is not None else compile(source, "generated_transform.py", "exec"), namespace)
+    transform_func = namespace.get("transform_data")
+    if not callable(transform_func):
+        raise SandboxError("No transform_data in generated code")
+    return transform_func
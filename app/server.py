@@ -1,11 +1,33 @@
 import os
 import uuid
 import json    # ★ これを追加
-from flask import Flask, request, jsonify, send_file
+import time
+import logging
+import threading
+import traceback
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
 from app.main_processor import process_file_and_map  # 以前の会話で紹介された処理を想定
 from app.llm_api import call_mapping_refine  # これを忘れていないか？
-from openai import OpenAI
+from app.remap_interpreter import interpret_instruction, REMAP_LOCAL_ENABLED
+from app.code_cache import code_cache
+from app.jobs import job_manager, raise_if_cancelled, FINISHED_STATUSES
+from app.sandbox_pool import sandbox_pool, make_transform_func, SANDBOX_ENABLED, TRANSFORM_PARALLEL
+from app.chunked_upload import ChunkedUploadStore
+from app.ingest import ingest_file, load_sidecar
+from app.artifacts import (
+    ArtifactWriter, add_artifact_file, artifact_id_for, artifact_path, is_valid_artifact_id, latest_artifact_id,
+    load_manifest
+)
+from app.transform_compiler import compile_transform, compile_transform_source, can_compile, TRANSFORM_COMPILER_ENABLED
+from app.customer_schema import CustomerSchemaValidator, SCHEMA_VALIDATION_ENABLED, SCHEMA_VERSION
+from app import llm_gateway
+from app import metrics
+from app import streaming
+from app.log_setup import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "何か適当な秘密鍵"
@@ -18,6 +40,28 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
 
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # パスではなくルートのパターン (/api/jobs/<job_id> など) をラベルにして、系列が増え続けないようにする
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - started, method=request.method, endpoint=endpoint, status=response.status_code
+        )
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus 形式のメトリクス (app/metrics.py)。
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -30,28 +74,26 @@ def login():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    print(">>> /api/upload called")  # デバッグ用
     if 'file' not in request.files:
-        print("!!! No 'file' in request.files")
+        logger.warning("upload: no 'file' in request.files")
         return jsonify({"status": "error", "message": "ファイルが見つかりません"}), 400
 
     file = request.files['file']
-    print(f">>> Received file: {file.filename}")
 
     # ファイルサイズチェック
     file.seek(0, os.SEEK_END)
     file_size = file.tell()
     file.seek(0, 0)
-    print(f">>> File size: {file_size} bytes")
+    logger.debug("upload: received file", extra={"fileName": file.filename, "fileSize": file_size})
 
     if file_size > MAX_FILE_SIZE:
-        print("!!! File too large")
+        logger.warning("upload: file too large", extra={"fileName": file.filename, "fileSize": file_size})
         return jsonify({"status": "error", "message": "ファイルサイズが500MBを超えています。"}), 400
 
     filename = file.filename.lower()
     ALLOWED_EXTENSIONS = ['.xlsx', '.csv', '.json']
     if not any(filename.endswith(ext) for ext in ALLOWED_EXTENSIONS):
-        print(f"!!! Invalid extension for file: {filename}")
+        logger.warning("upload: invalid extension", extra={"fileName": filename})
         return jsonify({
             "status": "error",
             "message": "サポートされていない拡張子です。xlsx, csv, jsonのみ対応しています。"
@@ -61,20 +103,92 @@ def upload_file():
     new_filename = f"{unique_id}_{filename}"
     save_path = os.path.join(UPLOAD_FOLDER, new_filename)
 
-    print(f">>> Saving file to: {save_path}")
     try:
-        file.save(save_path)
+        with metrics.span("upload_save", fileSize=file_size):
+            file.save(save_path)
     except Exception as e:
-        print(f"!!! Error saving file: {e}")
+        logger.error("upload: error saving file: %s", e, extra={"savePath": save_path})
         return jsonify({"status": "error", "message": f"ファイル保存中にエラーが発生しました: {str(e)}"}), 500
 
-    print(">>> File saved successfully.")
+    logger.info("upload: file saved", extra={"savedFileName": new_filename, "fileSize": file_size})
     return jsonify({
         "status": "success",
         "message": "ファイルをアップロードしました",
-        "savedFileName": new_filename
+        "savedFileName": new_filename,
+        "ingestJobId": _start_ingest(save_path)
     })
 
+def _start_ingest(save_path):
+    """
+    アップロードされたファイルのプレビュー・統計をバックグラウンドで作成する (app/ingest.py)。
+    "ingest" ジョブは専用のワーカー (INGEST_WORKERS) で実行するので、analyze / codegen のジョブを待たせない。
+    ジョブが混み合っていて投入できなくても、解析時にファイルを直接読むので問題はない。
+    """
+    job = job_manager.submit("ingest", ingest_file, save_path)
+    return job.id if job else None
+
+@app.route('/api/files/<file_name>/meta', methods=['GET'])
+def file_meta(file_name):
+    """
+    取り込み処理で作成したシート一覧・行数・列の統計などを返す (プレビュー行は含めない)。
+    """
+    file_path = os.path.join(UPLOAD_FOLDER, os.path.basename(file_name))
+    if not os.path.exists(file_path):
+        return jsonify({"status": "error", "message": "ファイルが見つかりません"}), 404
+    meta = load_sidecar(file_path)
+    if meta is None:
+        return jsonify({"status": "pending", "message": "取り込み処理が完了していません"}), 202
+    meta = {k: v for k, v in meta.items() if k != "rowData"}
+    if "sheetData" in meta:
+        meta["sheetData"] = [{k: v for k, v in sheet.items() if k != "rowData"} for sheet in meta["sheetData"]]
+    return jsonify(meta), (200 if meta["status"] == "success" else 400)
+
+# ---------------------------------------------------------------------------
+# 分割アップロード: 大きなファイルをチャンクに分けて送り、途中で切れても続きから再開できる
+# ---------------------------------------------------------------------------
+
+chunked_uploads = ChunkedUploadStore(UPLOAD_FOLDER, MAX_FILE_SIZE)
+
+@app.route('/api/upload/init', methods=['POST'])
+def upload_init():
+    """
+    {"fileName": "...", "totalSize": バイト数, "sha256": "(任意)"} を受け取り uploadId を返す。
+    """
+    data = request.get_json() or {}
+    result, status_code = chunked_uploads.init(data.get("fileName"), data.get("totalSize"), data.get("sha256"))
+    return jsonify(result), status_code
+
+@app.route('/api/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    リクエストボディ (application/octet-stream) を ?offset= の位置に追記する。
+    """
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return jsonify({"status": "error", "message": "offset が指定されていません"}), 400
+    result, status_code = chunked_uploads.append(upload_id, offset, request.stream, request.content_length)
+    return jsonify(result), status_code
+
+@app.route('/api/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    result, status_code = chunked_uploads.status(upload_id)
+    return jsonify(result), status_code
+
+@app.route('/api/upload/<upload_id>/finalize', methods=['POST'])
+def upload_finalize(upload_id):
+    data = request.get_json(silent=True) or {}
+    with metrics.span("upload_finalize"):
+        result, status_code = chunked_uploads.finalize(upload_id, data.get("sha256"))
+    if status_code == 200:
+        result["ingestJobId"] = _start_ingest(os.path.join(UPLOAD_FOLDER, result["savedFileName"]))
+    return jsonify(result), status_code
+
+@app.route('/api/upload/<upload_id>', methods=['DELETE'])
+def upload_abort(upload_id):
+    result, status_code = chunked_uploads.abort(upload_id)
+    return jsonify(result), status_code
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_file():
     """
@@ -92,7 +206,8 @@ def analyze_file():
         return jsonify({"status": "error", "message": "ファイルが見つかりません"}), 404
 
     # ここでLLM呼び出しなどを行う main_processor の関数を呼ぶ
-    result = process_file_and_map(file_path)
+    # 複数シートのxlsxは sheetName で1シートだけを解析できる (省略時はシートごとに解析)
+    result = process_file_and_map(file_path, sheet_name=data.get('sheetName'))
     return jsonify(result)
 
 @app.route('/api/remap', methods=['POST'])
@@ -100,6 +215,7 @@ def remap():
     """
     既存のmappingResponseとユーザ指示を受け取り、
     LLMに再度問い合わせて修正マッピングを提案してもらう。
+    「列3をRankに」「SalesPicを外して」のような単純な指示は app/remap_interpreter.py でその場で適用する。
     """
     data = request.get_json()
     original_mapping = data.get('originalMapping', {})
@@ -108,15 +224,50 @@ def remap():
     # 必要があれば rowData なども受け取る
     # rowData = data.get('rowData', [])  # if needed
 
+    result, status_code = run_remap(original_mapping, user_instruction)
+    return jsonify(result), status_code
+
+def run_remap(original_mapping, user_instruction):
+    """
+    /api/remap の本体 (ストリーミング版からも呼ぶ)。戻り値は (レスポンス用dict, HTTPステータスコード)。
+    """
+    if REMAP_LOCAL_ENABLED:
+        with metrics.span("remap_local"), streaming.stage("remap_local"):
+            local_result = interpret_instruction(original_mapping, user_instruction)
+        if local_result is not None:
+            metrics.REMAP_REQUESTS.inc(source="local")
+            return {
+                "status": "success",
+                "mappingResponse": local_result,
+                "remapSource": "local"
+            }, 200
+
+    metrics.REMAP_REQUESTS.inc(source="llm")
     try:
         # call_mapping_refine() は新たに定義する関数: LLMに再マッピング指示を出す処理
         refined_result = call_mapping_refine(original_mapping, user_instruction)
-        return jsonify({
+        return {
             "status": "success",
-            "mappingResponse": refined_result  # 返却フォーマットは call_mapping() と同じを想定
-        })
+            "mappingResponse": refined_result,  # 返却フォーマットは call_mapping() と同じを想定
+            "remapSource": "llm"
+        }, 200
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
+
+
+@app.route('/api/llm-cache/stats', methods=['GET'])
+def llm_cache_stats():
+    """
+    ヘッダー判定・マッピング提案のLLMレスポンスキャッシュのヒット/ミス数などを返す。
+    """
+    from app.llm_cache import llm_cache
+    return jsonify({"status": "success", "stats": llm_cache.stats()})
+
+@app.route('/api/llm-cache', methods=['DELETE'])
+def clear_llm_cache():
+    from app.llm_cache import llm_cache
+    llm_cache.clear()
+    return jsonify({"status": "success", "message": "LLM response cache cleared."})
 
 
 # 生成コードと変換結果を保存するフォルダ
@@ -127,6 +278,7 @@ os.makedirs(GENERATED_FOLDER, exist_ok=True)
 def codegen():
     """
     1. 受け取ったmapping, rowDataでLLMにPythonコードを生成してもらう
+       (独自の変換ルールが無いマッピングは app/transform_compiler.py がその場でコードを組み立てる)
     2. 生成スクリプトをファイルに保存
     3. スクリプトを実行し、変換結果をファイルに保存
     4. レスポンスには"status":"success"とダウンロード用パスなどを返す
@@ -152,6 +304,79 @@ def codegen():
     if not os.path.exists(file_path):
         return jsonify({"status":"error","message":"File not found"}), 404
 
+    result, status_code = run_codegen_pipeline(
+        file_path, mapping, row_data, engine=data.get("engine", "llm"),
+        output_formats=data.get("outputFormats"), use_gzip=bool(data.get("gzip")),
+        sheet_names=_requested_sheets(data), header_rows=data.get("headerRowIndexes")
+    )
+    return jsonify(result), status_code
+
+
+def _requested_sheets(data):
+    """
+    codegen のリクエストから変換するシートを取り出す。
+    sheetNames (同じマッピングで連結して変換するシート) か sheetName (1シート) を受け付ける。
+    """
+    if data.get("sheetNames"):
+        return list(data["sheetNames"])
+    if data.get("sheetName"):
+        return [data["sheetName"]]
+    return None
+
+def _artifact_options(sheet_names, header_rows):
+    # 成果物IDに含める、出力に影響する指定 (変換するシート・顧客マスタの検証)
+    options = {}
+    if sheet_names:
+        options["sheets"] = sheet_names
+        options["headerRows"] = {name: (header_rows or {}).get(name, 0) for name in sheet_names}
+    if SCHEMA_VALIDATION_ENABLED:
+        options["schema"] = SCHEMA_VERSION
+    return options or None
+
+def _schema_validator():
+    # 顧客マスタの検証・正規化 (app/customer_schema.py)。SCHEMA_VALIDATION_ENABLED=0 なら行わない
+    return CustomerSchemaValidator() if SCHEMA_VALIDATION_ENABLED else None
+
+def _open_codegen_row_stream(file_path, sheet_names=None, header_rows=None):
+    """
+    変換する行のストリームを開く。シートが2つ以上指定されていれば、別プロセスで並行に読んで1本につなげる。
+    """
+    from app.file_to_json import open_row_stream, open_xlsx_row_stream
+    from app.multi_sheet import open_sheets_row_stream
+    if not sheet_names:
+        return open_row_stream(file_path)
+    if len(sheet_names) == 1:
+        return open_xlsx_row_stream(file_path, sheet_name=sheet_names[0])
+    return open_sheets_row_stream(file_path, sheet_names, header_rows)
+
+def run_codegen_pipeline(file_path, mapping, row_data, engine="llm", output_formats=None, use_gzip=False,
+                         sheet_names=None, header_rows=None):
+    """
+    /api/codegen の本体。Flaskのリクエストに依存しないので、ジョブキューからも呼び出せる。
+    戻り値は (レスポンス用dict, HTTPステータスコード)。
+
+    変換結果は常に transformed_data.json に書き出し、output_formats (例: ["ndjson", "csv"]) があれば
+    同時にその形式でも書き出す。書き出し先は入力ごとの成果物ディレクトリ (app/artifacts.py) なので、
+    複数の codegen を同時に実行してもお互いのファイルを上書きしない。
+
+    複数シートのxlsxは sheet_names で変換するシートを指定する。2つ以上指定すると、
+    2枚目以降のシートのヘッダー行 (header_rows[シート名]、省略時は0) までを捨てて1回の変換で処理する。
+    """
+    output_error = (_check_output_formats(output_formats) or _check_mapping(mapping)
+                    or _check_header_rows(header_rows))
+    if output_error:
+        return {"status":"error","message":output_error}, 400
+
+    # 実行エンジン: "llm" (LLM生成コードをexec。独自の変換ルールが無ければマッピングから組み立てたコード) /
+    #             "columnar" (列指向エンジンで直接変換)
+    if engine == "columnar":
+        return _run_columnar_codegen(file_path, mapping, output_formats, use_gzip, sheet_names, header_rows)
+    if engine != "llm":
+        return {"status":"error","message":f"Unknown engine: {engine}"}, 400
+
+    # 独自の変換ルールが無いマッピングは、LLMを呼ばずにマッピングからコードを組み立てる (app/transform_compiler.py)
+    if TRANSFORM_COMPILER_ENABLED and can_compile(mapping):
+        return _run_compiled_codegen(file_path, mapping, output_formats, use_gzip, sheet_names, header_rows)
 
     # (B) system_promptを読み込む
     try:
@@ -159,97 +384,536 @@ def codegen():
             system_prompt = f.read()
     except Exception as e:
         app.logger.error(f"Failed to load system prompt: {str(e)}")
-        return jsonify({"status":"error", "message":f"Failed to load system prompt: {str(e)}"}), 500
+        return {"status":"error", "message":f"Failed to load system prompt: {str(e)}"}, 500
 
-    # (C) OpenAI呼び出し (例)
-    openai_api_key = os.environ.get("OPENAI_API_KEY")
+    # 同じ入力・同じマッピング・同じプロンプトで完成済みの成果物があれば、それをそのまま返す
+    artifact_id = artifact_id_for(file_path, mapping, "llm", system_prompt, _artifact_options(sheet_names, header_rows))
+    if _artifact_has_outputs(artifact_id, output_formats, use_gzip, with_py=True):
+        return _codegen_success(artifact_id, "Code generated and executed successfully.", cached=True, reused=True), 200
 
-    client = OpenAI(api_key=openai_api_key)
+    # (C) 同じ列構成・同じマッピング・同じプロンプトで生成済みのコードがあればそれを使う
+    cached = code_cache.get(mapping, system_prompt)
+    if cached:
+        generated_code, code_obj = cached
+    else:
+        code_obj = None
+        try:
+            generated_code = _generate_code_with_llm(system_prompt, mapping, row_data)
+        except Exception as e:
+            app.logger.error(f"LLM code generation failed: {str(e)}")
+            return {"status":"error","message":f"LLM code generation failed: {str(e)}"}, 500
 
+    # (E) コードを実行し、変換結果を保存
+    # (D) 実行 -> ただし transform_data() に渡す row_data は "全行" である必要あり
+    #     全行を一度にリストへ載せるとメモリを食うので、チャンク単位で読み込み・変換・書き出しを行う
+    from app.transform_runner import run_transform_in_chunks, run_transform_parallel
+    row_stream = _open_codegen_row_stream(file_path, sheet_names, header_rows)
+    if row_stream["status"] != "success":
+        return {"status":"error","message":row_stream["message"]}, 400
+
+    with ArtifactWriter(artifact_id) as artifact:
+        # (D) コードをファイルに保存 (commit されるまでは一時ファイル)
+        generated_py_path = artifact.final_path("generated_transform.py")
+        try:
+            with open(artifact.path("generated_transform.py"), "w", encoding="utf-8") as f:
+                f.write(generated_code)
+        except Exception as e:
+            return {"status":"error","message":f"Writing generated file failed: {str(e)}"}, 500
+
+        try:
+            if code_obj is None:
+                code_obj = compile(generated_code, generated_py_path, "exec")
+            # 実際に全行を変換し、変換結果は逐次ファイルへ書き出す
+            validator = _schema_validator()
+            with _open_output_writers(artifact, output_formats, use_gzip) as writer, \
+                    metrics.span("transform", engine="llm") as fields, streaming.stage("transform"):
+                on_records = _record_writer(writer, fields, validator)
+                if SANDBOX_ENABLED and TRANSFORM_PARALLEL:
+                    # チャンクを複数のワーカーに同時に投げ、結果は順番どおりに書き出す
+                    run_transform_parallel(
+                        sandbox_pool.submitter(generated_code), mapping, row_stream["rowChunks"], on_records,
+                        max_in_flight=sandbox_pool.size * 2
+                    )
+                else:
+                    # 生成コードは常駐ワーカープロセスで実行する (暴走してもWebプロセスを巻き込まない)
+                    transform_func = make_transform_func(generated_code, code_obj)
+                    run_transform_in_chunks(transform_func, mapping, row_stream["rowChunks"], on_records)
+
+            # 最後まで実行できたコードだけをキャッシュする
+            if not cached:
+                code_cache.put(mapping, system_prompt, generated_code, code_obj)
+
+        except SyntaxError as se:
+            tb_str = traceback.format_exc()
+            return {
+                "status":"error",
+                "message":f"Syntax error in generated code: {str(se)}",
+                "traceback":tb_str
+            }, 500
+        except Exception as e:
+            tb_str = getattr(e, "traceback", None) or traceback.format_exc()
+            return {
+                "status":"error",
+                "message":f"Error running generated code: {str(e)}",
+                "traceback":tb_str
+            }, 500
+
+        artifact.commit({
+            "engine": "llm", "fileName": os.path.basename(file_path),
+            "validation": validator.report() if validator else None
+        })
+
+    # (F) 成功レスポンス
+    return _codegen_success(artifact_id, "Code generated and executed successfully.", cached=bool(cached)), 200
+
+
+def _codegen_success(artifact_id, message, cached=False, reused=False, with_py=True, source="llm"):
+    manifest = load_manifest(artifact_id) or {}
+    return {
+        "status":"success",
+        "message":message,
+        "cached": cached,
+        "reused": reused,  # 完成済みの成果物をそのまま返した場合 True
+        "codegenSource": source,  # llm / compiled / columnar
+        "artifactId": artifact_id,
+        "generatedPyPath": f"/api/download/{artifact_id}/py" if with_py else None,
+        "transformedDataPath": f"/api/download/{artifact_id}/data",
+        "validation": manifest.get("validation")  # 顧客マスタの検証結果 (app/customer_schema.py)
+    }
+
+
+def _generate_code_with_llm(system_prompt, mapping, row_data):
+    """
+    LLM (o1-mini) に transform_data のコードを生成してもらい、コードブロック記号を除いて返す。
+    """
     user_prompt = {
         "mapping": mapping,
         "rowData": row_data
     }
-    
-    try:
-        resp = client.chat.completions.create(
+
+    with metrics.span("codegen_llm"):
+        resp = llm_gateway.complete(
             model="o1-mini",  # 例：Pythonコード生成用モデル
             messages=[
                 {"role": "user", "content": system_prompt},
                 {"role": "user", "content": json.dumps(user_prompt, ensure_ascii=False)}
-            ]
+            ],
+            kind="codegen"
         )
-        generated_code = resp.choices[0].message.content
-        # 不要な ```python や ``` を取り除く
-        generated_code = generated_code.replace("```python", "").replace("```", "")
-    except Exception as e:
-        app.logger.error(f"LLM code generation failed: {str(e)}")
-        return jsonify({"status":"error","message":f"LLM code generation failed: {str(e)}"}), 500
+    generated_code = resp.choices[0].message.content
+    # 不要な ```python や ``` を取り除く
+    return generated_code.replace("```python", "").replace("```", "")
 
-    # (D) コードをファイルに保存
-    generated_py_path = os.path.join(GENERATED_FOLDER, "generated_transform.py")
-    try:
-        with open(generated_py_path, "w", encoding="utf-8") as f:
-            f.write(generated_code)
-    except Exception as e:
-        return jsonify({"status":"error","message":f"Writing generated file failed: {str(e)}"}), 500
 
-    # (E) コードを実行し、変換結果を保存
-    # (D) 実行 -> ただし transform_data() に渡す row_data は "全行" である必要あり
-    from app.file_to_json import convert_xlsx_to_json
-    full_data_result = convert_xlsx_to_json(file_path, limit_rows=False)
-    if full_data_result["status"] != "success":
-        return jsonify({"status":"error","message":full_data_result["message"]}), 400
+@app.route("/api/codegen/cache", methods=["DELETE"])
+def clear_codegen_cache():
+    """
+    生成コードのキャッシュを削除する。
+    ?stale=1 の場合は現在のプロンプトファイル以外で生成されたエントリのみ削除する。
+    """
+    if request.args.get("stale"):
+        try:
+            with open("system_prompt_code_generation.md", "r", encoding="utf-8") as f:
+                system_prompt = f.read()
+        except Exception as e:
+            return jsonify({"status":"error", "message":f"Failed to load system prompt: {str(e)}"}), 500
+        removed = code_cache.invalidate_stale(system_prompt)
+        return jsonify({"status":"success","message":f"Removed {removed} stale cache entries."})
 
-    full_row_data = full_data_result["rowData"]
+    code_cache.clear()
+    return jsonify({"status":"success","message":"Code cache cleared."})
 
-    transformed_data = []
-    try:
-        global_namespace = {}
-        exec(generated_code, global_namespace)
-        transform_func = global_namespace.get("transform_data")
-        if not transform_func:
-            return jsonify({"status":"error","message":"No transform_data in generated code"}), 500
-
-        # 実際に全行を変換
-        transformed_data = transform_func(mapping, full_row_data)
-
-        # 変換結果をJSONとして保存 or CSVとして保存など
-        # ここでは簡単にJSONとして保存
-        output_json_path = os.path.join(GENERATED_FOLDER, "transformed_data.json")
-        with open(output_json_path, "w", encoding="utf-8") as f:
-            json.dump(transformed_data, f, ensure_ascii=False, indent=2)
-
-    except SyntaxError as se:
-        tb_str = traceback.format_exc()
-        return jsonify({
-            "status":"error",
-            "message":f"Syntax error in generated code: {str(se)}",
-            "traceback":tb_str
-        }), 500
-    except Exception as e:
-        tb_str = traceback.format_exc()
-        return jsonify({
-            "status":"error",
-            "message":f"Error running generated code: {str(e)}",
-            "traceback":tb_str
-        }), 500
 
-    # (F) 成功レスポンス
+def _check_output_formats(output_formats):
+    """
+    出力形式の指定をチェックし、問題があればエラーメッセージを返す。
+    """
+    from app.output_writers import OUTPUT_FORMATS, pa
+    unknown = [f for f in (output_formats or []) if f not in OUTPUT_FORMATS]
+    if unknown:
+        return f"Unsupported output format: {unknown} (supported: {list(OUTPUT_FORMATS)})"
+    if "parquet" in (output_formats or []) and pa is None:
+        return "Parquet output requires pyarrow"
+    return None
+
+def _check_mapping(mapping):
+    """
+    mapping の形をチェックし、問題があればエラーメッセージを返す。
+    matchedField のある要素は columnIndex が0以上の整数でなければならない (未割り当ての要素は問わない)。
+    """
+    if not isinstance(mapping, list) or not all(isinstance(m, dict) for m in mapping):
+        return "mapping must be a list of objects"
+    for m in mapping:
+        index = m.get("columnIndex")
+        if m.get("matchedField") and (not isinstance(index, int) or isinstance(index, bool) or index < 0):
+            return f"Invalid columnIndex for {m.get('matchedField')}: {index!r}"
+    return None
+
+def _check_header_rows(header_rows):
+    """
+    headerRowIndexes ({シート名: ヘッダー行の番号}) をチェックし、問題があればエラーメッセージを返す。
+    """
+    if header_rows is None:
+        return None
+    if not isinstance(header_rows, dict):
+        return "headerRowIndexes must be an object of {sheetName: rowIndex}"
+    for name, index in header_rows.items():
+        if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+            return f"Invalid headerRowIndexes for {name}: {index!r}"
+    return None
+
+def _output_file_names(output_formats, use_gzip):
+    """
+    codegen で書き出すファイル名 (transformed_data.json は常に含む) の一覧。
+    """
+    from app.output_writers import output_path
+    names = [output_path("transformed_data", "json")]
+    for fmt in output_formats or []:
+        if fmt == "json" and not use_gzip:
+            continue
+        names.append(output_path("transformed_data", fmt, use_gzip))
+    return names
+
+def _artifact_has_outputs(artifact_id, output_formats, use_gzip, with_py=False):
+    """
+    完成済みの成果物に、今回要求された出力がすべて揃っているか。
+    """
+    manifest = load_manifest(artifact_id)
+    if not manifest:
+        return False
+    names = _output_file_names(output_formats, use_gzip) + (["generated_transform.py"] if with_py else [])
+    return all(
+        name in manifest.get("files", []) and os.path.exists(artifact_path(artifact_id, name))
+        for name in names
+    )
+
+def _open_output_writers(artifact, output_formats, use_gzip):
+    """
+    成果物ディレクトリの一時ファイルに対して、transformed_data.json と追加の出力形式のライターをまとめて開く。
+    """
+    from app.output_writers import MultiWriter, JsonArrayWriter, open_writer, output_path
+    writers = [JsonArrayWriter(artifact.path(output_path("transformed_data", "json")))]
+    for fmt in output_formats or []:
+        if fmt == "json" and not use_gzip:
+            continue
+        name = output_path("transformed_data", fmt, use_gzip)
+        writers.append(open_writer(artifact.path(name), fmt, use_gzip=use_gzip))
+    return MultiWriter(writers)
+
+def _record_writer(writer, fields, validator=None):
+    """
+    変換済みのチャンクを書き出す on_records コールバック。
+    validator があれば書き出す前に顧客マスタとして検証・正規化する。
+    書き出しの時間は output_write として記録し、transform の span には処理した行数を残す。
+    """
+    fields["rows"] = 0
+
+    def on_records(records):
+        raise_if_cancelled()  # ジョブとして実行中ならチャンクごとにキャンセルを確認
+        if validator is not None:
+            with metrics.span("validate"):
+                records = validator.validate(records)
+        with metrics.span("output_write"):
+            writer.write_records(records)
+        fields["rows"] += len(records)
+        metrics.count_rows("transform", len(records))
+        streaming.emit_progress("progress", stage="transform", rows=fields["rows"])
+    return on_records
+
+def _run_compiled_codegen(file_path, mapping, output_formats=None, use_gzip=False, sheet_names=None, header_rows=None):
+    """
+    マッピングから組み立てた transform_data (app/transform_compiler.py) で全行を変換する。
+    LLMの生成コードと同じく generated_transform.py を成果物に保存するが、コードはこちらで作ったものなので
+    サンドボックスを通さずにこのプロセスで実行する。
+    """
+    from app.transform_runner import run_transform_in_chunks
+
+    message = "Code compiled from the mapping and executed successfully."
+    generated_code = compile_transform_source(mapping)
+    artifact_id = artifact_id_for(
+        file_path, mapping, "compiled", generated_code, _artifact_options(sheet_names, header_rows)
+    )
+    if _artifact_has_outputs(artifact_id, output_formats, use_gzip, with_py=True):
+        return _codegen_success(artifact_id, message, reused=True, source="compiled"), 200
+
+    row_stream = _open_codegen_row_stream(file_path, sheet_names, header_rows)
+    if row_stream["status"] != "success":
+        return {"status":"error","message":row_stream["message"]}, 400
+
+    with ArtifactWriter(artifact_id) as artifact:
+        try:
+            with open(artifact.path("generated_transform.py"), "w", encoding="utf-8") as f:
+                f.write(generated_code)
+        except Exception as e:
+            return {"status":"error","message":f"Writing generated file failed: {str(e)}"}, 500
+
+        try:
+            transform_func = compile_transform(mapping, generated_code)
+            validator = _schema_validator()
+            with _open_output_writers(artifact, output_formats, use_gzip) as writer, \
+                    metrics.span("transform", engine="compiled") as fields, streaming.stage("transform"):
+                run_transform_in_chunks(
+                    transform_func, mapping, row_stream["rowChunks"], _record_writer(writer, fields, validator)
+                )
+        except Exception as e:
+            tb_str = traceback.format_exc()
+            return {
+                "status":"error",
+                "message":f"Error running compiled transform: {str(e)}",
+                "traceback":tb_str
+            }, 500
+        artifact.commit({
+            "engine": "compiled", "fileName": os.path.basename(file_path),
+            "validation": validator.report() if validator else None
+        })
+
+    return _codegen_success(artifact_id, message, source="compiled"), 200
+
+def _run_columnar_codegen(file_path, mapping, output_formats=None, use_gzip=False, sheet_names=None, header_rows=None):
+    """
+    LLMによるコード生成を行わず、列指向エンジン (app/columnar_transform.py) で全行を変換する。
+    生成コードが無いので generatedPyPath は返さない。
+    """
+    from app.transform_runner import run_transform_in_chunks
+    from app.columnar_transform import transform_data as columnar_transform_data
+
+    artifact_id = artifact_id_for(file_path, mapping, "columnar", options=_artifact_options(sheet_names, header_rows))
+    if _artifact_has_outputs(artifact_id, output_formats, use_gzip):
+        return _codegen_success(
+            artifact_id, "Data transformed with the columnar engine.", reused=True, with_py=False, source="columnar"
+        ), 200
+
+    row_stream = _open_codegen_row_stream(file_path, sheet_names, header_rows)
+    if row_stream["status"] != "success":
+        return {"status":"error","message":row_stream["message"]}, 400
+
+    with ArtifactWriter(artifact_id) as artifact:
+        try:
+            validator = _schema_validator()
+            with _open_output_writers(artifact, output_formats, use_gzip) as writer, \
+                    metrics.span("transform", engine="columnar") as fields, streaming.stage("transform"):
+                run_transform_in_chunks(
+                    columnar_transform_data, mapping, row_stream["rowChunks"], _record_writer(writer, fields, validator)
+                )
+        except Exception as e:
+            tb_str = traceback.format_exc()
+            return {
+                "status":"error",
+                "message":f"Error running columnar transform: {str(e)}",
+                "traceback":tb_str
+            }, 500
+        artifact.commit({
+            "engine": "columnar", "fileName": os.path.basename(file_path),
+            "validation": validator.report() if validator else None
+        })
+
+    return _codegen_success(artifact_id, "Data transformed with the columnar engine.", with_py=False, source="columnar"), 200
+
+
+# ---------------------------------------------------------------------------
+# 非同期ジョブ: 投入するとすぐに jobId を返し、結果はポーリングで取得する
+# ---------------------------------------------------------------------------
+
+def _submit_job(kind, func, *args, **kwargs):
+    job = job_manager.submit(kind, func, *args, **kwargs)
+    if job is None:
+        return jsonify({"status":"error","message":"ジョブが混み合っています。しばらくしてから再実行してください。"}), 503
     return jsonify({
         "status":"success",
-        "message":"Code generated and executed successfully.",
-        "generatedPyPath": "/api/download/py",     # ダウンロード用URL例
-        "transformedDataPath": "/api/download/data" # ダウンロード用URL例
+        "jobId": job.id,
+        "statusPath": f"/api/jobs/{job.id}",
+        "resultPath": f"/api/jobs/{job.id}/result"
+    }), 202
+
+@app.route("/api/jobs/analyze", methods=["POST"])
+def submit_analyze_job():
+    """
+    /api/analyze と同じリクエストを受け取り、process_file_and_map() をジョブとして実行する。
+    """
+    data = request.get_json()
+    file_name = data.get('fileName')
+    if not file_name:
+        return jsonify({"status": "error", "message": "ファイル名が指定されていません"}), 400
+
+    file_path = os.path.join(UPLOAD_FOLDER, file_name)
+    if not os.path.exists(file_path):
+        return jsonify({"status": "error", "message": "ファイルが見つかりません"}), 404
+
+    return _submit_job("analyze", process_file_and_map, file_path, sheet_name=data.get('sheetName'))
+
+@app.route("/api/jobs/codegen", methods=["POST"])
+def submit_codegen_job():
+    """
+    /api/codegen と同じリクエストを受け取り、run_codegen_pipeline() をジョブとして実行する。
+    """
+    data = request.get_json()
+    file_name = data.get("fileName")
+    if not file_name:
+        return jsonify({"status":"error","message":"fileName is missing"}), 400
+
+    file_path = os.path.join(UPLOAD_FOLDER, file_name)
+    if not os.path.exists(file_path):
+        return jsonify({"status":"error","message":"File not found on server"}), 404
+    header_error = _check_header_rows(data.get("headerRowIndexes"))
+    if header_error:
+        return jsonify({"status":"error","message":header_error}), 400
+
+    return _submit_job(
+        "codegen", run_codegen_pipeline,
+        file_path, data.get("mapping", []), data.get("rowData", []), engine=data.get("engine", "llm"),
+        output_formats=data.get("outputFormats"), use_gzip=bool(data.get("gzip")),
+        sheet_names=_requested_sheets(data), header_rows=data.get("headerRowIndexes")
+    )
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status":"error","message":"Job not found"}), 404
+    return jsonify({"status":"success", **job.to_dict()})
+
+@app.route("/api/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    """
+    完了したジョブの結果を、同期版エンドポイントと同じ形・同じステータスコードで返す。
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status":"error","message":"Job not found"}), 404
+    if job.status not in FINISHED_STATUSES:
+        return jsonify({"status":"pending", **job.to_dict()}), 202
+    if job.result is None:
+        return jsonify({"status":"error","message":"Job was cancelled", **job.to_dict()}), 409
+    return jsonify(job.result), job.http_status
+
+@app.route("/api/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"status":"error","message":"Job not found"}), 404
+    return jsonify({"status":"success", **job.to_dict()})
+
+
+
+# ---------------------------------------------------------------------------
+# ストリーミング版: 処理はジョブとして実行し、進捗を Server-Sent Events で送りながら最後に結果を返す
+# (イベントの種類は app/streaming.py を参照)
+# ---------------------------------------------------------------------------
+
+def _stream_job(kind, func, *args, **kwargs):
+    """
+    func をジョブとして実行し、進捗イベントと結果を text/event-stream で返す。
+    最後のイベントは result (通常のエンドポイントと同じ body と httpStatus) か error。
+    接続が切れたらジョブをキャンセルする。
+    """
+    channel = streaming.ProgressChannel()
+    job = job_manager.submit(kind, streaming.run_with_channel, channel, func, *args, **kwargs)
+    if job is None:
+        return jsonify({"status":"error","message":"ジョブが混み合っています。しばらくしてから再実行してください。"}), 503
+
+    def events():
+        try:
+            yield streaming.format_sse("job", {"jobId": job.id, "kind": kind})
+            while True:
+                try:
+                    item = channel.get(timeout=streaming.SSE_HEARTBEAT_SECONDS)
+                except StopIteration:
+                    break
+                if item is not None:
+                    yield streaming.format_sse(*item)
+                elif job.status in FINISHED_STATUSES:
+                    break  # 実行前にキャンセルされた (チャネルは閉じられない)
+                else:
+                    # プロキシ・ロードバランサーに無通信の接続を切られないようにコメント行を送る
+                    yield ": keepalive\n\n"
+
+            while job.status not in FINISHED_STATUSES:
+                # run_with_channel がチャネルを閉じてから、ジョブの結果が保存されるまでのわずかな間
+                time.sleep(0.01)
+            if job.result is None:
+                yield streaming.format_sse("error", {"status":"error","message":"Job was cancelled", **job.to_dict()})
+            elif job.http_status >= 400:
+                yield streaming.format_sse("error", {"httpStatus": job.http_status, "body": job.result})
+            else:
+                yield streaming.format_sse("result", {"httpStatus": job.http_status, "body": job.result})
+        finally:
+            if job.status not in FINISHED_STATUSES:
+                job_manager.cancel(job.id)
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # nginx のレスポンスバッファリングを無効にする
     })
 
+@app.route("/api/analyze/stream", methods=["POST"])
+def analyze_file_stream():
+    """
+    /api/analyze のストリーミング版。パース・LLM呼び出しの開始/終了と、
+    マッピング提案の要素をパースできたものから順に送る。
+    """
+    data = request.get_json()
+    file_name = data.get('fileName')
+    if not file_name:
+        return jsonify({"status": "error", "message": "ファイル名が指定されていません"}), 400
+
+    file_path = os.path.join(UPLOAD_FOLDER, file_name)
+    if not os.path.exists(file_path):
+        return jsonify({"status": "error", "message": "ファイルが見つかりません"}), 404
+
+    return _stream_job("analyze", process_file_and_map, file_path, sheet_name=data.get('sheetName'))
+
+@app.route("/api/remap/stream", methods=["POST"])
+def remap_stream():
+    """
+    /api/remap のストリーミング版。LLMに回した場合は修正後のマッピングを要素ごとに送る。
+    """
+    data = request.get_json()
+    return _stream_job("remap", run_remap, data.get('originalMapping', {}), data.get('userInstruction', ''))
+
+@app.route("/api/codegen/stream", methods=["POST"])
+def codegen_stream():
+    """
+    /api/codegen のストリーミング版。コード生成の途中経過と、変換・書き出しの済んだ行数を送る。
+    """
+    data = request.get_json()
+    file_name = data.get("fileName")
+    if not file_name:
+        return jsonify({"status":"error","message":"fileName is missing"}), 400
+
+    file_path = os.path.join(UPLOAD_FOLDER, file_name)
+    if not os.path.exists(file_path):
+        return jsonify({"status":"error","message":"File not found on server"}), 404
+    header_error = _check_header_rows(data.get("headerRowIndexes"))
+    if header_error:
+        return jsonify({"status":"error","message":header_error}), 400
+
+    return _stream_job(
+        "codegen", run_codegen_pipeline,
+        file_path, data.get("mapping", []), data.get("rowData", []), engine=data.get("engine", "llm"),
+        output_formats=data.get("outputFormats"), use_gzip=bool(data.get("gzip")),
+        sheet_names=_requested_sheets(data), header_rows=data.get("headerRowIndexes")
+    )
+
+def _resolve_artifact_id(artifact_id):
+    """
+    URLの artifactId をチェックする。None の場合は最後に完成した成果物を使う (旧エンドポイント互換)。
+    """
+    if artifact_id is None:
+        return latest_artifact_id()
+    return artifact_id if is_valid_artifact_id(artifact_id) else None
 
 @app.route("/api/download/py", methods=["GET"])
-def download_py():
+@app.route("/api/download/<artifact_id>/py", methods=["GET"])
+def download_py(artifact_id=None):
     """
-    生成されたPythonコードをダウンロードさせる例
+    生成されたPythonコードをダウンロードさせる。
+    /api/download/py (artifactId なし) は最後に完成した成果物を返す。
     """
-    generated_py_path = os.path.join(GENERATED_FOLDER, "generated_transform.py")
+    artifact_id = _resolve_artifact_id(artifact_id)
+    if artifact_id is None or not load_manifest(artifact_id):
+        return jsonify({"status":"error","message":"Artifact not found"}), 404
+
+    generated_py_path = artifact_path(artifact_id, "generated_transform.py")
     if not os.path.exists(generated_py_path):
         return jsonify({"status":"error","message":"No generated Python file found"}), 404
 
@@ -261,21 +925,90 @@ def download_py():
     )
 
 
+# 変換中のダウンロード (書き出し先パス -> ジョブID)。同じ形式への変換を同時に複数実行しない
+_conversion_jobs = {}
+_conversion_lock = threading.Lock()
+
+def _convert_download(artifact_id, source_path, data_path, fmt, use_gzip):
+    """
+    transformed_data.json を fmt に変換して data_path に保存する (ダウンロード用のジョブ)。
+    一時ファイルに書いてから os.replace で置き換えるので、変換途中のファイルが返ることはない。
+    変換したファイルは manifest の files に追加するので、同じ形式を要求する codegen はそれを再利用できる。
+    """
+    from app.output_writers import convert_output
+    tmp_path = f"{data_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        count = convert_output(source_path, "json", tmp_path, fmt, use_gzip=use_gzip)
+        os.replace(tmp_path, data_path)
+        add_artifact_file(artifact_id, os.path.basename(data_path))
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return {"status":"error","message":f"Converting transformed data failed: {str(e)}"}, 500
+    return {"status":"success","recordCount":count,"fileName":os.path.basename(data_path)}
+
 @app.route("/api/download/data", methods=["GET"])
-def download_data():
+@app.route("/api/download/<artifact_id>/data", methods=["GET"])
+def download_data(artifact_id=None):
     """
-    変換後のデータをダウンロードさせる例 (JSON想定)
+    変換後のデータをダウンロードさせる。
+    ?format=json|ndjson|csv|parquet (既定は json)、?gzip=1 で gzip 圧縮版を返す。
+    その形式でまだ書き出していなければ、transformed_data.json からの変換をジョブとして投入して 202 を返す
+    (jobId / statusPath 付き)。変換が終わってから同じURLを再度リクエストすると、保存したファイルを返す。
+    変換の失敗は、次に同じURLをリクエストしたときにそのジョブの結果 (500) として返す。
+    Range リクエストに対応しているので、途中からの再開ダウンロードもできる。
     """
-    output_json_path = os.path.join(GENERATED_FOLDER, "transformed_data.json")
-    if not os.path.exists(output_json_path):
-        return jsonify({"status":"error","message":"No transformed data found"}), 404
+    from app.output_writers import OUTPUT_FORMATS, output_path, output_mimetype
+
+    artifact_id = _resolve_artifact_id(artifact_id)
+    if artifact_id is None or not load_manifest(artifact_id):
+        return jsonify({"status":"error","message":"Artifact not found"}), 404
+
+    fmt = request.args.get("format", "json")
+    use_gzip = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    if fmt not in OUTPUT_FORMATS:
+        return jsonify({"status":"error","message":f"Unsupported format: {fmt}"}), 400
+    format_error = _check_output_formats([fmt])
+    if format_error:
+        return jsonify({"status":"error","message":format_error}), 400
+
+    base_path = artifact_path(artifact_id, "transformed_data")
+    data_path = output_path(base_path, fmt, use_gzip)
+    if not os.path.exists(data_path):
+        source_path = output_path(base_path, "json")
+        if not os.path.exists(source_path):
+            return jsonify({"status":"error","message":"No transformed data found"}), 404
+        with _conversion_lock:
+            job = job_manager.get(_conversion_jobs.get(data_path, ""))
+            if job is not None and job.status in FINISHED_STATUSES:
+                del _conversion_jobs[data_path]
+                if job.http_status is not None and job.http_status >= 400:
+                    return jsonify(job.result), job.http_status
+                # 成功済みなのにファイルが無い (成果物が削除された) 場合やキャンセルされた場合は変換し直す
+                job = None
+            if job is None and not os.path.exists(data_path):
+                job = job_manager.submit("convert", _convert_download, artifact_id, source_path, data_path, fmt, use_gzip)
+                if job is None:
+                    return jsonify({"status":"error","message":"ジョブが混み合っています。しばらくしてから再実行してください。"}), 503
+                _conversion_jobs[data_path] = job.id
+        if job is not None:
+            response = jsonify({
+                "status":"pending",
+                "message":f"{fmt} 形式に変換しています。完了後に同じURLを再度リクエストしてください。",
+                "jobId": job.id,
+                "statusPath": f"/api/jobs/{job.id}"
+            })
+            response.headers["Retry-After"] = "1"
+            return response, 202
 
     return send_file(
-        output_json_path,
+        data_path,
         as_attachment=True,
-        download_name="transformed_data.json",
-        mimetype="application/json"
+        download_name=os.path.basename(data_path),
+        mimetype=output_mimetype(fmt, use_gzip),
+        conditional=True
     )
 
 if __name__ == '__main__':
+    sandbox_pool.start()  # 生成コード実行用のワーカーを先に起動しておく
     app.run(host='0.0.0.0', port=8000, debug=True)
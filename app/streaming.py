@@ -0,0 +1,199 @@
+# app/streaming.py
+#
+# /api/*/stream (Server-Sent Events) 用の進捗通知。
+# ストリーミングのリクエストを処理している間だけ ProgressChannel が有効になり、
+# 処理側は emit_progress() / stage() で進捗を送る (チャネルが無い通常のリクエストでは何もしない)。
+#
+#   event: job            {"jobId": "...", "kind": "analyze"}             最初に1回 (DELETE /api/jobs/<id> で止められる)
+#   event: stage          {"stage": "parse", "state": "started" | "finished", "seconds": ..., "ok": ...}
+#                         LLM呼び出しは {"stage": "llm", "kind": "mapping", ...}
+#   event: llm_progress   {"kind": "mapping", "characters": 1234}        LLMの出力が届いている途中経過
+#   event: mapping_entry  {"kind": "mapping", "entry": {...}}            パースできたマッピング要素から順に送る
+#   event: progress       {"stage": "transform", "rows": 50000}           codegen の変換済み行数
+#   event: result         {"httpStatus": 200, "body": {...}}             通常のエンドポイントと同じレスポンス
+#   event: error          {"httpStatus": 500, "body": {...}}             HTTPステータスが400以上だった場合 (result の代わり)
+#   ": keepalive"         SSE_HEARTBEAT_SECONDS 秒イベントが無ければ送るコメント行
+#
+# チャネルは contextvars で持つので、スレッドプールに処理を渡すときは submit_in_context() を使う。
+
+import os
+import json
+import time
+import queue
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))  # 無通信が続いたらコメント行を送る
+LLM_PROGRESS_INTERVAL_SECONDS = float(os.environ.get("LLM_PROGRESS_INTERVAL_SECONDS", 0.5))
+
+# mappingResponse 形式のJSONを返す呼び出しの種類 (mapping 配列の要素を途中で取り出せる)
+MAPPING_KINDS = ("mapping", "combined", "refine")
+
+_channel: contextvars.ContextVar = contextvars.ContextVar("progress_channel", default=None)
+
+class ProgressChannel:
+    """
+    処理スレッドからSSEのレスポンスを返すスレッドへイベントを渡すキュー。
+    """
+
+    _CLOSED = object()
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        self._queue.put((event, data))
+
+    def close(self) -> None:
+        self._queue.put(self._CLOSED)
+
+    def get(self, timeout: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        次のイベントを返す。timeout 秒以内に無ければ None、close() 済みなら StopIteration を送出する。
+        """
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is self._CLOSED:
+            raise StopIteration
+        return item
+
+def emit_progress(event: str, **data) -> None:
+    channel = _channel.get()
+    if channel is not None:
+        channel.emit(event, data)
+
+def streaming_active() -> bool:
+    return _channel.get() is not None
+
+@contextmanager
+def stage(name: str, **data) -> Iterator[None]:
+    """
+    with ブロックの開始・終了を stage イベントとして送る。
+    """
+    if _channel.get() is None:
+        yield
+        return
+    emit_progress("stage", stage=name, state="started", **data)
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        emit_progress("stage", stage=name, state="finished", ok=ok,
+                      seconds=round(time.perf_counter() - started, 3), **data)
+
+def run_with_channel(channel: ProgressChannel, func: Callable, *args, **kwargs) -> Any:
+    """
+    channel を有効にして func を実行し、終わったら channel を閉じる。
+    """
+    token = _channel.set(channel)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _channel.reset(token)
+        channel.close()
+
+def submit_in_context(executor, func: Callable, *args, **kwargs):
+    """
+    executor.submit() と同じだが、呼び出し元の進捗チャネルを引き継ぐ。
+    """
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+class MappingEntryParser:
+    """
+    LLMの出力 (途中まで) から "mapping": [ {...}, {...}, ... ] の要素を、閉じたものから順に取り出す。
+    文字列中の括弧・エスケープを考慮して対応する } を探すだけの簡易パーサー。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = None  # mapping 配列の中で次に読む位置 (配列が見つかるまでは None)
+        self._start = None  # 読みかけの要素の開始位置
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._done = False
+
+    def _find_array(self) -> None:
+        key = self.text.find('"mapping"')
+        if key < 0:
+            return
+        bracket = self.text.find("[", key)
+        if bracket >= 0 and self.text[key + len('"mapping"'):bracket].strip() in (":",):
+            self._pos = bracket + 1
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        self.text += delta
+        if self._done:
+            return []
+        if self._pos is None:
+            self._find_array()
+            if self._pos is None:
+                return []
+
+        entries = []
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    try:
+                        entry = json.loads(text[self._start:i + 1])
+                    except ValueError:
+                        entry = None
+                    if isinstance(entry, dict):
+                        entries.append(entry)
+                    self._start = None
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                i += 1
+                break
+            i += 1
+        self._pos = i
+        return entries
+
+def llm_delta_handler(kind: str) -> Optional[Callable[[str], None]]:
+    """
+    ストリーミング中なら、LLMの出力の断片を受け取って llm_progress / mapping_entry を送る関数を返す。
+    ストリーミング中でなければ None (呼び出し側は通常の呼び出しを使う)。
+    """
+    channel = _channel.get()
+    if channel is None:
+        return None
+    parser = MappingEntryParser() if kind in MAPPING_KINDS else None
+    state = {"characters": 0, "lastSent": 0.0}
+
+    def on_delta(delta: str) -> None:
+        state["characters"] += len(delta)
+        now = time.monotonic()
+        if now - state["lastSent"] >= LLM_PROGRESS_INTERVAL_SECONDS:
+            state["lastSent"] = now
+            channel.emit("llm_progress", {"kind": kind, "characters": state["characters"]})
+        if parser is not None:
+            for entry in parser.feed(delta):
+                channel.emit("mapping_entry", {"kind": kind, "entry": entry})
+
+    return on_delta
+
+def format_sse(event: str, data: Any) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
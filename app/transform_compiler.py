@@ -0,0 +1,148 @@
+# app/transform_compiler.py
+#
+# マッピングから transform_data(mapping, row_data) のコードを組み立てる (LLMを使わないコード生成)。
+# o1-mini が生成するコード (app/generated/generated_transform.py) は、ほとんどの場合
+#   matchedField ← columnIndex の値を取り出し、先頭行 (ヘッダー) を読み飛ばし、str() にし、
+#   値が無ければ必須項目は None、任意項目は "" にする
+# という同じ処理なので、mapping の列番号・項目を定数として埋め込んだコードをここで作る。
+#
+#   - 行の射影は operator.itemgetter(列番号, ...) 1回 (割り当てた列だけをタプルで取り出す)
+#   - レコードは項目名を定数で書いた dict 表示で作る (dict(zip(...)) や項目ごとのループを使わない)
+#   - マッピングされていない項目は固定値 (必須項目は None、任意項目は "") をコードに直接書く
+#   - 列数が足りない行だけ None で埋めてから取り出す
+#
+# 生成したコードは generated_transform.py として成果物に保存するので、何が実行されたかを確認できる。
+# mapping に独自の変換ルール (CUSTOM_RULE_KEYS) がある場合はこのコンパイラでは扱えないので、従来どおりLLMで生成する。
+
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from app.code_generation import REQUIRED_FIELDS, OPTIONAL_FIELDS
+
+TRANSFORM_COMPILER_ENABLED = os.environ.get("TRANSFORM_COMPILER_ENABLED", "1") != "0"
+COMPILER_VERSION = 1  # 生成するコードの内容を変えたら上げる (成果物IDに含まれる)
+
+OUTPUT_FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+
+# mapping の要素にこれらのキー (空でない値) があれば、単純な取り出し以外の変換が要るとみなす
+CUSTOM_RULE_KEYS = ("transformRule", "transformation", "customRule", "rule")
+
+_TEMPLATE = '''\
+# generated_transform.py
+# app/transform_compiler.py (version {version}) がマッピングから生成したコード (LLMは使っていません)
+#
+{mapping_comment}
+
+from itertools import repeat
+from operator import itemgetter
+
+MAX_INDEX = {max_index!r}
+_project = itemgetter({indexes})
+
+def transform_data(mapping, row_data):
+    # mapping は生成時に埋め込み済みなので使わない (呼び出し形を生成コードとそろえるための引数)
+    rows = row_data[1:]  # 先頭行はヘッダー
+    if rows and min(map(len, rows)) <= MAX_INDEX:
+        # 列数が足りない行は None で埋める (元の行は変更しない)
+        rows = [row if len(row) > MAX_INDEX else (*row, *repeat(None, MAX_INDEX + 1 - len(row))) for row in rows]
+    return [
+        {{
+{record}
+        }}
+        for {targets} in map(_project, rows)
+    ]
+'''
+
+# 割り当てられた列が1つも無い場合 (全項目が固定値)
+_CONSTANT_TEMPLATE = '''\
+# generated_transform.py
+# app/transform_compiler.py (version {version}) がマッピングから生成したコード (LLMは使っていません)
+#
+{mapping_comment}
+
+def transform_data(mapping, row_data):
+    return [
+        {{
+{record}
+        }}
+        for _ in row_data[1:]
+    ]
+'''
+
+def has_custom_rules(mapping: list) -> bool:
+    """
+    mapping に独自の変換ルールが含まれているか (含まれていればLLMでコードを生成する)。
+    """
+    return any(isinstance(m, dict) and any(m.get(key) for key in CUSTOM_RULE_KEYS) for m in mapping or [])
+
+def _field_sources(mapping: list) -> Optional[Dict[str, int]]:
+    """
+    項目 -> 列番号。同じ項目が複数の列に割り当てられている場合は、生成コードと同じく後の要素を使う。
+    mapping の形が想定と違う場合は None。
+    """
+    sources = {}
+    for m in mapping or []:
+        if not isinstance(m, dict):
+            return None
+        field = m.get("matchedField")
+        if not field:
+            continue
+        index = m.get("columnIndex")
+        if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+            return None
+        sources[field] = index
+    return sources
+
+def can_compile(mapping: list) -> bool:
+    return not has_custom_rules(mapping) and _field_sources(mapping) is not None
+
+def compile_transform_source(mapping: list) -> str:
+    """
+    mapping を埋め込んだ transform_data のソースコードを返す。
+    can_compile(mapping) が False の mapping には使えない (ValueError)。
+    """
+    if has_custom_rules(mapping):
+        raise ValueError("mapping に独自の変換ルールがあるため、コンパイラでは生成できません")
+    sources = _field_sources(mapping)
+    if sources is None:
+        raise ValueError("mapping の形式が正しくありません (columnIndex は0以上の整数)")
+
+    # 出力の項目順 (必須項目 → 任意項目) に、取り出す値 (v0, v1, ...) か固定値を並べる
+    indexes = []
+    entries = []
+    comments = []
+    for field in OUTPUT_FIELDS:
+        null_value = None if field in REQUIRED_FIELDS else ""
+        if field in sources:
+            name = f"v{len(indexes)}"
+            indexes.append(sources[field])
+            entries.append(f"            {field!r}: {null_value!r} if {name} is None else str({name}),")
+            comments.append(f"#   {field} <- 列{sources[field]}")
+        else:
+            entries.append(f"            {field!r}: {null_value!r},")
+            comments.append(f"#   {field} = {null_value!r} (未割り当て)")
+
+    if not indexes:
+        return _CONSTANT_TEMPLATE.format(
+            version=COMPILER_VERSION, mapping_comment="\n".join(comments), record="\n".join(entries)
+        )
+    targets = [f"v{i}" for i in range(len(indexes))]
+    return _TEMPLATE.format(
+        version=COMPILER_VERSION,
+        mapping_comment="\n".join(comments),
+        max_index=max(indexes),
+        indexes=", ".join(map(str, indexes)),
+        record="\n".join(entries),
+        # itemgetter は列が1つなら値そのもの、2つ以上ならタプルを返す
+        targets=targets[0] if len(targets) == 1 else ", ".join(targets)
+    )
+
+def compile_transform(mapping: list, source: Optional[str] = None) -> Callable[[list, list], List[Dict[str, Any]]]:
+    """
+    mapping 専用の transform_data 関数を返す。コードはこのモジュールが組み立てたものなので、
+    サンドボックスを通さずにこのプロセスで実行する。
+    """
+    source = source or compile_transform_source(mapping)
+    namespace = {}
+    exec(compile(source, "generated_transform.py", "exec"), namespace)
+    return namespace["transform_data"]
@@ -0,0 +1,92 @@
+# app/transform_runner.py
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, List
+
+def run_transform_in_chunks(
+    transform_func: Callable[[list, list], list],
+    mapping: list,
+    row_chunks: Iterable[List[list]],
+    on_records: Callable[[list], None]
+) -> int:
+    """
+    生成された transform_data(mapping, row_data) をチャンク単位で呼び出し、
+    変換結果をチャンクごとに on_records へ渡す。戻り値は出力レコード数。
+
+    生成コードは row_data[1:] のように先頭行(ヘッダー)を読み飛ばすことが多いので、
+    2チャンク目以降はファイル先頭行を頭に付けて呼び出し、
+    先頭行だけを変換したときの出力件数分を結果から取り除く。
+    こうすると先頭行を読み飛ばすコードでも読み飛ばさないコードでも、
+    全行を一度に渡した場合と同じ結果になる。
+    """
+    first_row = None
+    carry_count = None
+    total = 0
+
+    for chunk in row_chunks:
+        if not chunk:
+            continue
+
+        if first_row is None:
+            first_row = chunk[0]
+            records = transform_func(mapping, chunk)
+        else:
+            if carry_count is None:
+                carry_count = len(transform_func(mapping, [first_row]))
+            records = transform_func(mapping, [first_row] + chunk)[carry_count:]
+
+        if records:
+            on_records(records)
+            total += len(records)
+
+    return total
+
+def run_transform_parallel(
+    submit_func: Callable[[list, list], Future],
+    mapping: list,
+    row_chunks: Iterable[List[list]],
+    on_records: Callable[[list], None],
+    max_in_flight: int = 8
+) -> int:
+    """
+    run_transform_in_chunks() の並列版。submit_func(mapping, rows) は Future を返す関数
+    (例: sandbox_pool.submit を source で部分適用したもの) で、チャンクを複数プロセスに同時に投げる。
+    結果は投入した順に on_records へ渡すので、出力の並びは逐次版と同じ。
+    先頭行の扱い (ヘッダー読み飛ばし) も逐次版と同じ方法で合わせる。
+    同時に抱えるチャンクは max_in_flight 個までに抑え、読み込みが変換より先に進みすぎないようにする。
+    """
+    pending = deque()  # (Future, 先頭から取り除く件数)
+    first_row = None
+    carry_count = None
+    total = 0
+
+    def drain(limit):
+        nonlocal total
+        while len(pending) > limit:
+            future, skip = pending.popleft()
+            records = future.result()[skip:]
+            if records:
+                on_records(records)
+                total += len(records)
+
+    try:
+        for chunk in row_chunks:
+            if not chunk:
+                continue
+
+            if first_row is None:
+                first_row = chunk[0]
+                pending.append((submit_func(mapping, chunk), 0))
+            else:
+                if carry_count is None:
+                    carry_count = len(submit_func(mapping, [first_row]).result())
+                pending.append((submit_func(mapping, [first_row] + chunk), carry_count))
+            drain(max_in_flight - 1)
+        drain(0)
+    finally:
+        # 途中で失敗・キャンセルした場合、まだ始まっていないチャンクは取り消す
+        for future, _ in pending:
+            future.cancel()
+
+    return total
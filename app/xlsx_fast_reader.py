@@ -0,0 +1,315 @@
+# app/xlsx_fast_reader.py
+#
+# openpyxl の read_only モードの代わりに使える、読み込み専用の高速XLSXリーダー。
+# zip 内のシートXMLを iterparse で直接読み、セルごとのオブジェクトを作らずに値のタプルを返す。
+#   - sharedStrings.xml は最初に1回だけ読み込み、インデックスで引けるリストにしておく
+#   - 日付判定はスタイル (cellXfs) ごとに最初に1回だけ行い、セルごとには集合の検索だけにする
+#   - 読み終わった <row> 要素はすぐに捨てるので、行数が増えてもメモリが増えない
+# 出力は load_workbook(read_only=True) の ws.iter_rows(values_only=True) と同じになるようにしている
+# (dimension による列数・行数の切り詰めや、欠けた行の埋め方も openpyxl に合わせる)。
+# file_to_json からは XLSX_READER_BACKEND=fast で使う。
+
+import posixpath
+import zipfile
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from openpyxl.xml.functions import iterparse, fromstring
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, CALENDAR_MAC_1904
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+from openpyxl.formula.translate import Translator
+
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+DOC_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_ROW = f"{{{SHEET_MAIN_NS}}}row"
+_CELL = f"{{{SHEET_MAIN_NS}}}c"
+_VALUE = f"{{{SHEET_MAIN_NS}}}v"
+_FORMULA = f"{{{SHEET_MAIN_NS}}}f"
+_INLINE = f"{{{SHEET_MAIN_NS}}}is"
+_TEXT = f"{{{SHEET_MAIN_NS}}}t"
+_RUN = f"{{{SHEET_MAIN_NS}}}r"
+_SI = f"{{{SHEET_MAIN_NS}}}si"
+_DIMENSION = f"{{{SHEET_MAIN_NS}}}dimension"
+_SHEET_DATA = f"{{{SHEET_MAIN_NS}}}sheetData"
+
+def _text_content(node) -> str:
+    """
+    <si> / <is> の文字列。openpyxl の Text.content と同じく、直下の <t> と <r><t> をつなげる
+    (ふりがな <rPh> は含めない)。
+    """
+    parts = []
+    plain = node.find(_TEXT)
+    if plain is not None and plain.text:
+        parts.append(plain.text)
+    for run in node.findall(_RUN):
+        t = run.find(_TEXT)
+        if t is not None and t.text:
+            parts.append(t.text)
+    return "".join(parts)
+
+def _cast_number(value: str):
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+def _column_index(ref: str) -> int:
+    col = 0
+    for ch in ref:
+        if "A" <= ch <= "Z":
+            col = col * 26 + (ord(ch) - 64)
+        else:
+            break
+    return col
+
+def _resolve(base_dir: str, target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+def _read_rels(archive: zipfile.ZipFile, rels_path: str) -> Dict[str, Tuple[str, str]]:
+    """
+    .rels を読み、{Id: (Type, Target)} を返す。
+    """
+    try:
+        root = fromstring(archive.read(rels_path))
+    except KeyError:
+        return {}
+    return {
+        rel.get("Id"): (rel.get("Type", ""), rel.get("Target", ""))
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship")
+    }
+
+class FastWorksheet:
+    def __init__(self, workbook: "FastWorkbook", title: str, path: str):
+        self.parent = workbook
+        self.title = title
+        self._path = path
+
+    def iter_rows(self, values_only: bool = True) -> Iterator[tuple]:
+        """
+        openpyxl の ReadOnlyWorksheet.iter_rows(values_only=True) と同じ値を返す。
+        セルオブジェクトは作らないので values_only=False には対応しない。
+        """
+        if not values_only:
+            raise ValueError("xlsx_fast_reader は values_only=True のみ対応しています")
+        return self._iter_rows()
+
+    def _iter_rows(self) -> Iterator[tuple]:
+        wb = self.parent
+        shared_strings = wb.shared_strings
+        date_styles = wb.date_styles
+        timedelta_styles = wb.timedelta_styles
+        epoch = wb.epoch
+        shared_formulae: Dict[str, Translator] = {}
+
+        max_col = max_row = None
+        empty_row = []  # dimension が無い場合、openpyxl は欠けた行を [] で返す
+        sheet_data = None
+        counter = 1
+        idx = 1
+        row_counter = 0
+
+        with wb._archive.open(self._path) as src:
+            for event, element in iterparse(src, events=("start", "end")):
+                tag = element.tag
+                if event == "start":
+                    if tag == _SHEET_DATA:
+                        sheet_data = element
+                    continue
+
+                if tag == _DIMENSION:
+                    try:
+                        _, _, max_col, max_row = range_boundaries(element.get("ref"))
+                    except (TypeError, ValueError):
+                        max_col = max_row = None
+                    empty_row = (None,) * max_col if max_col else []
+                    continue
+                if tag != _ROW:
+                    continue
+
+                # --- 1行分のセルを読む ---
+                r = element.get("r")
+                if r is not None:
+                    try:
+                        row_counter = int(r)
+                    except ValueError:
+                        row_counter = int(float(r))
+                else:
+                    row_counter += 1
+                col_counter = 0
+                cells: List[Tuple[int, object]] = []
+                for c in element:
+                    if c.tag != _CELL:
+                        continue
+                    ref = c.get("r")
+                    col_counter = _column_index(ref) if ref else col_counter + 1
+                    data_type = c.get("t", "n")
+
+                    formula = c.find(_FORMULA)
+                    if formula is not None:
+                        value = self._formula_value(formula, ref, shared_formulae)
+                    elif data_type == "inlineStr":
+                        inline = c.find(_INLINE)
+                        value = _text_content(inline) if inline is not None else None
+                    else:
+                        v = c.find(_VALUE)
+                        value = v.text if v is not None else None
+                        if value:
+                            if data_type == "n":
+                                value = _cast_number(value)
+                                style = c.get("s")
+                                if style and int(style) in date_styles:
+                                    try:
+                                        value = from_excel(value, epoch, timedelta=int(style) in timedelta_styles)
+                                    except (OverflowError, ValueError):
+                                        value = "#VALUE!"
+                            elif data_type == "s":
+                                value = shared_strings[int(value)]
+                            elif data_type == "b":
+                                value = bool(int(value))
+                            elif data_type == "d":
+                                value = from_ISO8601(value)
+                        else:
+                            value = None
+                    cells.append((col_counter, value))
+
+                # 読み終えた <row> は親から外して捨てる (メモリが行数に比例して増えないように)
+                if sheet_data is not None:
+                    sheet_data.clear()
+                else:
+                    element.clear()
+
+                # --- openpyxl の _cells_by_row と同じ埋め方で返す ---
+                idx = row_counter
+                if max_row is not None and idx > max_row:
+                    break
+                while counter < idx:
+                    counter += 1
+                    yield empty_row
+                if counter <= idx:
+                    counter += 1
+                    yield self._build_row(cells, max_col)
+
+        if max_row is not None and max_row < idx:
+            for _ in range(counter, max_row + 1):
+                yield empty_row
+
+    @staticmethod
+    def _build_row(cells: List[Tuple[int, object]], max_col: Optional[int]) -> tuple:
+        if not cells and not max_col:
+            return ()
+        width = max_col or cells[-1][0]
+        row = [None] * width
+        for col, value in cells:
+            if 1 <= col <= width:
+                row[col - 1] = value
+        return tuple(row)
+
+    @staticmethod
+    def _formula_value(formula, ref: Optional[str], shared_formulae: Dict[str, Translator]):
+        # openpyxl (data_only=False) と同じく、数式セルは "=..." の文字列を返す
+        value = "=" + (formula.text or "")
+        formula_type = formula.get("t")
+        if formula_type == "array":
+            return ArrayFormula(ref=formula.get("ref"), text=value)
+        if formula_type == "shared":
+            si = formula.get("si")
+            if si in shared_formulae:
+                return shared_formulae[si].translate_formula(ref)
+            if value != "=":
+                shared_formulae[si] = Translator(value, ref)
+        elif formula_type == "dataTable":
+            return DataTableFormula(**formula.attrib)
+        return value
+
+class FastWorkbook:
+    """
+    openpyxl の読み込み専用ワークブックのうち、file_to_json が使う部分
+    (sheetnames / wb[name].iter_rows(values_only=True) / close()) だけを持つ。
+    """
+
+    def __init__(self, filename: str):
+        self._archive = zipfile.ZipFile(filename)
+        try:
+            self._load_workbook_part()
+        except Exception:
+            self._archive.close()
+            raise
+        self._shared_strings: Optional[List[str]] = None
+
+    def _load_workbook_part(self) -> None:
+        package_rels = _read_rels(self._archive, "_rels/.rels")
+        workbook_path = next(
+            (target.lstrip("/") for rel_type, target in package_rels.values() if rel_type.endswith("/officeDocument")),
+            "xl/workbook.xml"
+        )
+        base_dir = posixpath.dirname(workbook_path)
+        rels = _read_rels(self._archive, posixpath.join(base_dir, "_rels", posixpath.basename(workbook_path) + ".rels"))
+        self._parts = {
+            rel_type.rsplit("/", 1)[-1]: _resolve(base_dir, target)
+            for rel_type, target in rels.values()
+            if rel_type.endswith(("/sharedStrings", "/styles"))
+        }
+
+        root = fromstring(self._archive.read(workbook_path))
+        pr = root.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+        date1904 = pr is not None and pr.get("date1904") in ("1", "true")
+        self.epoch = CALENDAR_MAC_1904 if date1904 else WINDOWS_EPOCH
+
+        self._sheets: List[Tuple[str, Optional[str]]] = []
+        for sheet in root.iter(f"{{{SHEET_MAIN_NS}}}sheet"):
+            rel_type, target = rels.get(sheet.get(f"{{{DOC_REL_NS}}}id"), ("", ""))
+            path = _resolve(base_dir, target) if rel_type.endswith("/worksheet") else None
+            self._sheets.append((sheet.get("name"), path))
+
+        self.date_styles, self.timedelta_styles = self._read_date_styles()
+
+    def _read_date_styles(self) -> Tuple[Set[int], Set[int]]:
+        """
+        日付・時間の表示形式を持つスタイル番号の集合。判定は openpyxl の Stylesheet に任せる。
+        """
+        path = self._parts.get("styles")
+        if not path:
+            return set(), set()
+        try:
+            stylesheet = Stylesheet.from_tree(fromstring(self._archive.read(path)))
+        except KeyError:
+            return set(), set()
+        if not stylesheet.cell_styles:
+            return set(), set()
+        return set(stylesheet.date_formats), set(stylesheet.timedelta_formats)
+
+    @property
+    def shared_strings(self) -> List[str]:
+        if self._shared_strings is None:
+            strings = []
+            path = self._parts.get("sharedStrings")
+            if path and path in self._archive.namelist():
+                with self._archive.open(path) as src:
+                    for _, node in iterparse(src):
+                        if node.tag == _SI:
+                            strings.append(_text_content(node).replace("x005F_", ""))
+                            node.clear()
+            self._shared_strings = strings
+        return self._shared_strings
+
+    @property
+    def sheetnames(self) -> List[str]:
+        return [name for name, _ in self._sheets]
+
+    def __getitem__(self, name: str) -> FastWorksheet:
+        for sheet_name, path in self._sheets:
+            if sheet_name == name:
+                if path is None:
+                    raise KeyError(f"Worksheet {name} is not a worksheet")
+                return FastWorksheet(self, name, path)
+        raise KeyError(f"Worksheet {name} does not exist.")
+
+    def close(self) -> None:
+        self._archive.close()
+
+def open_workbook(filename: str) -> FastWorkbook:
+    return FastWorkbook(filename)
@@ -0,0 +1,357 @@
+# benchmarks/bench_pipeline.py
+#
+# 読み込み・変換・書き出し・解析パイプラインのベンチマーク。
+# 行数 (1千〜100万行) と列数 (narrow / wide) を変えた合成ワークブックを作り、段階ごとに
+# 時間 (repeat 回の最小値) とメモリのピーク (tracemalloc、時間とは別の1回で測定) を記録する。
+#
+#   段階                 測るもの
+#   convert_preview     convert_xlsx_to_json(limit_rows=True)  (先頭100行)
+#   convert_full        convert_xlsx_to_json(limit_rows=False) (全行)
+#   transform           参照用の変換コード app/generated/generated_transform.py の transform_data (全行)
+#   transform_compiled  app/transform_compiler.py がマッピングから組み立てた transform_data (全行)
+#   validate            変換結果を app/customer_schema.py で検証・正規化する (5000件ずつ)
+#   json_output         変換結果を JsonArrayWriter で transformed_data.json 形式に書き出す
+#   analyze             process_file_and_map (LLM呼び出しはスタブに差し替え、サイドカー無し)
+#
+# 結果はJSONで保存するので、--compare で以前の結果と比べて遅くなった段階を確認できる。
+#
+#   python benchmarks/bench_pipeline.py                              # quick: 1千・1万行
+#   python benchmarks/bench_pipeline.py --preset full                # 1千〜100万行
+#   python benchmarks/bench_pipeline.py --rows 50000 --widths wide --stages convert_full,transform
+#   python benchmarks/bench_pipeline.py --compare benchmarks/results/前回.json
+#
+# 生成したワークブックは --data-dir (既定: benchmarks/.data) に保存し、次回以降は作り直さない。
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from openpyxl import Workbook
+
+from app import main_processor
+from app.customer_schema import CustomerSchemaValidator
+from app.transform_compiler import compile_transform
+from app.file_to_json import convert_xlsx_to_json
+from app.output_writers import JsonArrayWriter
+
+PRESETS = {
+    "quick": [1000, 10000],
+    "full": [1000, 10000, 100000, 1000000],
+}
+WIDTHS = {"narrow": 8, "wide": 60}
+STAGES = ("convert_preview", "convert_full", "transform", "transform_compiled", "validate", "json_output", "analyze")
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+REFERENCE_TRANSFORM = os.path.join(ROOT, "app", "generated", "generated_transform.py")
+
+# 先頭8列は顧客マスタの項目に対応する列 (参照用の変換コードがそのまま使える)
+BASE_COLUMNS = [
+    ("顧客コード", "distributorCode"),
+    ("顧客名", "CustomerName"),
+    ("アカウント番号", "AccountNumber"),
+    ("ランク", "Rank"),
+    ("営業担当", "SalesPic"),
+    ("部品担当", "PartsSalesPic"),
+    ("サービス担当", "ServicePic"),
+    ("住所", "BillingAddress1"),
+]
+
+# --- 合成データ ---
+
+def _cell(r, c, base):
+    if c == 0:
+        return f"D{r:07d}"
+    if c == 1:
+        return f"株式会社{r % 5000}"
+    if c == 2:
+        return 100000 + r
+    if c == 3:
+        return "ABC"[r % 3]
+    if c in (4, 5, 6):
+        return f"担当{(r + c) % 200}"
+    if c == 7:
+        return f"東京都千代田区{r % 100}-{r % 7}"
+    kind = c % 4  # 9列目以降は文字列・数値・日付・空欄が混ざった列
+    if kind == 0:
+        return f"メモ{r % 1000}"
+    if kind == 1:
+        return r * 10 + c
+    if kind == 2:
+        return base + datetime.timedelta(days=r % 3650)
+    return None if r % 3 else r / 7
+
+def create_workbook(file_path, rows, cols):
+    """
+    ヘッダー1行 + rows 行のワークブックを write_only で作る (100万行でもメモリを使わない)。
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append([BASE_COLUMNS[c][0] if c < len(BASE_COLUMNS) else f"項目{c}" for c in range(cols)])
+    base = datetime.datetime(2024, 1, 1)
+    for r in range(rows):
+        ws.append([_cell(r, c, base) for c in range(cols)])
+    tmp_path = file_path + ".tmp"
+    wb.save(tmp_path)
+    os.replace(tmp_path, file_path)
+
+def workbook_for(data_dir, rows, cols):
+    os.makedirs(data_dir, exist_ok=True)
+    file_path = os.path.join(data_dir, f"bench_{rows}x{cols}.xlsx")
+    if not os.path.exists(file_path):
+        started = time.perf_counter()
+        create_workbook(file_path, rows, cols)
+        print(f"  generated {os.path.basename(file_path)} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return file_path
+
+def mapping_for(cols):
+    return [
+        {"columnIndex": c, "columnName": BASE_COLUMNS[c][0], "matchedField": BASE_COLUMNS[c][1], "confidence": 0.9}
+        for c in range(min(cols, len(BASE_COLUMNS)))
+    ]
+
+def load_reference_transform():
+    spec = importlib.util.spec_from_file_location("reference_transform", REFERENCE_TRANSFORM)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.transform_data
+
+# --- LLMのスタブ ---
+
+def stub_llm():
+    """
+    process_file_and_map が呼ぶLLM関数を、すぐに固定の結果を返す関数に差し替える。
+    """
+    def header_detection(request_data):
+        return {"status": "success", "headerDetection": {"isHeaderPresent": True, "headerRowIndex": 0, "reason": "stub"}}
+
+    def mapping(request_data):
+        width = max((len(row) for row in request_data["rowData"]), default=0)
+        return {"status": "success", "mapping": mapping_for(width), "missingRequiredFields": [], "additionalNotes": ""}
+
+    def header_and_mapping(request_data):
+        return {**header_detection(request_data), **mapping(request_data)}
+
+    main_processor.call_header_detection = header_detection
+    main_processor.call_mapping = mapping
+    main_processor.call_header_and_mapping = header_and_mapping
+
+# --- 測定 ---
+
+def measure(func, repeat, with_memory=True):
+    """
+    tracemalloc で測ったメモリのピーク (1回) と、func() を repeat 回実行した最小時間を返す。
+    tracemalloc を有効にすると遅くなるので、時間の測定中は止めておく。
+    戻り値の2つ目は最後に実行した func() の結果。
+    """
+    peak = None
+    if with_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    times = []
+    value = None
+    for _ in range(max(1, repeat)):
+        value = None  # 前回の結果を解放してから測る
+        started = time.perf_counter()
+        value = func()
+        times.append(time.perf_counter() - started)
+    return {"seconds": round(min(times), 4), "peakMemoryBytes": peak}, value
+
+def run_case(file_path, rows, cols, stages, repeat, with_memory, transform_data, tmp_dir):
+    results = {}
+    mapping = mapping_for(cols)
+    all_rows = None
+    records = None
+
+    def record(stage, func, count=None):
+        result, value = measure(func, repeat, with_memory)
+        if count is not None and result["seconds"] > 0:
+            result["rowsPerSecond"] = round(count / result["seconds"])
+        results[stage] = result
+        print(f"  {stage:16s} {result['seconds']:>9.4f}s  peak={_fmt_bytes(result['peakMemoryBytes'])}", file=sys.stderr)
+        return value
+
+    if "convert_preview" in stages:
+        record("convert_preview", lambda: convert_xlsx_to_json(file_path, limit_rows=True))
+
+    # transform / json_output は全行の rowData を入力に使う
+    if stages & {"convert_full", "transform", "transform_compiled", "validate", "json_output"}:
+        if "convert_full" in stages:
+            full = record("convert_full", lambda: convert_xlsx_to_json(file_path, limit_rows=False), rows + 1)
+        else:
+            full = convert_xlsx_to_json(file_path, limit_rows=False)
+        all_rows = full["rowData"]
+
+    if "transform_compiled" in stages:
+        compiled = compile_transform(mapping)
+        record("transform_compiled", lambda: compiled(mapping, all_rows), rows)
+
+    if stages & {"transform", "validate", "json_output"}:
+        if "transform" in stages:
+            records = record("transform", lambda: transform_data(mapping, all_rows), rows)
+        else:
+            records = transform_data(mapping, all_rows)
+        all_rows = None
+
+    if "validate" in stages:
+        def validate():
+            validator = CustomerSchemaValidator()
+            for i in range(0, len(records), 5000):
+                validator.validate(records[i:i + 5000])
+            return validator.report()
+
+        record("validate", validate, rows)
+
+    if "json_output" in stages:
+        out_path = os.path.join(tmp_dir, "transformed_data.json")
+
+        def write_json():
+            with JsonArrayWriter(out_path) as writer:
+                for i in range(0, len(records), 5000):
+                    writer.write_records(records[i:i + 5000])
+            return os.path.getsize(out_path)
+
+        output_size = record("json_output", write_json, rows)
+        results["json_output"]["outputBytes"] = output_size
+        records = None
+
+    if "analyze" in stages:
+        def analyze():
+            result = main_processor.process_file_and_map(file_path, mode="sequential", header_confidence_threshold=2.0)
+            if result["status"] != "success":
+                raise RuntimeError(result)
+            return result
+        record("analyze", analyze)
+
+    return results
+
+def _fmt_bytes(value):
+    if value is None:
+        return "-"
+    return f"{value / 1024 / 1024:.1f}MB"
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# --- 前回の結果との比較 ---
+
+def compare(report, baseline, tolerance):
+    """
+    同じ (rows, cols, stage) の秒数とメモリのピークを比べ、tolerance (0.2 = 20%) を超えて悪化したものを返す。
+    """
+    previous = {(c["rows"], c["cols"]): c["results"] for c in baseline.get("cases", [])}
+    rows = []
+    for case in report["cases"]:
+        before = previous.get((case["rows"], case["cols"]))
+        if not before:
+            continue
+        for stage, now in case["results"].items():
+            old = before.get(stage)
+            if not old:
+                continue
+            for metric in ("seconds", "peakMemoryBytes"):
+                if not old.get(metric) or now.get(metric) is None:
+                    continue
+                ratio = now[metric] / old[metric]
+                rows.append({
+                    "rows": case["rows"], "cols": case["cols"], "stage": stage, "metric": metric,
+                    "before": old[metric], "after": now[metric], "ratio": round(ratio, 3),
+                    "regression": ratio > 1 + tolerance
+                })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="読み込み・変換・書き出し・解析のベンチマーク")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--rows", help="行数のカンマ区切り (指定時は --preset より優先)")
+    parser.add_argument("--widths", default="narrow,wide", help=f"列数のカンマ区切り ({', '.join(WIDTHS)} または数値)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"測定する段階 ({', '.join(STAGES)})")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc によるメモリ測定を省略する")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="生成したワークブックの保存先")
+    parser.add_argument("--output", help="結果JSONの保存先 (既定: benchmarks/results/pipeline_<日時>.json)")
+    parser.add_argument("--compare", help="比較する以前の結果JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなす割合 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    row_counts = [int(v) for v in args.rows.split(",")] if args.rows else PRESETS[args.preset]
+    widths = [(w, WIDTHS[w]) if w in WIDTHS else (f"cols{w}", int(w)) for w in args.widths.split(",")]
+    stages = set(args.stages.split(","))
+    unknown = stages - set(STAGES)
+    if unknown:
+        parser.error(f"不明な段階です: {', '.join(sorted(unknown))}")
+
+    stub_llm()
+    transform_data = load_reference_transform()
+    report = {
+        "benchmark": "pipeline",
+        "createdAt": datetime.datetime.now().isoformat(timespec="seconds"),
+        "gitCommit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "repeat": args.repeat,
+        "cases": []
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in row_counts:
+            for width_name, cols in widths:
+                print(f"[{rows} rows x {cols} cols ({width_name})]", file=sys.stderr)
+                file_path = workbook_for(args.data_dir, rows, cols)
+                results = run_case(
+                    file_path, rows, cols, stages, args.repeat, not args.no_memory, transform_data, tmp_dir
+                )
+                report["cases"].append({
+                    "rows": rows,
+                    "cols": cols,
+                    "width": width_name,
+                    "fileSize": os.path.getsize(file_path),
+                    "results": results
+                })
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        regressions = [c for c in report["comparison"] if c["regression"]]
+        for c in regressions:
+            print(
+                f"REGRESSION {c['rows']}x{c['cols']} {c['stage']} {c['metric']}: "
+                f"{c['before']} -> {c['after']} (x{c['ratio']})", file=sys.stderr
+            )
+        exit_code = 1 if regressions else 0
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pipeline_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"saved: {output}", file=sys.stderr)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
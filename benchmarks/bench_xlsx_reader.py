@@ -0,0 +1,110 @@
+# benchmarks/bench_xlsx_reader.py
+#
+# XLSXリーダーのバックエンド (openpyxl read_only / app/xlsx_fast_reader.py) の速度比較。
+# 合成したワークブックを両方で全行読み、結果が一致することを確認したうえで時間を測る。
+#
+#   python benchmarks/bench_xlsx_reader.py --rows 100000 --cols 20 --repeat 3 --output result.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook, load_workbook
+from app.xlsx_fast_reader import open_workbook
+
+def create_workbook(file_path, rows, cols):
+    """
+    文字列・数値・日付が混ざった1シートのワークブックを write_only で作る。
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append([f"列{c}" for c in range(cols)])
+    base = datetime.datetime(2024, 1, 1)
+    for r in range(rows):
+        row = []
+        for c in range(cols):
+            kind = c % 4
+            if kind == 0:
+                row.append(f"D{r:07d}")
+            elif kind == 1:
+                row.append(f"株式会社{r % 5000}")
+            elif kind == 2:
+                row.append(r * 10 + c)
+            else:
+                row.append(base + datetime.timedelta(days=r % 3650))
+        ws.append(row)
+    wb.save(file_path)
+
+def read_openpyxl(file_path):
+    wb = load_workbook(filename=file_path, read_only=True)
+    try:
+        ws = wb[wb.sheetnames[0]]
+        return [list(row) for row in ws.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+def read_fast(file_path):
+    wb = open_workbook(file_path)
+    try:
+        ws = wb[wb.sheetnames[0]]
+        return [list(row) for row in ws.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+BACKENDS = {"openpyxl": read_openpyxl, "fast": read_fast}
+
+def measure(func, file_path, repeat):
+    times = []
+    rows = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = func(file_path)
+        times.append(time.perf_counter() - started)
+    return min(times), rows
+
+def main():
+    parser = argparse.ArgumentParser(description="XLSXリーダーのバックエンド比較")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--file", help="既存のxlsxを使う場合のパス (指定時は --rows/--cols は無視)")
+    parser.add_argument("--output", help="結果JSONの保存先")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = args.file or os.path.join(tmp_dir, "bench.xlsx")
+        if not args.file:
+            create_workbook(file_path, args.rows, args.cols)
+
+        results = {}
+        outputs = {}
+        for name, func in BACKENDS.items():
+            seconds, rows = measure(func, file_path, args.repeat)
+            outputs[name] = rows
+            results[name] = {"seconds": round(seconds, 4), "rows": len(rows), "rowsPerSecond": round(len(rows) / seconds)}
+
+        report = {
+            "benchmark": "xlsx_reader",
+            "file": args.file,
+            "rows": args.rows,
+            "cols": args.cols,
+            "fileSize": os.path.getsize(file_path),
+            "identical": outputs["openpyxl"] == outputs["fast"],
+            "speedup": round(results["openpyxl"]["seconds"] / results["fast"]["seconds"], 2),
+            "backends": results
+        }
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report["identical"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# test/test_artifacts.py
+
+import os
+import pytest
+
+from app.artifacts import (
+    ArtifactWriter, artifact_id_for, artifact_path, latest_artifact_id, load_manifest, prune_artifacts
+)
+
+MAPPING = [
+    {"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9},
+    {"columnIndex": 1, "columnName": "顧客名", "matchedField": "CustomerName", "confidence": 0.95},
+]
+
+def test_artifact_id_depends_on_inputs(tmp_path):
+    src = tmp_path / "a.csv"
+    src.write_text("x,y\n1,2\n", encoding="utf-8")
+    base = artifact_id_for(str(src), MAPPING, "llm", "prompt v1")
+    assert base == artifact_id_for(str(src), list(reversed(MAPPING)), "llm", "prompt v1")
+    assert base != artifact_id_for(str(src), MAPPING, "llm", "prompt v2")
+    assert base != artifact_id_for(str(src), MAPPING, "columnar")
+    assert len(base) == 24
+
+def test_invalid_id_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        artifact_path("../../etc", root=str(tmp_path))
+    assert load_manifest("../secret", root=str(tmp_path)) is None
+
+def test_commit_renames_atomically(tmp_path):
+    root = str(tmp_path)
+    artifact_id = "0" * 24
+    with ArtifactWriter(artifact_id, root=root) as artifact:
+        with open(artifact.path("transformed_data.json"), "w", encoding="utf-8") as f:
+            f.write("[]")
+        # commit 前は本来の名前では見えない
+        assert not os.path.exists(artifact.final_path("transformed_data.json"))
+        assert load_manifest(artifact_id, root=root) is None
+        artifact.commit({"engine": "columnar"})
+
+    manifest = load_manifest(artifact_id, root=root)
+    assert manifest["files"] == ["transformed_data.json"]
+    assert manifest["engine"] == "columnar"
+    assert latest_artifact_id(root=root) == artifact_id
+    assert sorted(os.listdir(artifact_path(artifact_id, root=root))) == ["manifest.json", "transformed_data.json"]
+
+def test_abort_leaves_nothing(tmp_path):
+    root = str(tmp_path)
+    artifact_id = "1" * 24
+    with pytest.raises(RuntimeError):
+        with ArtifactWriter(artifact_id, root=root) as artifact:
+            with open(artifact.path("transformed_data.json"), "w", encoding="utf-8") as f:
+                f.write("[")
+            raise RuntimeError("boom")
+    assert not os.path.exists(artifact_path(artifact_id, root=root))
+    assert latest_artifact_id(root=root) is None
+
+def test_concurrent_writers_do_not_clobber(tmp_path):
+    root = str(tmp_path)
+    a = ArtifactWriter("a" * 24, root=root)
+    b = ArtifactWriter("b" * 24, root=root)
+    for writer, text in ((a, "A"), (b, "B")):
+        with open(writer.path("generated_transform.py"), "w", encoding="utf-8") as f:
+            f.write(text)
+    b.commit()
+    a.commit()
+    with open(a.final_path("generated_transform.py"), encoding="utf-8") as f:
+        assert f.read() == "A"
+    with open(b.final_path("generated_transform.py"), encoding="utf-8") as f:
+        assert f.read() == "B"
+
+def test_later_commit_keeps_previous_formats(tmp_path):
+    root = str(tmp_path)
+    artifact_id = "2" * 24
+    first = ArtifactWriter(artifact_id, root=root)
+    open(first.path("transformed_data.csv"), "w").close()
+    first.commit()
+    second = ArtifactWriter(artifact_id, root=root)
+    open(second.path("transformed_data.json"), "w").close()
+    second.commit()
+    assert load_manifest(artifact_id, root=root)["files"] == ["transformed_data.csv", "transformed_data.json"]
+
+def test_prune_removes_oldest(tmp_path):
+    root = str(tmp_path)
+    for i, c in enumerate("cde"):
+        writer = ArtifactWriter(c * 24, root=root)
+        writer.commit()
+        os.utime(writer.final_path("manifest.json"), (i, i))
+    assert prune_artifacts(max_count=2, root=root) == 1
+    assert load_manifest("c" * 24, root=root) is None
+    assert load_manifest("e" * 24, root=root) is not None
+
+def test_download_converts_in_job(tmp_path, monkeypatch):
+    from app import artifacts, server
+    from app.jobs import job_manager
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", str(tmp_path))
+    artifact_id = "f" * 24
+    with ArtifactWriter(artifact_id) as artifact:
+        with open(artifact.path("transformed_data.json"), "w", encoding="utf-8") as f:
+            f.write('[{"CustomerName": "A社"}]')
+        artifact.commit({"engine": "columnar"})
+
+    # まだ csv が無ければ変換ジョブを投入して 202、終わった後は変換済みのファイルを返す
+    client = server.app.test_client()
+    response = client.get(f"/api/download/{artifact_id}/data?format=csv")
+    assert response.status_code == 202
+    job_id = response.get_json()["jobId"]
+    job_manager.get(job_id).future.result(timeout=5)
+
+    response = client.get(f"/api/download/{artifact_id}/data?format=csv")
+    assert response.status_code == 200
+    assert "A社" in response.get_data(as_text=True)
+    assert not [name for name in os.listdir(artifact_path(artifact_id)) if name.endswith(".tmp")]
+    assert "transformed_data.csv" in load_manifest(artifact_id)["files"]
+    assert job_manager.get(job_id).kind == "convert"
+    assert server._artifact_has_outputs(artifact_id, ["csv"], False)
@@ -0,0 +1,82 @@
+# test/test_chunked_upload.py
+
+import io
+import os
+import hashlib
+
+from app.chunked_upload import ChunkedUploadStore
+
+def make_store(tmp_path, max_size=10 * 1024 * 1024):
+    return ChunkedUploadStore(str(tmp_path), max_size)
+
+def upload_in_chunks(store, upload_id, data, chunk_size):
+    offset = 0
+    while offset < len(data):
+        body, status = store.append(upload_id, offset, io.BytesIO(data[offset:offset + chunk_size]))
+        assert status == 200, body
+        offset = body["offset"]
+
+def test_chunked_upload_roundtrip(tmp_path):
+    store = make_store(tmp_path)
+    data = b"PK\x03\x04" + os.urandom(3 * 1024 * 1024 + 17)
+    digest = hashlib.sha256(data).hexdigest()
+
+    body, status = store.init("Sample.XLSX", len(data), digest)
+    assert status == 201
+    upload_id = body["uploadId"]
+    upload_in_chunks(store, upload_id, data, 1024 * 1024)
+
+    body, status = store.finalize(upload_id)
+    assert status == 200
+    assert body["sha256"] == digest
+    assert body["savedFileName"].endswith("_sample.xlsx")
+    with open(tmp_path / body["savedFileName"], "rb") as f:
+        assert f.read() == data
+    assert store.status(upload_id)[1] == 404
+
+def test_resume_after_restart(tmp_path):
+    data = b"a,b\n" + b"1,2\n" * 1000
+    store = make_store(tmp_path)
+    upload_id = store.init("data.csv", len(data))[0]["uploadId"]
+    store.append(upload_id, 0, io.BytesIO(data[:1500]))
+
+    # 別インスタンス (再起動相当) で状態を確認し、続きから送る
+    restarted = make_store(tmp_path)
+    body, status = restarted.status(upload_id)
+    assert status == 200 and body["offset"] == 1500
+
+    # offset がずれていると 409 と現在位置が返る
+    body, status = restarted.append(upload_id, 1000, io.BytesIO(data[1000:]))
+    assert status == 409 and body["offset"] == 1500
+
+    restarted.append(upload_id, 1500, io.BytesIO(data[1500:]))
+    body, status = restarted.finalize(upload_id, hashlib.sha256(data).hexdigest())
+    assert status == 200
+
+def test_bad_magic_fails_fast(tmp_path):
+    store = make_store(tmp_path)
+    upload_id = store.init("fake.xlsx", 100)[0]["uploadId"]
+    body, status = store.append(upload_id, 0, io.BytesIO(b"not a zip file"))
+    assert status == 400
+    assert "xlsx" in body["message"]
+    assert store.status(upload_id)[1] == 404
+
+def test_size_and_hash_checks(tmp_path):
+    store = make_store(tmp_path, max_size=100)
+    assert store.init("big.csv", 101)[1] == 400
+    assert store.init("x.exe", 10)[1] == 400
+
+    upload_id = store.init("small.csv", 4)[0]["uploadId"]
+    assert store.append(upload_id, 0, io.BytesIO(b"abcdef"))[1] == 400
+    assert store.finalize(upload_id)[1] == 409
+
+    upload_id = store.init("small.csv", 4)[0]["uploadId"]
+    store.append(upload_id, 0, io.BytesIO(b"abcd"))
+    body, status = store.finalize(upload_id, "0" * 64)
+    assert status == 400
+    assert body["sha256"] == hashlib.sha256(b"abcd").hexdigest()
+
+def test_invalid_upload_id(tmp_path):
+    store = make_store(tmp_path)
+    assert store.status("../../etc/passwd")[1] == 404
+    assert store.append("nope", 0, io.BytesIO(b""))[1] == 404
@@ -0,0 +1,65 @@
+# test/test_code_cache.py
+
+from app.code_cache import CodeCache, mapping_signature
+
+MAPPING = [
+    {"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9},
+    {"columnIndex": 1, "columnName": "顧客名", "matchedField": "CustomerName", "confidence": 0.95},
+    {"columnIndex": 2, "columnName": "メモ", "matchedField": None, "confidence": 0.1},
+]
+
+SOURCE = "def transform_data(mapping, row_data):\n    return [list(r) for r in row_data[1:]]\n"
+
+def run_cached(code_obj, rows):
+    namespace = {}
+    exec(code_obj, namespace)
+    return namespace["transform_data"](MAPPING, rows)
+
+def test_signature_ignores_confidence_and_order():
+    reordered = [dict(m, confidence=0.1) for m in reversed(MAPPING)]
+    assert mapping_signature(reordered) == mapping_signature(MAPPING)
+    changed = [dict(MAPPING[0], matchedField="Rank")] + MAPPING[1:]
+    assert mapping_signature(changed) != mapping_signature(MAPPING)
+
+def test_signature_accepts_unmapped_entries_without_index():
+    unmapped = MAPPING[:2] + [{"columnIndex": None, "columnName": None, "matchedField": None}]
+    assert mapping_signature(unmapped) == mapping_signature(MAPPING[:2] + [{"columnIndex": "x", "matchedField": None}])
+
+def test_signature_with_mapped_and_unmapped_duplicate_column():
+    # 同じ列に割り当て済み・未割り当ての要素が混ざっていてもソートできる
+    mapping = [
+        {"columnIndex": 0, "columnName": "a", "matchedField": None},
+        {"columnIndex": 0, "columnName": "a", "matchedField": "distributorCode"},
+    ]
+    assert mapping_signature(mapping) == mapping_signature(list(reversed(mapping)))
+
+def test_codegen_rejects_invalid_column_index(tmp_path):
+    from app import server
+    csv_path = tmp_path / "customers.csv"
+    csv_path.write_text("顧客コード,顧客名\nD001,A社\n", encoding="utf-8")
+    bad = [dict(MAPPING[0], columnIndex=None)] + MAPPING[1:]
+    result, status = server.run_codegen_pipeline(str(csv_path), bad, [])
+    assert status == 400 and result["status"] == "error"
+
+def test_put_and_get_from_disk(tmp_path):
+    cache = CodeCache(cache_dir=str(tmp_path), max_entries=1)
+    assert cache.get(MAPPING, "prompt v1") is None
+    cache.put(MAPPING, "prompt v1", SOURCE)
+
+    # 別インスタンス (プロセス再起動相当) でもディスクから読める
+    other = CodeCache(cache_dir=str(tmp_path))
+    source, code_obj = other.get(MAPPING, "prompt v1")
+    assert source == SOURCE
+    assert run_cached(code_obj, [["h"], ["a"]]) == [["a"]]
+
+def test_prompts_are_isolated_and_stale_entries_purged_explicitly(tmp_path):
+    cache = CodeCache(cache_dir=str(tmp_path))
+    cache.put(MAPPING, "prompt v1", SOURCE)
+    assert cache.get(MAPPING, "prompt v2") is None
+    # 別のプロンプトで get/put しても、他のプロンプトのエントリは消えない
+    cache.put(MAPPING, "prompt v2", SOURCE)
+    assert cache.get(MAPPING, "prompt v1") is not None
+    assert cache.get(MAPPING, "prompt v2") is not None
+
+    assert CodeCache(cache_dir=str(tmp_path)).invalidate_stale("prompt v2") == 1
+    assert CodeCache(cache_dir=str(tmp_path)).get(MAPPING, "prompt v1") is None
@@ -0,0 +1,50 @@
+# test/test_columnar_transform.py
+
+import datetime
+import importlib.util
+from pathlib import Path
+from app import columnar_transform
+from app.columnar_transform import transform_columnar, columns_to_records, transform_data
+
+def load_reference_transform():
+    """app/generated/generated_transform.py の transform_data を比較用に読み込む"""
+    path = Path(__file__).resolve().parents[1] / "app" / "generated" / "generated_transform.py"
+    spec = importlib.util.spec_from_file_location("reference_transform", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.transform_data
+
+MAPPING = [
+    {"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9},
+    {"columnIndex": 1, "columnName": "顧客名", "matchedField": "CustomerName", "confidence": 0.95},
+    {"columnIndex": 2, "columnName": "アカウント番号", "matchedField": "AccountNumber", "confidence": 0.88},
+    {"columnIndex": 3, "columnName": "ランク", "matchedField": "Rank", "confidence": 0.5},
+    {"columnIndex": 5, "columnName": "住所", "matchedField": "BillingAddress1", "confidence": 0.5},
+    {"columnIndex": 4, "columnName": "メモ", "matchedField": None, "confidence": 0.1},
+]
+
+ROWS = [
+    ["顧客コード", "顧客名", "アカウント番号", "ランク", "メモ", "住所"],
+    ["D001", "株式会社ABC", 123, "A", "x", "東京都"],
+    ["D002", None, 456.5, None, None, None],
+    ["D003", "株式会社XYZ"],  # 列数が足りない行
+    [None, "", True, datetime.date(2024, 1, 2), "y", ""],
+]
+
+def test_matches_reference_transform():
+    assert transform_data(MAPPING, ROWS) == load_reference_transform()(MAPPING, ROWS)
+
+def test_matches_reference_without_numpy(monkeypatch):
+    monkeypatch.setattr(columnar_transform, "np", None)
+    assert transform_data(MAPPING, ROWS) == load_reference_transform()(MAPPING, ROWS)
+
+def test_column_buffers():
+    result = transform_columnar(MAPPING, ROWS)
+    assert result["rowCount"] == 4
+    assert list(result["columns"]["SalesPic"]) == ["", "", "", ""]
+    assert list(result["columns"]["AccountNumber"]) == ["123", "456.5", None, "True"]
+    assert len(columns_to_records(result)) == 4
+
+def test_empty_input():
+    assert transform_data(MAPPING, []) == []
+    assert transform_data(MAPPING, [ROWS[0]]) == []
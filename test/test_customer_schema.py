@@ -0,0 +1,54 @@
+# test/test_customer_schema.py
+
+from app.customer_schema import CustomerSchemaValidator, normalize_column, validate_records
+
+def record(code, name, account, rank="A", **kwargs):
+    return {"distributorCode": code, "CustomerName": name, "AccountNumber": account, "Rank": rank, **kwargs}
+
+def test_normalize_column():
+    assert normalize_column(["Ｄ００１", "  株式会社　テスト  ", None, "a\t\tb"]) == ["D001", "株式会社 テスト", "None", "a b"]
+    assert normalize_column(["abc", "x y"]) == ["abc", "x y"]
+    # 区切り文字を含む値はセルごとに処理する
+    assert normalize_column(["a\x00b", " c "]) == ["a\x00b", "c"]
+
+def test_required_values_become_none_and_optional_become_empty():
+    result = validate_records([record("D001", "None", "1001", rank=None), record("D001", "", "1002", rank="")])
+    records = result["records"]
+    assert [r["CustomerName"] for r in records] == [None, None]
+    assert [r["Rank"] for r in records] == ["", ""]
+    assert records[0]["BillingAddress1"] == ""  # 出力に無かった任意項目も追加する
+    report = result["validation"]
+    assert report["errorCounts"] == {"CustomerName": {"required": 2}}
+    assert report["invalidRowCount"] == 2
+    assert report["nullStringCounts"] == {"CustomerName": 1}  # None 自体 (rank=None) は数えない
+
+def test_null_like_strings_are_kept():
+    result = validate_records([record("D001", "null", "1001", rank="nan"), record("D002", "NULL", "1002", rank="NaN")])
+    records = result["records"]
+    assert [r["CustomerName"] for r in records] == ["null", "NULL"]
+    assert [r["Rank"] for r in records] == ["nan", "NaN"]
+    assert result["validation"]["errorCount"] == 0
+
+def test_length_pattern_and_duplicates_across_chunks():
+    validator = CustomerSchemaValidator()
+    validator.validate([record("D001", "a", "1001"), record("D 01", "b", "1002")])
+    out = validator.validate([record("Ｄ００１", "c", "１００１"), record("D001", "d", "1003", rank="A" * 11)])
+    assert out[0]["distributorCode"] == "D001" and out[0]["AccountNumber"] == "1001"
+    report = validator.report()
+    assert report["rowCount"] == 4
+    assert report["errorCounts"] == {
+        "distributorCode": {"pattern": 1},
+        "Rank": {"maxLength": 1},
+        "distributorCode+AccountNumber": {"duplicate": 1}
+    }
+    duplicate = [e for e in report["errors"] if e["code"] == "duplicate"][0]
+    assert duplicate["row"] == 2 and duplicate["firstRow"] == 0
+
+def test_report_is_capped_and_rows_can_be_dropped():
+    validator = CustomerSchemaValidator(max_reported_errors=5, drop_invalid_rows=True)
+    out = validator.validate([record(f"D{i}", None, str(i)) for i in range(50)] + [record("D1", "ok", "x1")])
+    report = validator.report()
+    assert report["errorCount"] == 50
+    assert len(report["errors"]) == 5 and report["errorsTruncated"]
+    assert [r["CustomerName"] for r in out] == ["ok"]
+    assert report["droppedRowCount"] == 50
@@ -0,0 +1,79 @@
+# test/test_fake_openai_server.py
+
+import json
+import threading
+import pytest
+from openai import OpenAI, RateLimitError
+
+from app.llm_gateway import LLMGateway
+from tools.fake_openai_server import FakeConfig, make_server
+
+@pytest.fixture
+def fake_server():
+    config = FakeConfig(latency_ms=0, seed=0)
+    server = make_server("127.0.0.1", 0, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield config, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+def make_gateway(base_url, max_retries=0):
+    gateway = LLMGateway(max_retries=max_retries)
+    gateway._client = OpenAI(api_key="not-needed", base_url=base_url, max_retries=0)
+    return gateway
+
+def test_rule_based_responses(fake_server):
+    config, base_url = fake_server
+    gateway = make_gateway(base_url)
+    rows = [["顧客コード", "顧客名", "アカウント番号", "部品担当"], ["D001", "株式会社A", 100, "佐藤"]]
+
+    mapping = gateway.chat_completion("gpt-4o", [
+        {"role": "system", "content": "You are a system that maps tabular data columns ..."},
+        {"role": "user", "content": json.dumps({"fileType": "xlsx", "headerRowIndex": 0, "rowData": rows}, ensure_ascii=False)}
+    ])
+    result = json.loads(mapping.choices[0].message.content)
+    assert [m["matchedField"] for m in result["mapping"]] == ["distributorCode", "CustomerName", "AccountNumber", "PartsSalesPic"]
+    assert result["missingRequiredFields"] == []
+
+    header = gateway.chat_completion("gpt-4o", [
+        {"role": "system", "content": "You are a system that analyzes up to 100 rows ..."},
+        {"role": "user", "content": "Here is the JSON data:\n" + json.dumps({"fileType": "xlsx", "rowData": rows}, ensure_ascii=False)}
+    ])
+    assert json.loads(header.choices[0].message.content)["headerDetection"]["headerRowIndex"] == 0
+
+    code = gateway.chat_completion("o1-mini", [
+        {"role": "user", "content": "You are an assistant that generates Python code ..."},
+        {"role": "user", "content": json.dumps({"mapping": result["mapping"], "rowData": rows}, ensure_ascii=False)}
+    ])
+    namespace = {}
+    exec(code.choices[0].message.content, namespace)
+    assert namespace["transform_data"](result["mapping"], rows)[0]["distributorCode"] == "D001"
+    assert config.stats == {"mapping": {"200": 1}, "header": {"200": 1}, "code": {"200": 1}}
+
+def test_injected_rate_limit(fake_server):
+    config, base_url = fake_server
+    config.update({"rate_limit_rate": 1.0, "retry_after": 0.1})
+    with pytest.raises(RateLimitError):
+        make_gateway(base_url).chat_completion("gpt-4o", [{"role": "user", "content": "{}"}])
+
+    # ゲートウェイの再試行中に 429 が止めば成功する
+    timer = threading.Timer(0.5, config.update, [{"rate_limit_rate": 0.0}])
+    timer.start()
+    response = make_gateway(base_url, max_retries=20).chat_completion("gpt-4o", [{"role": "user", "content": "{}"}])
+    assert response.choices[0].message.content
+    assert config.stats["header"]["429"] >= 2
+
+def test_streaming_response(fake_server):
+    config, base_url = fake_server
+    config.update({"stream_chunk_chars": 5})
+    rows = [["顧客コード", "顧客名"], ["D001", "株式会社A"]]
+    deltas = []
+    response = make_gateway(base_url).chat_completion_stream("gpt-4o", [
+        {"role": "system", "content": "You are a system that maps tabular data columns ..."},
+        {"role": "user", "content": json.dumps({"fileType": "csv", "headerRowIndex": 0, "rowData": rows}, ensure_ascii=False)}
+    ], on_delta=deltas.append)
+    content = response.choices[0].message.content
+    assert len(deltas) > 1 and "".join(deltas) == content
+    assert [m["matchedField"] for m in json.loads(content)["mapping"]] == ["distributorCode", "CustomerName"]
+    assert response.usage.completion_tokens > 0
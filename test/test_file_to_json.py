@@ -0,0 +1,78 @@
+# test/test_file_to_json.py
+
+import json
+from app import file_to_json
+from app.file_to_json import convert_file_to_json, detect_encoding, open_row_stream
+
+HEADER = ["顧客コード", "顧客名", "アカウント番号"]
+
+def write_csv(path, rows, encoding):
+    lines = [",".join("" if v is None else v for v in row) for row in rows]
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode(encoding))
+
+def test_csv_shift_jis(tmp_path):
+    """
+    cp932(Shift_JIS) のCSVを判定して読み込めるか。空セルは None になるか。
+    """
+    rows = [HEADER] + [[f"D{i}", f"株式会社テスト{i}", None if i % 3 == 0 else f"AC{i}"] for i in range(150)]
+    path = tmp_path / "sjis.csv"
+    write_csv(path, rows, "cp932")
+
+    assert detect_encoding(str(path)) == "cp932"
+    result = convert_file_to_json(str(path))
+    assert result["status"] == "success"
+    assert result["fileType"] == "csv"
+    assert result["rowData"] == rows[:100]
+
+    stream = open_row_stream(str(path), chunk_size=40)
+    assert [row for chunk in stream["rowChunks"] for row in chunk] == rows
+
+def test_csv_utf8_bom_and_tab(tmp_path):
+    path = tmp_path / "bom.csv"
+    path.write_bytes("﻿顧客コード\t顧客名\nD1\t株式会社ABC\n".encode("utf-8"))
+    assert detect_encoding(str(path)) == "utf-8-sig"
+    result = convert_file_to_json(str(path))
+    assert result["rowData"] == [["顧客コード", "顧客名"], ["D1", "株式会社ABC"]]
+
+def test_utf8_cut_in_middle_of_character(tmp_path):
+    path = tmp_path / "cut.csv"
+    data = ("あ" * 10).encode("utf-8")
+    path.write_bytes(data)
+    assert detect_encoding(str(path), sample_size=len(data) - 1) == "utf-8"
+
+def test_json_array_of_objects_streamed(tmp_path, monkeypatch):
+    """
+    読み込み単位を小さくしても、要素を跨いだバッファ境界を正しく扱えるか。
+    """
+    monkeypatch.setattr(file_to_json, "JSON_READ_SIZE", 7)
+    records = [{"顧客コード": f"D{i}", "金額": i * 1000, "備考": None} for i in range(120)]
+    path = tmp_path / "records.json"
+    path.write_text(json.dumps(records, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    stream = open_row_stream(str(path), chunk_size=50)
+    assert stream["status"] == "success"
+    rows = [row for chunk in stream["rowChunks"] for row in chunk]
+    assert rows[0] == ["顧客コード", "金額", "備考"]
+    assert rows[1:] == [[r["顧客コード"], r["金額"], None] for r in records]
+
+    preview = convert_file_to_json(str(path))
+    assert preview["rowData"] == rows[:100]
+
+def test_json_object_with_row_data(tmp_path):
+    path = tmp_path / "wrapped.json"
+    path.write_text(json.dumps({"meta": {"a": [1, 2]}, "rowData": [HEADER, ["D1", "ABC", 12]]}, ensure_ascii=False), encoding="utf-8")
+    result = convert_file_to_json(str(path))
+    assert result["status"] == "success"
+    assert result["rowData"] == [HEADER, ["D1", "ABC", 12]]
+
+def test_broken_json(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('[["a", "b"], ["c"', encoding="utf-8")
+    result = convert_file_to_json(str(path))
+    assert result["status"] == "error"
+    assert "読み込めません" in result["message"]
+
+def test_unsupported_extension(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("x", encoding="utf-8")
+    assert convert_file_to_json(str(path))["status"] == "error"
@@ -0,0 +1,45 @@
+# test/test_header_detector.py
+
+import datetime
+from app.header_detector import detect_header, cell_kind
+
+def test_cell_kind():
+    assert cell_kind(None) == "empty"
+    assert cell_kind("  ") == "empty"
+    assert cell_kind(12.5) == "number"
+    assert cell_kind("1,200") == "number"
+    assert cell_kind(datetime.date(2024, 1, 1)) == "date"
+    assert cell_kind("2024/01/01") == "date"
+    assert cell_kind("AC-123") == "code"
+    assert cell_kind("顧客名") == "text"
+
+def test_header_over_codes_is_confident():
+    rows = [["顧客コード", "顧客名", "アカウント番号", "売上"]]
+    rows += [[f"D{i:03d}", f"株式会社{i}", f"AC{i}", i * 100] for i in range(30)]
+    detection = detect_header(rows)["headerDetection"]
+    assert detection["isHeaderPresent"] is True
+    assert detection["headerRowIndex"] == 0
+    assert detection["confidence"] >= 0.8
+
+def test_header_after_title_rows():
+    rows = [["顧客一覧", None, None], [None, None, None], ["コード", "名称", "売上"]]
+    rows += [[f"A{i}", f"株式会社{i}", i] for i in range(10)]
+    detection = detect_header(rows)["headerDetection"]
+    assert detection["headerRowIndex"] == 2
+
+def test_no_header():
+    rows = [[i, f"Data{i}", f"Value{i}"] for i in range(10)]
+    result = detect_header(rows)
+    assert result["headerDetection"]["isHeaderPresent"] is False
+    assert result["headerDetection"]["headerRowIndex"] == -1
+    assert result["bestCandidateIndex"] == -1
+
+def test_all_text_table_is_not_confident():
+    """
+    文字列だけの表はヘッダーかどうか統計だけでは決めにくいので、確信度を低くしてLLMに任せる。
+    """
+    rows = [["顧客名", "住所"], ["山田商事", "東京都港区"], ["佐藤工業", "大阪府大阪市"], ["鈴木物産", "愛知県名古屋市"]]
+    assert detect_header(rows)["headerDetection"]["confidence"] < 0.8
+
+def test_empty():
+    assert detect_header([])["headerDetection"]["headerRowIndex"] == -1
@@ -0,0 +1,60 @@
+# test/test_ingest.py
+
+import os
+import datetime
+from openpyxl import Workbook
+
+from app import ingest
+from app.file_to_json import convert_file_to_json
+from app.ingest import ingest_file, load_preview, load_sidecar, sidecar_path
+
+def create_xlsx(file_path, rows, extra_sheet=False):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["顧客コード", "顧客名", "登録日"])
+    for i in range(rows):
+        ws.append([f"D{i:04d}", f"株式会社{i}" if i % 4 else None, datetime.datetime(2024, 1, 1 + i % 28)])
+    if extra_sheet:
+        wb.create_sheet("Sheet2")
+    wb.save(file_path)
+
+def test_ingest_xlsx_and_preview_from_sidecar(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "master.xlsx")
+    create_xlsx(file_path, rows=150)
+
+    meta = ingest_file(file_path)
+    assert meta["status"] == "success"
+    assert meta["sheets"] == ["Sheet"]
+    assert meta["rowCount"] == 151
+    assert meta["columnCount"] == 3
+    name_stats = meta["columnStats"][1]
+    assert name_stats["nonEmpty"] == 1 + sum(1 for i in range(150) if i % 4)
+    assert meta["columnStats"][2]["kinds"]["date"] == 150
+    assert os.path.exists(sidecar_path(file_path))
+
+    # サイドカーからのプレビューは直接読んだ場合と一致し (日付型も保たれる)、ファイルを開き直さない
+    expected = convert_file_to_json(file_path, limit_rows=True)["rowData"]
+    monkeypatch.setattr(ingest, "convert_file_to_json", lambda *a, **k: (_ for _ in ()).throw(AssertionError))
+    preview = load_preview(file_path)
+    assert preview["fromSidecar"] is True
+    assert preview["rowData"] == expected
+    assert isinstance(preview["rowData"][1][2], datetime.datetime)
+
+def test_stale_sidecar_is_ignored(tmp_path):
+    file_path = tmp_path / "data.csv"
+    file_path.write_text("a,b\n1,2\n", encoding="utf-8")
+    ingest_file(str(file_path))
+    assert load_sidecar(str(file_path))["rowCount"] == 2
+
+    file_path.write_text("a,b\n1,2\n3,4\n", encoding="utf-8")
+    assert load_sidecar(str(file_path)) is None
+    assert load_preview(str(file_path))["rowData"] == [["a", "b"], ["1", "2"], ["3", "4"]]
+
+def test_ingest_error_is_kept(tmp_path):
+    file_path = tmp_path / "broken.xlsx"
+    file_path.write_bytes(b"not a zip")
+    meta = ingest_file(str(file_path))
+    assert meta["status"] == "error"
+    preview = load_preview(str(file_path))
+    assert preview["status"] == "error"
+    assert "読み込めません" in preview["message"]
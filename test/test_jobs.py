@@ -0,0 +1,62 @@
+# test/test_jobs.py
+
+import threading
+import time
+from app.jobs import JobManager, raise_if_cancelled, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED
+
+def wait_finished(manager, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job.finished_at is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_result_and_status():
+    manager = JobManager(max_workers=2)
+    ok = manager.submit("analyze", lambda: {"status": "success", "value": 1})
+    ng = manager.submit("codegen", lambda: ({"status": "error", "message": "x"}, 400))
+    boom = manager.submit("codegen", lambda: 1 / 0)
+
+    assert wait_finished(manager, ok.id).status == STATUS_SUCCEEDED
+    assert ok.result == {"status": "success", "value": 1}
+    assert wait_finished(manager, ng.id).status == STATUS_FAILED
+    assert ng.http_status == 400
+    assert wait_finished(manager, boom.id).http_status == 500
+
+def test_queue_limit_and_cancel():
+    manager = JobManager(max_workers=1, queue_limit=2)
+    started = threading.Event()
+
+    def long_running():
+        started.set()
+        while True:
+            raise_if_cancelled()
+            time.sleep(0.01)
+
+    running = manager.submit("codegen", long_running)
+    queued = manager.submit("analyze", lambda: {"status": "success"})
+    assert manager.submit("analyze", lambda: {"status": "success"}) is None  # 上限超過
+
+    started.wait(2)
+    manager.cancel(queued.id)
+    manager.cancel(running.id)
+    assert wait_finished(manager, running.id).status == STATUS_CANCELLED
+    assert wait_finished(manager, queued.id).status == STATUS_CANCELLED
+    assert manager.submit("analyze", lambda: {"status": "success"}) is not None
+
+def test_raise_if_cancelled_outside_job():
+    raise_if_cancelled()  # ジョブ外では何も起きない
+
+def test_kind_workers_use_separate_pool():
+    manager = JobManager(max_workers=1, queue_limit=1, kind_workers={"ingest": 1})
+    release = threading.Event()
+    ingest = manager.submit("ingest", lambda: release.wait(5) and {"status": "success"})
+    assert manager.submit("ingest", lambda: {"status": "success"}) is None  # ingest の上限超過
+
+    # ingest が実行中・上限に達していても、他の種類のジョブは共通のワーカーですぐに実行される
+    analyze = manager.submit("analyze", lambda: {"status": "success"})
+    assert wait_finished(manager, analyze.id).status == STATUS_SUCCEEDED
+    release.set()
+    assert wait_finished(manager, ingest.id).status == STATUS_SUCCEEDED
@@ -0,0 +1,43 @@
+# test/test_llm_cache.py
+
+import time
+from app.llm_cache import LLMResponseCache, make_cache_key
+
+ROW_DATA = {"fileType": "xlsx", "rowData": [["顧客名", "住所"], ["株式会社ABC", "東京都"]]}
+RESPONSE = {"status": "success", "headerDetection": {"isHeaderPresent": True, "headerRowIndex": 0, "reason": ""}}
+
+def test_key_depends_on_model_prompt_and_data():
+    key = make_cache_key("gpt-4o", "prompt", ROW_DATA)
+    assert key == make_cache_key("gpt-4o", "prompt", dict(reversed(list(ROW_DATA.items()))))
+    assert key != make_cache_key("gpt-4o-mini", "prompt", ROW_DATA)
+    assert key != make_cache_key("gpt-4o", "prompt v2", ROW_DATA)
+    assert key != make_cache_key("gpt-4o", "prompt", {"fileType": "csv", "rowData": ROW_DATA["rowData"]})
+
+def test_hit_miss_and_stats(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    key = make_cache_key("gpt-4o", "prompt", ROW_DATA)
+    assert cache.get(key) is None
+    cache.put(key, RESPONSE, latency=2.5, tokens=1200)
+    assert cache.get(key) == RESPONSE
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["savedSeconds"] == 2.5
+    assert stats["savedTokens"] == 1200
+
+def test_ttl_expiry(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), ttl_seconds=0)
+    cache.put("k", RESPONSE)
+    time.sleep(0.01)
+    assert cache.get("k") is None
+
+def test_size_bounded_eviction(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), max_entries=3)
+    for i in range(3):
+        cache.put(f"k{i}", {"i": i})
+        time.sleep(0.01)
+    cache.get("k0")  # k0 を最近使ったことにする
+    cache.put("k3", {"i": 3})
+    assert cache.stats()["entries"] == 3
+    assert cache.get("k1") is None
+    assert cache.get("k0") == {"i": 0}
@@ -0,0 +1,96 @@
+# test/test_llm_gateway.py
+
+import time
+import threading
+from types import SimpleNamespace
+import pytest
+from openai import RateLimitError, APIStatusError
+from app import llm_gateway
+from app.llm_gateway import LLMGateway, TokenBucket, estimate_tokens
+
+def make_error(cls, status_code, retry_after=None):
+    """SDKの例外をHTTPレスポンス無しで作る (isinstance 判定と status_code だけ使う)"""
+    error = cls.__new__(cls)
+    error.status_code = status_code
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    error.response = SimpleNamespace(headers=headers)
+    return error
+
+class FakeClient:
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            failure = self.failures.pop(0) if self.failures else None
+        try:
+            time.sleep(0.02)
+            if failure is not None:
+                raise failure
+            return {"model": model}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_BASE_SECONDS", 0.001)
+
+def make_gateway(client, **kwargs):
+    gateway = LLMGateway(requests_per_minute=60000, tokens_per_minute=10 ** 9, **kwargs)
+    gateway._client = client
+    return gateway
+
+def test_retries_on_429_and_5xx():
+    client = FakeClient([make_error(RateLimitError, 429, "0"), make_error(APIStatusError, 503)])
+    gateway = make_gateway(client)
+    assert gateway.chat_completion("gpt-4o", [{"role": "user", "content": "hi"}]) == {"model": "gpt-4o"}
+    assert client.calls == 3
+
+def test_gives_up_after_max_retries_and_not_on_4xx():
+    client = FakeClient([make_error(RateLimitError, 429)] * 3)
+    with pytest.raises(RateLimitError):
+        make_gateway(client, max_retries=2).chat_completion("gpt-4o", [])
+    assert client.calls == 3
+
+    client = FakeClient([make_error(APIStatusError, 400)])
+    with pytest.raises(APIStatusError):
+        make_gateway(client).chat_completion("gpt-4o", [])
+    assert client.calls == 1
+
+def test_retry_after_is_clamped_and_jittered(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_MAX_SECONDS", 5.0)
+    assert 0 <= llm_gateway._retry_delay(make_error(RateLimitError, 429, "-3"), 0) <= 0.001
+    assert llm_gateway._retry_delay(make_error(RateLimitError, 429, "3600"), 0) == 5.0
+    delays = {llm_gateway._retry_delay(make_error(RateLimitError, 429, "1"), 0) for _ in range(10)}
+    assert len(delays) > 1 and all(1 <= d <= 1.001 for d in delays)
+
+def test_in_flight_cap():
+    client = FakeClient([])
+    gateway = make_gateway(client, max_in_flight=2)
+    threads = [threading.Thread(target=gateway.chat_completion, args=("gpt-4o", [])) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert client.calls == 8
+    assert client.max_active <= 2
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(per_minute=600)  # 10/秒
+    bucket.acquire(600)
+    started = time.monotonic()
+    bucket.acquire(2)
+    assert time.monotonic() - started >= 0.15
+
+def test_estimate_tokens():
+    assert estimate_tokens("abcd" * 10) == 11
+    assert estimate_tokens("顧客名") == 4
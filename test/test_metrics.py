@@ -0,0 +1,69 @@
+# test/test_metrics.py
+
+import logging
+import json
+from types import SimpleNamespace
+import pytest
+from app import metrics
+from app.metrics import Registry
+from app.llm_gateway import LLMGateway
+from app.log_setup import JsonFormatter
+
+def test_histogram_and_counter_render():
+    registry = Registry()
+    hist = registry.histogram("t_seconds", "テスト", ["stage"], buckets=(0.1, 1.0))
+    counter = registry.counter("t_total", "テスト", ["kind"])
+    hist.observe(0.05, stage="parse")
+    hist.observe(0.5, stage="parse")
+    counter.inc(3, kind='a"b')
+    text = registry.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{stage="parse",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="parse",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="parse",le="+Inf"} 2' in text
+    assert 't_seconds_count{stage="parse"} 2' in text
+    assert 't_total{kind="a\\"b"} 3' in text
+    with pytest.raises(ValueError):
+        counter.inc(kind="a", extra="x")
+
+def test_span_records_duration_and_errors():
+    before = metrics.STAGE_SECONDS.count(stage="test_span")
+    with metrics.span("test_span") as fields:
+        fields["rows"] = 10
+    with pytest.raises(RuntimeError):
+        with metrics.span("test_span"):
+            raise RuntimeError("boom")
+    assert metrics.STAGE_SECONDS.count(stage="test_span") == before + 2
+    assert metrics.STAGE_ERRORS.value(stage="test_span") >= 1
+
+def test_gateway_records_tokens_by_kind():
+    usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda model, messages, **kwargs: SimpleNamespace(usage=usage)
+    )))
+    gateway = LLMGateway(requests_per_minute=60000, tokens_per_minute=10 ** 9)
+    gateway._client = client
+    before = metrics.LLM_TOKENS.value(kind="test_kind", model="m", type="prompt")
+    gateway.chat_completion("m", [{"role": "user", "content": "hi"}], kind="test_kind")
+    assert metrics.LLM_TOKENS.value(kind="test_kind", model="m", type="prompt") == before + 120
+    assert metrics.LLM_TOKENS.value(kind="test_kind", model="m", type="completion") >= 30
+    assert metrics.LLM_REQUESTS.value(kind="test_kind", model="m", outcome="ok") >= 1
+
+def test_metrics_endpoint():
+    from app.server import app
+    client = app.test_client()
+    client.get("/api/jobs/does-not-exist")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    body = response.get_data(as_text=True)
+    assert 'endpoint="/api/jobs/<job_id>"' in body
+    assert "app_llm_tokens_total" in body
+
+def test_json_log_includes_extra_fields():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+    record.stage = "parse"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello world"
+    assert entry["stage"] == "parse"
+    assert entry["level"] == "INFO"
@@ -0,0 +1,128 @@
+# test/test_multi_sheet.py
+
+import os
+import datetime
+from openpyxl import Workbook
+
+from app import main_processor, multi_sheet
+from app.ingest import ingest_file, load_preview, load_sheet_previews
+from app.multi_sheet import convert_sheets_to_json, open_sheets_row_stream
+
+HEADER = ["顧客コード", "顧客名", "登録日"]
+
+def create_regions_xlsx(file_path, regions, rows=30, title_row=None):
+    """
+    地域ごとに1シートのブック。title_row を指定したシートはヘッダーの上にタイトル行を入れる。
+    """
+    wb = Workbook()
+    wb.remove(wb.active)
+    for r, region in enumerate(regions):
+        ws = wb.create_sheet(region)
+        if region == title_row:
+            ws.append([f"{region} 顧客一覧"])
+        ws.append(HEADER)
+        for i in range(rows):
+            ws.append([f"{region}{i:04d}", f"株式会社{region}{i}", datetime.datetime(2024, 1 + r, 1 + i % 28)])
+    wb.save(file_path)
+
+def test_sheet_previews(tmp_path, monkeypatch):
+    # CPUが1つの環境でもワーカープロセスで読む経路を通す
+    monkeypatch.setattr(multi_sheet, "SHEET_PARSE_WORKERS", 2)
+    file_path = str(tmp_path / "regions.xlsx")
+    create_regions_xlsx(file_path, ["東日本", "西日本", "九州"], rows=150)
+
+    result = convert_sheets_to_json(file_path)
+    assert result["status"] == "success"
+    assert [s["sheetName"] for s in result["sheets"]] == ["東日本", "西日本", "九州"]
+    for sheet in result["sheets"]:
+        assert len(sheet["rowData"]) == 100
+        assert sheet["rowData"][0] == HEADER
+    assert result["sheets"][1]["rowData"][1][0] == "西日本0000"
+
+    assert convert_sheets_to_json(file_path, sheet_names=["北海道"])["status"] == "error"
+
+def test_concatenate_sheets_drops_later_headers(tmp_path, monkeypatch):
+    monkeypatch.setattr(multi_sheet, "SHEET_PARSE_WORKERS", 2)
+    file_path = str(tmp_path / "regions.xlsx")
+    create_regions_xlsx(file_path, ["東日本", "西日本", "九州"], rows=30, title_row="九州")
+
+    stream = open_sheets_row_stream(file_path, ["東日本", "西日本", "九州"], {"九州": 1}, chunk_size=7)
+    assert stream["status"] == "success"
+    assert stream["rowCounts"] == {"西日本": 31, "九州": 32}  # 1枚目は一時ファイルを作らずに流す
+    rows = [row for chunk in stream["rowChunks"] for row in chunk]
+    assert len(rows) == 1 + 30 * 3
+    assert rows[0] == HEADER
+    assert [row[0] for row in rows[1:]] == (
+        [f"東日本{i:04d}" for i in range(30)] + [f"西日本{i:04d}" for i in range(30)] + [f"九州{i:04d}" for i in range(30)]
+    )
+
+    # ヘッダー行の位置を指定しないと、タイトル行をヘッダーとして比較するので連結できない
+    stream = open_sheets_row_stream(file_path, ["東日本", "九州"])
+    assert stream["status"] == "error"
+    assert "九州" in stream["message"]
+
+    # 一時ファイル用の空き容量が足りなければ、書き出す前にエラーにする
+    monkeypatch.setattr(multi_sheet, "_spool_bytes_estimate", lambda path: 1 << 60)
+    stream = open_sheets_row_stream(file_path, ["東日本", "西日本"])
+    assert stream["status"] == "error" and "空き容量" in stream["message"]
+
+def test_ingest_and_analyze_multi_sheet(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "regions.xlsx")
+    create_regions_xlsx(file_path, ["東日本", "西日本", "九州"], rows=20, title_row="九州")
+
+    meta = ingest_file(file_path)
+    assert meta["status"] == "success"
+    assert meta["rowCount"] == 21 + 21 + 22
+    assert [s["sheetName"] for s in meta["sheetData"]] == ["東日本", "西日本", "九州"]
+    assert meta["sheetData"][0]["columnStats"][2]["kinds"]["date"] == 20
+
+    assert load_preview(file_path)["status"] == "error"
+    preview = load_preview(file_path, "西日本")
+    assert preview["fromSidecar"] is True
+    assert isinstance(preview["rowData"][1][2], datetime.datetime)
+    assert len(load_sheet_previews(file_path)["sheets"]) == 3
+
+    # マッピング提案は同じヘッダー行のシートで共有され、LLMは1回しか呼ばれない
+    calls = []
+    def mapping(request_data):
+        calls.append(request_data["headerRowIndex"])
+        return {"status": "success", "mapping": [], "missingRequiredFields": [], "additionalNotes": ""}
+    monkeypatch.setattr(main_processor, "call_mapping", mapping)
+
+    result = main_processor.process_file_and_map(file_path, header_confidence_threshold=0.0)
+    assert result["status"] == "success"
+    assert result["sheetNames"] == ["東日本", "西日本", "九州"]
+    assert calls == [0]
+    assert result["sheets"][2]["pipeline"]["mappingSharedWith"] == "東日本"
+    assert result["mappingGroups"] == [{
+        "sheetNames": ["東日本", "西日本", "九州"],
+        "headerRowIndexes": {"東日本": 0, "西日本": 0, "九州": 1}
+    }]
+
+    single = main_processor.process_file_and_map(file_path, header_confidence_threshold=0.0, sheet_name="九州")
+    assert single["sheetName"] == "九州"
+    assert single["headerResponse"]["headerDetection"]["headerRowIndex"] == 1
+
+def test_codegen_rejects_invalid_header_rows(tmp_path):
+    from app import server
+    file_path = tmp_path / "sales.xlsx"
+    file_path.write_bytes(b"")
+    for header_rows in (["九州"], {"九州": "1"}, {"九州": -1}, {"九州": True}):
+        result, status = server.run_codegen_pipeline(
+            str(file_path), [], [], sheet_names=["東日本", "九州"], header_rows=header_rows
+        )
+        assert status == 400 and "headerRowIndexes" in result["message"]
+
+def _exit_worker(file_path, sheet_name):
+    os._exit(1)  # メモリ不足で kill されたワーカーの代わり
+
+def test_broken_worker_pool_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(multi_sheet, "SHEET_PARSE_WORKERS", 2)
+    file_path = str(tmp_path / "regions.xlsx")
+    create_regions_xlsx(file_path, ["東日本", "西日本"], rows=3)
+
+    results = multi_sheet.map_sheets(_exit_worker, file_path, ["東日本", "西日本"])
+    assert [r["status"] for r in results] == ["error", "error"]
+    # 次の呼び出しでは新しいプールで読める
+    result = convert_sheets_to_json(file_path)
+    assert result["status"] == "success" and len(result["sheets"]) == 2
@@ -0,0 +1,63 @@
+# test/test_output_writers.py
+
+import csv
+import gzip
+import json
+import pytest
+from app import output_writers
+from app.output_writers import open_writer, output_path, convert_output, iter_records
+
+RECORDS = [
+    {"distributorCode": f"D{i}", "CustomerName": f"株式会社{i}", "AccountNumber": None if i == 2 else f"AC{i}", "Rank": ""}
+    for i in range(7)
+]
+
+def write(path, fmt, use_gzip=False, batch=3):
+    with open_writer(path, fmt, use_gzip=use_gzip) as writer:
+        for i in range(0, len(RECORDS), batch):
+            writer.write_records(RECORDS[i:i + batch])
+
+def test_output_path():
+    assert output_path("/tmp/out", "csv") == "/tmp/out.csv"
+    assert output_path("/tmp/out", "ndjson", use_gzip=True) == "/tmp/out.ndjson.gz"
+    assert output_path("/tmp/out", "parquet", use_gzip=True) == "/tmp/out.parquet"
+
+def test_json_and_ndjson_roundtrip(tmp_path):
+    for fmt, use_gzip in (("json", False), ("json", True), ("ndjson", False), ("ndjson", True)):
+        path = output_path(str(tmp_path / "out"), fmt, use_gzip)
+        write(path, fmt, use_gzip)
+        assert [r for chunk in iter_records(path, fmt, chunk_size=2) for r in chunk] == RECORDS
+
+    opener = gzip.open
+    with opener(str(tmp_path / "out.json.gz"), "rt", encoding="utf-8") as f:
+        assert f.read() == json.dumps(RECORDS, ensure_ascii=False, indent=2)
+
+def test_csv(tmp_path):
+    path = str(tmp_path / "out.csv.gz")
+    write(path, "csv", use_gzip=True)
+    with gzip.open(path, "rt", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["CustomerName"] == "株式会社0"
+    assert rows[2]["AccountNumber"] == ""
+    assert len(rows) == len(RECORDS)
+
+def test_parquet(tmp_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(output_writers, "PARQUET_ROW_GROUP_SIZE", 3)
+    path = str(tmp_path / "out.parquet")
+    write(path, "parquet", batch=2)
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups >= 2
+    assert parquet_file.read().to_pylist() == RECORDS
+
+def test_convert_from_json(tmp_path):
+    src = str(tmp_path / "src.json")
+    write(src, "json")
+    dst = str(tmp_path / "dst.ndjson")
+    assert convert_output(src, "json", dst, "ndjson") == len(RECORDS)
+    with open(dst, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == RECORDS
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_writer(str(tmp_path / "x"), "xml")
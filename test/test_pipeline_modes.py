@@ -0,0 +1,97 @@
+# test/test_pipeline_modes.py
+#
+# LLM呼び出しはモックに差し替えて、パイプラインモードごとの呼び出し方を確認する。
+
+import os
+import time
+import pytest
+from openpyxl import Workbook
+
+from app import main_processor
+
+LLM_DELAY = 0.2
+
+def create_xlsx(file_path, header=True):
+    wb = Workbook()
+    ws = wb.active
+    if header:
+        ws.append(["顧客コード", "顧客名", "アカウント番号"])
+    for i in range(5):
+        ws.append([f"D{i}", f"株式会社{i}", i])
+    wb.save(file_path)
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    calls = []
+
+    def header_detection(request_data):
+        calls.append(("header", None))
+        time.sleep(LLM_DELAY)
+        return {"status": "success", "headerDetection": {"isHeaderPresent": True, "headerRowIndex": 0, "reason": ""}}
+
+    def mapping(request_data):
+        calls.append(("mapping", request_data["headerRowIndex"]))
+        time.sleep(LLM_DELAY)
+        return {"status": "success", "mapping": [], "missingRequiredFields": [], "additionalNotes": ""}
+
+    def header_and_mapping(request_data):
+        calls.append(("combined", None))
+        time.sleep(LLM_DELAY)
+        return {
+            "status": "success",
+            "headerDetection": {"isHeaderPresent": True, "headerRowIndex": 0, "reason": ""},
+            "mapping": [{"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9}],
+            "missingRequiredFields": ["CustomerName", "AccountNumber"],
+            "additionalNotes": ""
+        }
+
+    monkeypatch.setattr(main_processor, "call_header_detection", header_detection)
+    monkeypatch.setattr(main_processor, "call_mapping", mapping)
+    monkeypatch.setattr(main_processor, "call_header_and_mapping", header_and_mapping)
+    return calls
+
+def timed(file_path, mode):
+    # ローカルのヘッダー判定でLLM呼び出しが省略されないよう、しきい値を1より大きくする
+    started = time.time()
+    result = main_processor.process_file_and_map(file_path, mode=mode, header_confidence_threshold=2.0)
+    return result, time.time() - started
+
+def test_speculative_hit_runs_in_parallel(tmp_path, fake_llm):
+    file_path = str(tmp_path / "header.xlsx")
+    create_xlsx(file_path)
+    result, elapsed = timed(file_path, "speculative")
+    assert result["status"] == "success"
+    assert result["pipeline"]["speculationHit"] is True
+    assert sorted(fake_llm) == [("header", None), ("mapping", 0)]
+    assert elapsed < LLM_DELAY * 1.8
+
+def test_speculative_miss_reissues_mapping(tmp_path, fake_llm):
+    file_path = str(tmp_path / "no_header.xlsx")
+    create_xlsx(file_path, header=False)  # 先頭行に数値があるのでローカル予測は -1
+    result, _ = timed(file_path, "speculative")
+    assert result["pipeline"]["speculationHit"] is False
+    assert ("mapping", -1) in fake_llm and fake_llm[-1] == ("mapping", 0)
+
+def test_combined_splits_response(tmp_path, fake_llm):
+    file_path = str(tmp_path / "header.xlsx")
+    create_xlsx(file_path)
+    result, elapsed = timed(file_path, "combined")
+    assert fake_llm == [("combined", None)]
+    assert result["headerResponse"]["headerDetection"]["headerRowIndex"] == 0
+    assert result["mappingResponse"]["missingRequiredFields"] == ["CustomerName", "AccountNumber"]
+    assert elapsed < LLM_DELAY * 1.8
+
+def test_sequential_and_unknown_mode(tmp_path, fake_llm):
+    file_path = str(tmp_path / "header.xlsx")
+    create_xlsx(file_path)
+    assert timed(file_path, "sequential")[0]["status"] == "success"
+    assert fake_llm == [("header", None), ("mapping", 0)]
+    assert main_processor.process_file_and_map(file_path, mode="fast")["status"] == "error"
+
+def test_confident_local_header_skips_llm(tmp_path, fake_llm):
+    file_path = str(tmp_path / "header.xlsx")
+    create_xlsx(file_path)
+    result = main_processor.process_file_and_map(file_path, mode="speculative")
+    assert result["pipeline"]["headerSource"] == "local"
+    assert result["headerResponse"]["headerDetection"]["headerRowIndex"] == 0
+    assert fake_llm == [("mapping", 0)]
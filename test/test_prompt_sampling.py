@@ -0,0 +1,50 @@
+# test/test_prompt_sampling.py
+
+import json
+from app.llm_gateway import estimate_tokens
+from app.prompt_sampling import sample_row_data
+
+def make_rows(n=100):
+    rows = [["レポート", None, None, None], ["顧客コード", "顧客名", "住所", "ランク"]]
+    for i in range(n - 2):
+        address = "東京都千代田区丸の内" * 20 if i % 10 == 0 else f"大阪府{i}"
+        rank = None if i % 3 else "A"
+        rows.append([f"D{i:04d}", f"株式会社{i % 7}", address, rank])
+    return rows
+
+def test_within_budget_is_unchanged():
+    rows = make_rows(10)
+    result = sample_row_data(rows, keep_until=1, token_budget=100000)
+    assert result["sampled"] is False
+    assert result["rowData"] is rows
+
+def test_budget_leading_rows_and_coverage():
+    rows = make_rows(100)
+    result = sample_row_data(rows, keep_until=1, token_budget=800, max_cell_chars=20)
+    sampled = result["rowData"]
+
+    assert result["sampled"] is True
+    assert result["originalTokens"] > 800
+    assert estimate_tokens(json.dumps(sampled, ensure_ascii=False)) <= 800
+    # 先頭行 (ヘッダーまで) は元の位置のまま残る
+    assert result["rowIndices"][:5] == [0, 1, 2, 3, 4]
+    assert sampled[1] == rows[1]
+    # 元の順序を保つ
+    assert result["rowIndices"] == sorted(result["rowIndices"])
+    # 長いセルは切り詰められる
+    assert all(len(v) <= 21 for row in sampled for v in row if isinstance(v, str))
+    # 値がある列はすべてサンプルにも値が残る
+    for j in range(4):
+        assert any(row[j] is not None for row in sampled[2:])
+
+def test_near_duplicates_are_dropped():
+    rows = [["コード", "名称"]] + [[f"D{i}", "同じ名前"] for i in range(200)] + [["X-1", "別の名前"]]
+    result = sample_row_data(rows, keep_until=0, token_budget=200)
+    assert result["rowData"][-1] == ["X-1", "別の名前"]
+    # 数字違いの行は先頭部分に残った分だけ
+    assert sum(1 for row in result["rowData"] if row[1] == "同じ名前") == 4
+
+def test_keep_until_beyond_leading_rows():
+    rows = make_rows(100)
+    result = sample_row_data(rows, keep_until=20, token_budget=10)
+    assert result["rowIndices"] == list(range(21))
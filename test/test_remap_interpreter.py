@@ -0,0 +1,64 @@
+# test/test_remap_interpreter.py
+
+from app.remap_interpreter import interpret_instruction
+
+ORIGINAL = {
+    "status": "success",
+    "mapping": [
+        {"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9},
+        {"columnIndex": 1, "columnName": "顧客名", "matchedField": "CustomerName", "confidence": 0.9},
+        {"columnIndex": 2, "columnName": "アカウント番号", "matchedField": "AccountNumber", "confidence": 0.9},
+        {"columnIndex": 3, "columnName": "ランク", "matchedField": None, "confidence": 0.1},
+        {"columnIndex": 4, "columnName": "営業担当", "matchedField": "SalesPic", "confidence": 0.8},
+        {"columnIndex": 5, "columnName": "住所", "matchedField": None, "confidence": 0.0},
+    ],
+    "missingRequiredFields": [],
+    "additionalNotes": ""
+}
+
+def fields(result):
+    return [e["matchedField"] for e in result["mapping"]]
+
+def test_assign_in_english_and_japanese():
+    for instruction in ("Map column 3 to Rank.", "set Rank to column D", "列3をランクにマッピングしてください", "4列目はRank"):
+        result = interpret_instruction(ORIGINAL, instruction)
+        assert fields(result)[3] == "Rank", instruction
+        assert result["mapping"][3]["confidence"] == 1.0
+    result = interpret_instruction(ORIGINAL, "「住所」を請求先住所に")
+    assert fields(result)[5] == "BillingAddress1"
+    assert ORIGINAL["mapping"][5]["matchedField"] is None  # 元のマッピングは変更しない
+
+def test_reassigning_a_field_moves_it_and_updates_missing_fields():
+    result = interpret_instruction(ORIGINAL, "CustomerName = column 5")
+    assert fields(result)[1] is None and fields(result)[5] == "CustomerName"
+    result = interpret_instruction(ORIGINAL, "列2をRankに")
+    assert result["missingRequiredFields"] == ["AccountNumber"]
+
+def test_unassign_and_swap():
+    assert fields(interpret_instruction(ORIGINAL, "unmap SalesPic"))[4] is None
+    result = interpret_instruction(ORIGINAL, "CustomerNameのマッピングを解除して")
+    assert result["missingRequiredFields"] == ["CustomerName"]
+    result = interpret_instruction(ORIGINAL, "列0と列2を入れ替えて")
+    assert fields(result)[0] == "AccountNumber" and fields(result)[2] == "distributorCode"
+    result = interpret_instruction(ORIGINAL, "swap CustomerName and AccountNumber")
+    assert fields(result)[1] == "AccountNumber" and fields(result)[2] == "CustomerName"
+
+def test_multiple_clauses_and_fallback():
+    result = interpret_instruction(ORIGINAL, "列3をRankに、SalesPicを外して")
+    assert fields(result)[3] == "Rank" and fields(result)[4] is None
+    # 1つでも解釈できない指示があればLLMに回す
+    assert interpret_instruction(ORIGINAL, "列3をRankに、顧客名の列は重複しているので除外して") is None
+    assert interpret_instruction(ORIGINAL, "map column 9 to Rank") is None  # 存在しない列
+    assert interpret_instruction(ORIGINAL, "") is None
+
+def test_remap_endpoint_uses_local_path(monkeypatch):
+    from app import server
+    def fail(*args, **kwargs):
+        raise AssertionError("LLM should not be called")
+    monkeypatch.setattr(server, "call_mapping_refine", fail)
+    response = server.app.test_client().post(
+        "/api/remap", json={"originalMapping": ORIGINAL, "userInstruction": "map column 3 to Rank"}
+    )
+    body = response.get_json()
+    assert body["remapSource"] == "local"
+    assert body["mappingResponse"]["mapping"][3]["matchedField"] == "Rank"
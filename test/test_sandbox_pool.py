@@ -0,0 +1,114 @@
+# test/test_sandbox_pool.py
+
+import os
+import pytest
+
+from app.sandbox_pool import SandboxPool, SandboxError, SandboxTimeout, SandboxCrashed
+from app.transform_runner import run_transform_in_chunks
+
+SOURCE = """
+import os
+def transform_data(mapping, row_data):
+    return [{"name": str(r[0]), "pid": os.getpid()} for r in row_data[1:]]
+"""
+
+LOOP_SOURCE = """
+def transform_data(mapping, row_data):
+    while True:
+        pass
+"""
+
+SLEEP_SOURCE = """
+import time
+def transform_data(mapping, row_data):
+    time.sleep(60)
+"""
+
+@pytest.fixture
+def pool():
+    p = SandboxPool(size=1, cpu_seconds=1, wall_seconds=10, max_memory_mb=0)
+    yield p
+    p.shutdown()
+
+def test_runs_in_worker_process(pool):
+    records = pool.run(SOURCE, [], [["header"], ["a"], ["b"]])
+    assert [r["name"] for r in records] == ["a", "b"]
+    assert records[0]["pid"] != os.getpid()
+
+    # 同じワーカーが使い回される (warm)
+    again = pool.run(SOURCE, [], [["header"], ["c"]])
+    assert again[0]["pid"] == records[0]["pid"]
+
+def test_errors_are_reported(pool):
+    with pytest.raises(SandboxError) as e:
+        pool.run("def transform_data(m, rows):\n    return 1 / 0\n", [], [])
+    assert "ZeroDivisionError" in str(e.value)
+    assert "Traceback" in e.value.traceback
+
+    with pytest.raises(SandboxError, match="No transform_data"):
+        pool.run("x = 1\n", [], [])
+
+def test_module_level_error_is_reported(pool):
+    # 読み込み時の KeyError をキャッシュミス ("missing") と取り違えない
+    with pytest.raises(SandboxError) as e:
+        pool.run('d = {}\nd["x"]\ndef transform_data(m, r):\n    return []\n', [], [])
+    assert "KeyError" in str(e.value)
+    assert "Traceback" in e.value.traceback
+    assert pool.run(SOURCE, [], [["name"], ["a"]])[0]["name"] == "a"  # ワーカーはそのまま使える
+
+def test_cpu_limit_keeps_worker(pool):
+    with pytest.raises(SandboxError, match="CPU time limit"):
+        pool.run(LOOP_SOURCE, [], [])
+    assert pool.run(SOURCE, [], [["h"], ["ok"]])[0]["name"] == "ok"
+
+def test_cpu_limit_cannot_be_swallowed(pool):
+    # except Exception でも、例外を全部捕まえても (SIGXCPU が届いた時点で) エラーになる
+    for handler in ("except Exception", "except BaseException"):
+        source = (
+            "def transform_data(mapping, row_data):\n"
+            "    try:\n"
+            "        while True:\n"
+            "            pass\n"
+            f"    {handler}:\n"
+            "        return ['swallowed']\n"
+        )
+        with pytest.raises(SandboxError, match="CPU time limit"):
+            pool.run(source, [], [])
+
+def test_wall_clock_timeout_respawns(pool):
+    with pytest.raises(SandboxTimeout):
+        pool.run(SLEEP_SOURCE, [], [], wall_seconds=1)
+    assert pool.run(SOURCE, [], [["h"], ["ok"]])[0]["name"] == "ok"
+
+def test_crash_respawns(pool):
+    with pytest.raises(SandboxCrashed):
+        pool.run("import os\ndef transform_data(m, rows):\n    os._exit(3)\n", [], [])
+    assert pool.run(SOURCE, [], [["h"], ["ok"]])[0]["name"] == "ok"
+
+def test_bind_works_with_chunk_runner(pool):
+    rows = [["header"]] + [[str(i)] for i in range(10)]
+    out = []
+    run_transform_in_chunks(pool.bind(SOURCE), [], [rows[:4], rows[4:]], out.extend)
+    assert [r["name"] for r in out] == [str(i) for i in range(10)]
+
+def test_memory_limit():
+    p = SandboxPool(size=1, cpu_seconds=5, wall_seconds=10, max_memory_mb=300)
+    try:
+        with pytest.raises(SandboxError, match="Memory limit"):
+            p.run("def transform_data(m, rows):\n    return bytearray(1024 * 1024 * 1024)\n", [], [])
+        assert p.run(SOURCE, [], [["h"], ["ok"]])[0]["name"] == "ok"
+    finally:
+        p.shutdown()
+
+def test_parallel_across_workers():
+    from app.transform_runner import run_transform_parallel
+    p = SandboxPool(size=3, cpu_seconds=5, wall_seconds=10, max_memory_mb=0)
+    try:
+        rows = [["header"]] + [[str(i)] for i in range(100)]
+        chunks = [rows[i:i + 7] for i in range(0, len(rows), 7)]
+        out = []
+        run_transform_parallel(p.submitter(SOURCE), [], chunks, out.extend, max_in_flight=6)
+        assert [r["name"] for r in out] == [str(i) for i in range(100)]
+        assert len({r["pid"] for r in out}) > 1
+    finally:
+        p.shutdown()
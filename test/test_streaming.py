@@ -0,0 +1,75 @@
+# test/test_streaming.py
+
+import json
+from types import SimpleNamespace
+
+from app import llm_gateway, streaming
+from app.streaming import MappingEntryParser, ProgressChannel, format_sse
+
+MAPPING = {
+    "status": "success",
+    "mapping": [
+        {"columnIndex": 0, "columnName": "コード{a}", "matchedField": "distributorCode", "confidence": 0.9},
+        {"columnIndex": 1, "columnName": "名前 \"}\" ", "matchedField": "CustomerName", "confidence": 0.9},
+        {"columnIndex": 2, "columnName": None, "matchedField": None, "confidence": 0.0},
+    ],
+    "missingRequiredFields": ["AccountNumber"],
+    "additionalNotes": "[x] {y}"
+}
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = block.split("\n")
+        if lines[0].startswith(":"):
+            events.append(("comment", lines[0]))
+            continue
+        event = lines[0][len("event: "):]
+        events.append((event, json.loads(lines[1][len("data: "):])))
+    return events
+
+def test_mapping_entry_parser_yields_entries_as_they_close():
+    text = json.dumps(MAPPING, ensure_ascii=False)
+    parser = MappingEntryParser()
+    entries = []
+    for i in range(0, len(text), 3):
+        entries.extend(parser.feed(text[i:i + 3]))
+    # 文字列中の括弧・エスケープに惑わされず、mapping 配列の要素だけを取り出す
+    assert entries == MAPPING["mapping"]
+
+def test_stage_and_emit_are_noops_without_channel():
+    with streaming.stage("parse"):
+        streaming.emit_progress("progress", rows=1)
+    assert streaming.llm_delta_handler("mapping") is None
+
+    channel = ProgressChannel()
+    streaming.run_with_channel(channel, lambda: streaming.emit_progress("progress", rows=1))
+    assert channel.get(timeout=1) == ("progress", {"rows": 1})
+    assert format_sse("progress", {"rows": 1}) == 'event: progress\ndata: {"rows": 1}\n\n'
+
+def test_remap_stream_sends_mapping_entries_and_result(monkeypatch):
+    from app import server
+    content = json.dumps(MAPPING, ensure_ascii=False)
+
+    def fake_stream(model, messages, kind="other", on_delta=None, **kwargs):
+        for i in range(0, len(content), 10):
+            on_delta(content[i:i + 10])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    monkeypatch.setattr(llm_gateway, "chat_completion_stream", fake_stream)
+    monkeypatch.setattr(server, "REMAP_LOCAL_ENABLED", False)
+    response = server.app.test_client().post(
+        "/api/remap/stream", json={"originalMapping": MAPPING, "userInstruction": "顧客名の列を見直して"}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = parse_sse(response.get_data(as_text=True))
+
+    assert events[0][0] == "job"
+    entries = [data["entry"] for event, data in events if event == "mapping_entry"]
+    assert entries == MAPPING["mapping"]
+    stages = [(data["stage"], data["state"]) for event, data in events if event == "stage"]
+    assert stages == [("llm", "started"), ("llm", "finished")]
+    assert events[-1][0] == "result"
+    assert events[-1][1]["body"]["remapSource"] == "llm"
+    assert events[-1][1]["body"]["mappingResponse"] == MAPPING
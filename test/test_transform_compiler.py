@@ -0,0 +1,70 @@
+# test/test_transform_compiler.py
+
+import datetime
+import importlib.util
+from pathlib import Path
+
+from app import artifacts
+from app.transform_compiler import compile_transform, compile_transform_source, can_compile, has_custom_rules
+
+def load_reference_transform():
+    """app/generated/generated_transform.py の transform_data を比較用に読み込む"""
+    path = Path(__file__).resolve().parents[1] / "app" / "generated" / "generated_transform.py"
+    spec = importlib.util.spec_from_file_location("reference_transform", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.transform_data
+
+MAPPING = [
+    {"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9},
+    {"columnIndex": 1, "columnName": "顧客名", "matchedField": "CustomerName", "confidence": 0.95},
+    {"columnIndex": 2, "columnName": "アカウント番号", "matchedField": "AccountNumber", "confidence": 0.88},
+    {"columnIndex": 3, "columnName": "ランク", "matchedField": "Rank", "confidence": 0.5},
+    {"columnIndex": 5, "columnName": "住所", "matchedField": "BillingAddress1", "confidence": 0.5},
+    {"columnIndex": 4, "columnName": "メモ", "matchedField": None, "confidence": 0.1},
+]
+
+ROWS = [
+    ["顧客コード", "顧客名", "アカウント番号", "ランク", "メモ", "住所"],
+    ["D001", "株式会社ABC", 123, "A", "x", "東京都"],
+    ["D002", None, 456.5, None, None, None],
+    ["D003", "株式会社XYZ"],  # 列数が足りない行
+    (None, "", True, datetime.date(2024, 1, 2), "y", ""),
+]
+
+def test_matches_reference_transform():
+    reference = load_reference_transform()
+    for mapping in (MAPPING, MAPPING[:1], [], MAPPING + [{"columnIndex": 4, "matchedField": "Rank"}]):
+        result = compile_transform(mapping)(mapping, ROWS)
+        assert result == reference(mapping, ROWS)
+        assert [list(r) for r in result] == [list(r) for r in reference(mapping, ROWS)]  # 項目の順番も同じ
+    assert compile_transform(MAPPING)(MAPPING, ROWS[:1]) == []
+
+def test_custom_rules_and_invalid_mappings_are_not_compiled():
+    custom = [dict(MAPPING[0], transformRule="先頭の0を取り除く")] + MAPPING[1:]
+    assert has_custom_rules(custom) and not can_compile(custom)
+    assert not can_compile([{"columnIndex": "0; import os", "matchedField": "Rank"}])
+    assert can_compile(MAPPING) and not has_custom_rules(MAPPING)
+    # 列番号・項目名以外の mapping の値はコードに埋め込まない
+    source = compile_transform_source([{"columnIndex": 1, "columnName": "'''x", "matchedField": "Rank"}])
+    assert "'''x" not in source
+
+def test_codegen_uses_compiler_without_llm(tmp_path, monkeypatch):
+    from app import server
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    def fail(*args, **kwargs):
+        raise AssertionError("LLM should not be called")
+    monkeypatch.setattr(server, "_generate_code_with_llm", fail)
+
+    csv_path = tmp_path / "customers.csv"
+    csv_path.write_text("顧客コード,顧客名,アカウント番号,ランク,メモ,住所\nD001,株式会社ABC,123,A,x,東京都\nD002,株式会社XYZ,456,B,y,大阪府\n",
+                        encoding="utf-8")
+    result, status = server.run_codegen_pipeline(str(csv_path), MAPPING, ROWS)
+    assert status == 200, result
+    assert result["codegenSource"] == "compiled"
+    assert result["validation"]["rowCount"] == 2
+    generated = Path(artifacts.artifact_path(result["artifactId"], "generated_transform.py")).read_text(encoding="utf-8")
+    assert "transform_compiler.py" in generated
+
+    again, _ = server.run_codegen_pipeline(str(csv_path), MAPPING, ROWS)
+    assert again["reused"] and again["artifactId"] == result["artifactId"]
@@ -0,0 +1,98 @@
+# test/test_transform_runner.py
+
+import json
+from openpyxl import Workbook
+from app.file_to_json import convert_xlsx_to_json, open_xlsx_row_stream
+from concurrent.futures import ThreadPoolExecutor
+from app.transform_runner import run_transform_in_chunks, run_transform_parallel
+from app.output_writers import JsonArrayWriter
+
+MAPPING = [
+    {"columnIndex": 0, "columnName": "顧客コード", "matchedField": "distributorCode", "confidence": 0.9},
+    {"columnIndex": 1, "columnName": "顧客名", "matchedField": "CustomerName", "confidence": 0.95},
+    {"columnIndex": 2, "columnName": "アカウント番号", "matchedField": "AccountNumber", "confidence": 0.88},
+]
+
+def transform_skip_header(mapping, row_data):
+    """app/generated/generated_transform.py と同じく先頭行を読み飛ばす変換"""
+    idx = {m["matchedField"]: m["columnIndex"] for m in mapping if m["matchedField"]}
+    return [{f: str(row[i]) for f, i in idx.items()} for row in row_data[1:]]
+
+def transform_all_rows(mapping, row_data):
+    """ルートの generated_transform.py と同じく全行を変換する"""
+    idx = {m["matchedField"]: m["columnIndex"] for m in mapping if m["matchedField"]}
+    return [{f: str(row[i]) for f, i in idx.items()} for row in row_data]
+
+def create_xlsx(file_path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["顧客コード", "顧客名", "アカウント番号"])
+    for i in range(rows):
+        ws.append([f"D{i:04d}", f"株式会社{i}", f"AC{i}"])
+    wb.save(file_path)
+
+def collect_chunked(transform_func, rows, chunk_size):
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    out = []
+    total = run_transform_in_chunks(transform_func, MAPPING, chunks, out.extend)
+    assert total == len(out)
+    return out
+
+def test_chunked_matches_full_run():
+    """
+    チャンク分割しても、全行を一度に渡した場合と同じ結果になるか。
+    """
+    rows = [["顧客コード", "顧客名", "アカウント番号"]] + [[f"D{i}", f"N{i}", f"A{i}"] for i in range(23)]
+    for transform_func in (transform_skip_header, transform_all_rows):
+        expected = transform_func(MAPPING, rows)
+        for chunk_size in (1, 2, 5, 24, 100):
+            assert collect_chunked(transform_func, rows, chunk_size) == expected
+
+def test_parallel_matches_full_run():
+    """
+    並列版でも、全行を一度に渡した場合と同じ結果・同じ順番になるか。
+    """
+    rows = [["顧客コード", "顧客名", "アカウント番号"]] + [[f"D{i}", f"N{i}", f"A{i}"] for i in range(23)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for transform_func in (transform_skip_header, transform_all_rows):
+            expected = transform_func(MAPPING, rows)
+            submit = lambda mapping, chunk, f=transform_func: executor.submit(f, mapping, chunk)
+            for chunk_size in (1, 2, 5, 24, 100):
+                chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+                out = []
+                total = run_transform_parallel(submit, MAPPING, chunks, out.extend, max_in_flight=3)
+                assert out == expected
+                assert total == len(expected)
+
+def test_row_stream_matches_full_read(tmp_path):
+    """
+    open_xlsx_row_stream のチャンクを連結すると limit_rows=False の結果と一致するか。
+    """
+    file_path = str(tmp_path / "stream.xlsx")
+    create_xlsx(file_path, rows=250)
+
+    full = convert_xlsx_to_json(file_path, limit_rows=False)["rowData"]
+    stream = open_xlsx_row_stream(file_path, chunk_size=64)
+    assert stream["status"] == "success"
+    chunks = list(stream["rowChunks"])
+    assert max(len(c) for c in chunks) == 64
+    assert [row for c in chunks for row in c] == full
+
+    preview = convert_xlsx_to_json(file_path)
+    assert len(preview["rowData"]) == 100
+
+def test_row_stream_rejects_wrong_extension(tmp_path):
+    file_path = tmp_path / "wrong.txt"
+    file_path.write_text("dummy", encoding="utf-8")
+    result = open_xlsx_row_stream(str(file_path))
+    assert result["status"] == "error"
+    assert ".xlsx" in result["message"]
+
+def test_json_array_writer_matches_json_dump(tmp_path):
+    records = [{"distributorCode": f"D{i}", "CustomerName": "株式会社ABC"} for i in range(5)]
+    for batch in ([], records):
+        out_path = tmp_path / "out.json"
+        with JsonArrayWriter(str(out_path)) as writer:
+            writer.write_records(batch[:2])
+            writer.write_records(batch[2:])
+        assert out_path.read_text(encoding="utf-8") == json.dumps(batch, ensure_ascii=False, indent=2)
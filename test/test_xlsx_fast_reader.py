@@ -0,0 +1,138 @@
+# test/test_xlsx_fast_reader.py
+
+import os
+import zipfile
+import datetime
+from openpyxl import Workbook, load_workbook
+
+from app import file_to_json
+from app.xlsx_fast_reader import open_workbook
+
+def read_openpyxl(file_path):
+    wb = load_workbook(filename=file_path, read_only=True)
+    try:
+        return {name: list(wb[name].iter_rows(values_only=True)) for name in wb.sheetnames}
+    finally:
+        wb.close()
+
+def read_fast(file_path):
+    wb = open_workbook(file_path)
+    try:
+        return {name: list(wb[name].iter_rows(values_only=True)) for name in wb.sheetnames}
+    finally:
+        wb.close()
+
+def test_parity_with_openpyxl_values(tmp_path):
+    """
+    文字列・数値・日付・時間・真偽値・数式・空セル・欠けた行が openpyxl と同じ値になるか。
+    """
+    file_path = str(tmp_path / "values.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["顧客コード", "顧客名", "金額", "登録日", "時刻", "有効", "数式", "小数"])
+    for i in range(50):
+        ws.append([
+            f"D{i:04d}",
+            None if i % 5 == 0 else f" 株式会社{i} ",
+            i * 1000,
+            datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i),
+            datetime.time(9, i % 60),
+            i % 2 == 0,
+            f"=C{i + 2}*2",
+            i / 7
+        ])
+    ws["J60"] = "離れたセル"  # 欠けた行・列
+    ws["C70"] = datetime.date(2020, 2, 29)
+    ws["C70"].number_format = "yyyy/mm/dd"
+    ws["D71"] = 1.5
+    ws["D71"].number_format = "[h]:mm:ss"
+    wb.create_sheet("地域B").append(["a", 1, None, 2.5e10])
+    wb.save(file_path)
+
+    assert read_fast(file_path) == read_openpyxl(file_path)
+
+def write_raw_xlsx(file_path, sheet_xml, shared_strings_xml=None, date1904=False):
+    """
+    openpyxl では作れない形 (sharedStrings のリッチテキスト・ふりがな、inlineStr、dimension 無し) のxlsxを直接作る。
+    """
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel_ns = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    with zipfile.ZipFile(file_path, "w") as z:
+        z.writestr("[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '</Types>')
+        z.writestr("_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        z.writestr("xl/workbook.xml",
+            f'<?xml version="1.0" encoding="UTF-8"?><workbook {ns} {rel_ns}>'
+            f'<workbookPr date1904="{1 if date1904 else 0}"/>'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        z.writestr("xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="/xl/worksheets/sheet1.xml"/>'
+            '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+            '</Relationships>')
+        z.writestr("xl/worksheets/sheet1.xml", f'<?xml version="1.0" encoding="UTF-8"?><worksheet {ns}>{sheet_xml}</worksheet>')
+        if shared_strings_xml is not None:
+            z.writestr("xl/sharedStrings.xml", f'<?xml version="1.0" encoding="UTF-8"?><sst {ns}>{shared_strings_xml}</sst>')
+
+def test_parity_raw_shared_strings_and_inline(tmp_path):
+    file_path = str(tmp_path / "raw.xlsx")
+    shared = (
+        '<si><t>顧客名</t></si>'
+        '<si><r><t>株式会社</t></r><r><rPr><b/></rPr><t>テスト</t></r><rPh sb="0" eb="4"><t>カブシキガイシャ</t></rPh></si>'
+        '<si><t xml:space="preserve">  空白あり  </t></si>'
+        '<si><t>x005F_x000D_</t></si>'
+        '<si><t/></si>'
+    )
+    sheet = (
+        '<sheetData>'
+        '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>インライン</t></is></c></row>'
+        '<row r="3"><c r="A3" t="s"><v>1</v></c><c r="C3" t="s"><v>2</v></c></row>'
+        '<row r="4"><c t="s"><v>3</v></c><c t="s"><v>4</v></c><c t="b"><v>1</v></c><c t="e"><v>#N/A</v></c></row>'
+        '<row r="5"><c r="A5"><v>1E3</v></c><c r="B5" t="str"><v>文字列</v></c><c r="C5"><f>SUM(A5:A5)</f><v>1000</v></c></row>'
+        '</sheetData>'
+    )
+    write_raw_xlsx(file_path, sheet, shared)
+    fast = read_fast(file_path)
+    assert fast == read_openpyxl(file_path)
+    assert fast["Sheet1"][2][0] == "株式会社テスト"  # ふりがなは含めない
+
+def test_parity_with_truncating_dimension(tmp_path):
+    """
+    dimension が実データより小さい場合も openpyxl と同じく切り詰める。
+    """
+    file_path = str(tmp_path / "dim.xlsx")
+    sheet = (
+        '<dimension ref="A1:B2"/><sheetData>'
+        '<row r="1"><c r="A1"><v>1</v></c><c r="C1"><v>3</v></c></row>'
+        '<row r="4"><c r="A4"><v>4</v></c></row>'
+        '</sheetData>'
+    )
+    write_raw_xlsx(file_path, sheet, "")
+    assert read_fast(file_path) == read_openpyxl(file_path)
+
+def test_file_to_json_backend_switch(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "switch.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    for i in range(120):
+        ws.append([f"D{i}", i, datetime.datetime(2024, 5, 1)])
+    wb.save(file_path)
+
+    expected = file_to_json.convert_xlsx_to_json(file_path, limit_rows=False)
+    monkeypatch.setattr(file_to_json, "XLSX_READER_BACKEND", "fast")
+    assert file_to_json.convert_xlsx_to_json(file_path, limit_rows=False) == expected
+    stream = file_to_json.open_xlsx_row_stream(file_path, chunk_size=50)
+    assert [row for chunk in stream["rowChunks"] for row in chunk] == expected["rowData"]
+
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"not a zip")
+    assert file_to_json.convert_xlsx_to_json(str(broken))["status"] == "error"
@@ -0,0 +1,363 @@
+# tools/fake_openai_server.py
+#
+# OpenAI の chat completions API 互換のローカルサーバー (負荷試験・開発用)。
+# 本物のAPIを呼ばずに /api/analyze・/api/remap・/api/codegen を動かせる。
+#
+#   python tools/fake_openai_server.py --port 8001 --latency-ms 800 --jitter-ms 400 --rate-limit-rate 0.05
+#   LLM_BASE_URL=http://127.0.0.1:8001/v1 python app/server.py
+#
+# リクエストの内容 (システムプロンプトとユーザーメッセージのJSON) から呼び出しの種類を判定し、
+#   header   : ヘッダー判定      -> app/header_detector.py のローカル判定の結果
+#   mapping  : マッピング提案    -> 見出しの文字列をキーワードで顧客マスタの項目に対応付けた結果
+#   combined : ヘッダー判定+マッピング提案
+#   refine   : 再マッピング      -> 元のマッピングをそのまま返す
+#   code     : コード生成        -> mapping を実行時に読む transform_data (app/generated/generated_transform.py)
+# を返す。--canned で種類ごとの固定レスポンス (JSONファイル) に差し替えられる。
+# "stream": true のリクエストには、同じ内容を --stream-chunk-chars 文字ずつの SSE (chat.completion.chunk) で返す。
+#
+# 遅延・エラー率・429 の割合は起動オプションか、実行中に POST /_fake/config で変更できる。
+# GET /_fake/stats で種類ごと・ステータスごとの件数を返す。
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.header_detector import detect_header
+from app.code_generation import REQUIRED_FIELDS, OPTIONAL_FIELDS
+
+REFERENCE_TRANSFORM = os.path.join(ROOT, "app", "generated", "generated_transform.py")
+
+# 見出しに含まれていればその項目とみなすキーワード (上から順に、1項目につき1列だけ割り当てる)
+FIELD_KEYWORDS = [
+    ("PartsSalesPic", ["部品担当", "部品営業", "parts"]),
+    ("ServicePic", ["サービス担当", "service"]),
+    ("SalesPic", ["営業担当", "担当営業", "sales"]),
+    ("distributorCode", ["顧客コード", "得意先コード", "取引先コード", "ディストリビューター", "customer code", "distributor", "code"]),
+    ("CustomerName", ["顧客名", "得意先名", "取引先名", "会社名", "customer name", "company", "name"]),
+    ("AccountNumber", ["アカウント番号", "口座番号", "account"]),
+    ("Rank", ["ランク", "rank"]),
+    ("BillingAddress1", ["請求先住所", "住所", "address"]),
+]
+
+class FakeConfig:
+    def __init__(self, latency_ms=200.0, jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, canned=None, seed=None, stream_chunk_chars=40, stream_interval_ms=0.0):
+        self.latency_ms = latency_ms
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_interval_ms = stream_interval_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.canned = canned or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def update(self, values: dict) -> None:
+        with self.lock:
+            for key in ("latency_ms", "jitter_ms", "error_rate", "rate_limit_rate", "retry_after", "stream_interval_ms"):
+                if key in values:
+                    setattr(self, key, float(values[key]))
+            if "stream_chunk_chars" in values:
+                self.stream_chunk_chars = int(values["stream_chunk_chars"])
+
+    def to_dict(self) -> dict:
+        return {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "retry_after": self.retry_after,
+            "stream_chunk_chars": self.stream_chunk_chars,
+            "stream_interval_ms": self.stream_interval_ms,
+            "canned": sorted(self.canned)
+        }
+
+    def count(self, kind: str, status: int) -> None:
+        with self.lock:
+            by_status = self.stats.setdefault(kind, {})
+            by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    def draw(self):
+        """
+        1リクエスト分の遅延 (秒) と、返すエラー (None / 429 / 500) を決める。
+        """
+        with self.lock:
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, 500
+        return delay, None
+
+# --- 呼び出しの種類の判定とルールベースの応答 ---
+
+def _parse_user_json(content: str):
+    # call_header_detection は "Here is the JSON data:\n{...}" の形で送ってくる
+    start = content.find("{")
+    if start < 0:
+        return {}
+    try:
+        return json.loads(content[start:])
+    except ValueError:
+        return {}
+
+def classify(messages: list):
+    system_prompt = messages[0].get("content", "") if messages else ""
+    payload = _parse_user_json(messages[-1].get("content", "")) if messages else {}
+    if "originalMapping" in payload:
+        return "refine", payload
+    if "mapping" in payload and "rowData" in payload:
+        return "code", payload
+    if "headerRowIndex" in payload:
+        return "mapping", payload
+    if "maps the columns" in system_prompt:
+        return "combined", payload
+    if "generates Python code" in system_prompt:
+        return "code", payload
+    return "header", payload
+
+def rule_header(row_data: list) -> dict:
+    detection = dict(detect_header(row_data)["headerDetection"])
+    detection.pop("confidence", None)
+    return {"status": "success", "headerDetection": detection}
+
+def rule_mapping(row_data: list, header_index: int) -> dict:
+    header = row_data[header_index] if 0 <= header_index < len(row_data) else []
+    names = ["" if v is None else str(v).strip() for v in header]
+    assigned = {}
+    for field, keywords in FIELD_KEYWORDS:
+        for index, name in enumerate(names):
+            if index in assigned.values() or not name:
+                continue
+            if any(k in name.lower() for k in keywords):
+                assigned[field] = index
+                break
+    by_index = {index: field for field, index in assigned.items()}
+    width = max((len(row) for row in row_data), default=0)
+    mapping = [
+        {
+            "columnIndex": i,
+            "columnName": names[i] if i < len(names) and names[i] else None,
+            "matchedField": by_index.get(i),
+            "confidence": 0.9 if i in by_index else 0.0
+        }
+        for i in range(width)
+    ]
+    return {
+        "status": "success",
+        "mapping": mapping,
+        "missingRequiredFields": [f for f in REQUIRED_FIELDS if f not in assigned],
+        "additionalNotes": "fake server: keyword based mapping"
+    }
+
+def rule_refine(payload: dict) -> dict:
+    original = payload.get("originalMapping") or {}
+    mapping = original.get("mapping", []) if isinstance(original, dict) else original
+    mapped = {m.get("matchedField") for m in mapping}
+    return {
+        "status": "success",
+        "mapping": mapping,
+        "missingRequiredFields": [f for f in REQUIRED_FIELDS if f not in mapped],
+        "additionalNotes": f"fake server: instruction not applied ({payload.get('userInstruction', '')})"
+    }
+
+def rule_code() -> str:
+    with open(REFERENCE_TRANSFORM, "r", encoding="utf-8") as f:
+        return f.read()
+
+def build_content(kind: str, payload: dict, config: FakeConfig) -> str:
+    if kind in config.canned:
+        canned = config.canned[kind]
+        return canned if isinstance(canned, str) else json.dumps(canned, ensure_ascii=False)
+    row_data = payload.get("rowData", [])
+    if kind == "code":
+        return rule_code()
+    if kind == "refine":
+        result = rule_refine(payload)
+    elif kind == "mapping":
+        result = rule_mapping(row_data, payload.get("headerRowIndex", -1))
+    else:
+        header = rule_header(row_data)
+        result = header
+        if kind == "combined":
+            mapping = rule_mapping(row_data, header["headerDetection"]["headerRowIndex"])
+            result = {**header, **{k: v for k, v in mapping.items() if k != "status"}}
+    return json.dumps(result, ensure_ascii=False)
+
+def _usage(content: str, messages: list) -> dict:
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def completion_body(model: str, content: str, messages: list) -> dict:
+    return {
+        "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(content, messages)
+    }
+
+def completion_chunks(model: str, content: str, messages: list, chunk_chars: int, include_usage: bool):
+    """
+    ストリーミング応答の chat.completion.chunk を順に返す。
+    """
+    base = {"id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model}
+    yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    for start in range(0, len(content), max(1, chunk_chars)):
+        piece = content[start:start + max(1, chunk_chars)]
+        yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    if include_usage:
+        yield {**base, "choices": [], "usage": _usage(content, messages)}
+
+# --- HTTPサーバー ---
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive (アプリ側のクライアントは接続を使い回す)
+    config: FakeConfig = None
+    quiet = True
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        if self.path == "/_fake/stats":
+            with self.config.lock:
+                stats = json.loads(json.dumps(self.config.stats))
+            return self._send_json(200, {"stats": stats, "config": self.config.to_dict()})
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            return self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        return self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == "/_fake/config":
+            self.config.update(body)
+            return self._send_json(200, {"config": self.config.to_dict()})
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+
+        messages = body.get("messages") or []
+        kind, payload = classify(messages)
+        delay, error = self.config.draw()
+        time.sleep(delay)
+
+        if error == 429:
+            self.config.count(kind, 429)
+            return self._send_json(429, {
+                "error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}
+            }, {"Retry-After": str(self.config.retry_after)})
+        if error == 500:
+            self.config.count(kind, 500)
+            return self._send_json(500, {"error": {"message": "Internal error (fake)", "type": "server_error"}})
+
+        content = build_content(kind, payload, self.config)
+        self.config.count(kind, 200)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return self._send_stream(completion_chunks(
+                body.get("model", "fake"), content, messages, self.config.stream_chunk_chars, include_usage
+            ))
+        return self._send_json(200, completion_body(body.get("model", "fake"), content, messages))
+
+    def _send_stream(self, chunks) -> None:
+        # 長さが決まらないので Connection: close で送り、接続を閉じて終わりを知らせる
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.config.stream_interval_ms:
+                time.sleep(self.config.stream_interval_ms / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def make_server(host: str, port: int, config: FakeConfig, quiet: bool = True) -> ThreadingHTTPServer:
+    handler = type("Handler", (FakeOpenAIHandler,), {"config": config, "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI chat completions 互換のフェイクサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="応答までの平均遅延")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="遅延のばらつき (±)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500 を返す割合 (0〜1)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 を返す割合 (0〜1)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 の Retry-After (秒)")
+    parser.add_argument("--canned", help="種類ごとの固定レスポンス {\"header\": {...}, \"code\": \"...\"} のJSONファイル")
+    parser.add_argument("--seed", type=int, help="乱数のシード (エラーの出方を再現する場合)")
+    parser.add_argument("--stream-chunk-chars", type=int, default=40, help="ストリーミング応答の1チャンクの文字数")
+    parser.add_argument("--stream-interval-ms", type=float, default=0.0, help="ストリーミング応答のチャンク間の遅延")
+    parser.add_argument("--verbose", action="store_true", help="リクエストごとのログを出す")
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            canned = json.load(f)
+
+    config = FakeConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, canned=canned, seed=args.seed,
+        stream_chunk_chars=args.stream_chunk_chars, stream_interval_ms=args.stream_interval_ms
+    )
+    server = make_server(args.host, args.port, config, quiet=not args.verbose)
+    print(f"fake OpenAI server listening on http://{args.host}:{args.port}/v1", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
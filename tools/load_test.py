@@ -0,0 +1,243 @@
+# tools/load_test.py
+#
+# Flask API (/api/analyze, /api/remap, /api/codegen) の負荷試験。
+# エンドポイントごとに、指定した件数のリクエストを指定した並列数で投げ、
+# スループット (件/秒) とレイテンシ (p50 / p95 / p99) を表示・JSONで保存する。
+#
+# 本物の OpenAI API を使わないよう、フェイクサーバーと組み合わせて使う:
+#   python tools/fake_openai_server.py --port 8001 --latency-ms 800 --jitter-ms 300
+#   LLM_BASE_URL=http://127.0.0.1:8001/v1 LLM_CACHE_ENABLED=0 python app/server.py
+#   python tools/load_test.py --base-url http://127.0.0.1:8000 --requests 100 --concurrency 16 --fresh-files
+#
+# codegen は独自の変換ルールが無いマッピングだとLLMを呼ばない (app/transform_compiler.py)。
+# LLMでのコード生成を測る場合はサーバーを TRANSFORM_COMPILER_ENABLED=0 で起動する。
+#
+# サーバー側には LLMレスポンスのキャッシュ・生成コードのキャッシュ・成果物の再利用があるので、
+# 同じファイルに繰り返しリクエストすると2回目以降はほとんど LLM を呼ばない。
+# --fresh-files を付けると analyze / codegen のリクエストごとに内容の違うファイルを事前にアップロードして使う。
+
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+import datetime
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = ("analyze", "remap", "codegen")
+
+class ApiClient:
+    """
+    スレッドごとに1本の keep-alive 接続を使う小さなHTTPクライアント (標準ライブラリのみ)。
+    """
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def request(self, method: str, path: str, body=None, content_type: str = "application/json"):
+        """
+        (ステータスコード, レスポンスJSON) を返す。接続が切れていたら1回だけ張り直す。
+        """
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": content_type} if body is not None else {}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                raw = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        try:
+            return response.status, json.loads(raw or b"{}")
+        except ValueError:
+            return response.status, {"raw": raw[:200].decode("utf-8", "replace")}
+
+# --- テスト用ファイル ---
+
+def make_csv(rows: int, token: str) -> bytes:
+    """
+    顧客マスタ風のCSV。token を値に混ぜて、ファイルごとに内容 (= LLMキャッシュのキー) を変える。
+    """
+    lines = ["顧客コード,顧客名,アカウント番号,ランク,営業担当,住所"]
+    for i in range(rows):
+        lines.append(f"D{i:06d},株式会社{token}{i},{100000 + i},{'ABC'[i % 3]},担当{i % 50},東京都千代田区{i % 100}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def upload(client: ApiClient, data: bytes, name: str) -> str:
+    """
+    分割アップロードAPI (/api/upload/init → PUT → finalize) でアップロードし、保存されたファイル名を返す。
+    """
+    status, body = client.request("POST", "/api/upload/init", {"fileName": name, "totalSize": len(data)})
+    if status != 201:
+        raise RuntimeError(f"upload init failed: {status} {body}")
+    upload_id = body["uploadId"]
+    status, body = client.request(
+        "PUT", f"/api/upload/{upload_id}?offset=0", data, content_type="application/octet-stream"
+    )
+    if status != 200:
+        raise RuntimeError(f"upload failed: {status} {body}")
+    status, body = client.request("POST", f"/api/upload/{upload_id}/finalize", {})
+    if status != 200:
+        raise RuntimeError(f"upload finalize failed: {status} {body}")
+    return body["savedFileName"]
+
+# --- 集計 ---
+
+def percentile(sorted_values: list, p: float) -> float:
+    # nearest-rank 法
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def summarize(name: str, samples: list, elapsed: float) -> dict:
+    latencies = sorted(s["ms"] for s in samples)
+    statuses = {}
+    for s in samples:
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+    ok = sum(1 for s in samples if s["ok"])
+    return {
+        "endpoint": name,
+        "requests": len(samples),
+        "ok": ok,
+        "errors": len(samples) - ok,
+        "statusCodes": statuses,
+        "durationSeconds": round(elapsed, 3),
+        "throughputPerSecond": round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+        "latencyMs": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "max": round(latencies[-1], 1) if latencies else 0.0
+        }
+    }
+
+def run_phase(name: str, make_request, count: int, concurrency: int) -> dict:
+    """
+    make_request(i) -> (ステータスコード, レスポンス) を count 回、concurrency 並列で実行する。
+    """
+    samples = []
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            status, body = make_request(i)
+            ok = status == 200 and body.get("status") == "success"
+        except Exception as e:
+            status, ok = f"exception:{type(e).__name__}", False
+        ms = (time.perf_counter() - started) * 1000
+        with lock:
+            samples.append({"status": status, "ok": ok, "ms": ms})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(count)))
+    return summarize(name, samples, time.perf_counter() - started)
+
+def print_table(results: list) -> None:
+    print(f"{'endpoint':10s} {'reqs':>6s} {'err':>5s} {'req/s':>8s} {'p50ms':>9s} {'p95ms':>9s} {'p99ms':>9s}", file=sys.stderr)
+    for r in results:
+        lat = r["latencyMs"]
+        print(
+            f"{r['endpoint']:10s} {r['requests']:>6d} {r['errors']:>5d} {r['throughputPerSecond'] or 0:>8.2f} "
+            f"{lat['p50']:>9.1f} {lat['p95']:>9.1f} {lat['p99']:>9.1f}",
+            file=sys.stderr
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/analyze・/api/remap・/api/codegen の負荷試験")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"実行するエンドポイント ({', '.join(ENDPOINTS)})")
+    parser.add_argument("--requests", type=int, default=50, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=200, help="アップロードするCSVの行数")
+    parser.add_argument("--fresh-files", action="store_true", help="analyze / codegen でリクエストごとに別のファイルを使う")
+    parser.add_argument("--engine", default="llm", help="codegen のエンジン (llm / columnar)")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="結果JSONの保存先")
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"不明なエンドポイントです: {', '.join(sorted(unknown))}")
+
+    client = ApiClient(args.base_url, args.timeout)
+
+    # --- 準備 (時間は測らない): ファイルのアップロードと、remap / codegen 用のマッピング ---
+    file_count = args.requests if args.fresh_files else 1
+    print(f"uploading {file_count} file(s) ...", file=sys.stderr)
+    files = [upload(client, make_csv(args.rows, uuid.uuid4().hex[:8]), "loadtest.csv") for _ in range(file_count)]
+
+    status, analyzed = client.request("POST", "/api/analyze", {"fileName": files[0]})
+    if status != 200 or analyzed.get("status") != "success":
+        print(f"initial analyze failed: {status} {analyzed}", file=sys.stderr)
+        return 1
+    mapping_response = analyzed["mappingResponse"]
+    row_data = analyzed["rowData"]
+
+    requests = {
+        "analyze": lambda i: client.request("POST", "/api/analyze", {"fileName": files[i % len(files)]}),
+        "remap": lambda i: client.request("POST", "/api/remap", {
+            "originalMapping": mapping_response,
+            "userInstruction": f"顧客名の列を確認してください ({i})"
+        }),
+        "codegen": lambda i: client.request("POST", "/api/codegen", {
+            "fileName": files[i % len(files)],
+            "mapping": mapping_response.get("mapping", []),
+            "rowData": row_data,
+            "engine": args.engine
+        }),
+    }
+
+    results = []
+    for name in endpoints:
+        print(f"[{name}] {args.requests} requests, concurrency {args.concurrency}", file=sys.stderr)
+        results.append(run_phase(name, requests[name], args.requests, args.concurrency))
+
+    print_table(results)
+    report = {
+        "benchmark": "api_load",
+        "createdAt": datetime.datetime.now().isoformat(timespec="seconds"),
+        "baseUrl": args.base_url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "rows": args.rows,
+        "freshFiles": args.fresh_files,
+        "engine": args.engine,
+        "results": results
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if all(r["errors"] == 0 for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())